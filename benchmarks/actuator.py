@@ -0,0 +1,194 @@
+"""Benchmarks of the monitoring layer, run through Flask's test client so no server or Eureka is involved.
+
+Measures the per-request overhead of SolenoidFlaskApp.trace over a plain route, and the latency and memory
+allocated by /actuator/httptrace with a full buffer, /actuator/loggers with thousands of loggers, /actuator/env
+and the health endpoint. Results are written as JSON so runs can be compared across releases. Run it as a module
+from the repository root so solenoid is importable without installing it (or prefix with `poetry run`):
+
+    python -m benchmarks.actuator --output results-0.3.1.json
+    python -m benchmarks.actuator --compare results-0.3.1.json
+"""
+from datetime import datetime, timezone
+from typing import Callable, Dict
+import argparse
+import itertools
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import timeit
+import tracemalloc
+
+import yaml
+from flask import jsonify
+
+import solenoid
+from solenoid.app import SolenoidFlaskApp
+from solenoid.solenoids import log
+
+NUMBER = 200
+REPEAT = 5
+LOGGERS = 5000
+TRACE_CAPACITY = 100
+
+CONFIG = {
+    'instance': {
+        'instanceId': 'localhost:benchmark:7091',
+        'hostName': 'localhost',
+        'app': 'benchmark',
+        'ipAddr': '127.0.0.1',
+        'vipAddress': 'benchmark',
+        'secureVipAddress': 'benchmark',
+        'status': 'UP',
+        'port': {'$': 7091, '@enabled': True},
+        'securePort': {'$': 443, '@enabled': False},
+        'dataCenterInfo': {'@class': 'com.netflix.appinfo.InstanceInfo$DefaultDataCenterInfo', 'name': 'MyOwn'}
+    },
+    'eureka': {'host': 'localhost', 'port': 8761, 'ssl': False, 'servicePath': '/eureka/apps'},
+    'options': {'registerWithEureka': False}
+}
+
+
+def create_app(trace_capacity: int) -> SolenoidFlaskApp:
+    """The app under test, with the same handler behind a plain and a traced route
+    """
+    config = dict(CONFIG, options=dict(CONFIG['options'], traceCapacity=trace_capacity))
+    fd, path = tempfile.mkstemp(suffix='.yaml')
+    try:
+        with os.fdopen(fd, 'wt') as f:
+            yaml.safe_dump(config, f)
+        app = SolenoidFlaskApp(path)
+    finally:
+        os.remove(path)
+
+    def handler():
+        return jsonify({'bookings': [1, 2, 3, 4, 5]})
+
+    app.route('/plain', endpoint='plain')(handler)
+    app.trace('/traced', endpoint='traced')(handler)
+    return app
+
+
+def get(client, path: str, **kwargs) -> Callable:
+    def call():
+        res = client.get(path, **kwargs)
+        if res.status_code != 200:
+            raise RuntimeError(f'GET {path} answered {res.status_code}')
+    return call
+
+
+def measure(call: Callable, number: int, repeat: int) -> Dict:
+    """Times number calls repeat times (with the garbage collector off, as timeit does) and traces the memory
+    allocated by a single call. The call is made once beforehand so caches are warm.
+    """
+    call()
+    times = [t / number * 1e6 for t in timeit.Timer(call).repeat(repeat, number)]
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        call()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        'number': number,
+        'repeat': repeat,
+        'min_us': round(min(times), 2),
+        'median_us': round(statistics.median(times), 2),
+        'mean_us': round(statistics.mean(times), 2),
+        'stdev_us': round(statistics.stdev(times), 2) if len(times) > 1 else 0.0,
+        'peak_alloc_bytes': peak - before,
+        'retained_bytes': current - before
+    }
+
+
+def run(number: int = NUMBER, repeat: int = REPEAT, loggers: int = LOGGERS,
+        trace_capacity: int = TRACE_CAPACITY) -> Dict:
+    app = create_app(trace_capacity)
+    client = app.app.test_client()
+    results = {}
+
+    results['route'] = measure(get(client, '/plain'), number, repeat)
+    results['trace'] = measure(get(client, '/traced'), number, repeat)
+    results['trace_overhead_us'] = round(results['trace']['median_us'] - results['route']['median_us'], 2)
+
+    for _ in range(trace_capacity):
+        get(client, '/traced')()
+    results['httptrace'] = measure(get(client, '/actuator/httptrace'), number, repeat)
+    results['httptrace_gzip'] = measure(get(client, '/actuator/httptrace', headers={'Accept-Encoding': 'gzip'}),
+                                        number, repeat)
+
+    for i in range(loggers):
+        logging.getLogger(f'benchmark.loggers.{i}')
+    loggers_call = get(client, '/actuator/loggers')
+    results['loggers'] = measure(loggers_call, number, repeat)
+
+    levels = itertools.cycle(['DEBUG', 'INFO'])
+
+    def loggers_changed():
+        # a level change invalidates the cached body, so every call builds and serializes it again
+        log.set_logger_level('benchmark.loggers.0', next(levels))
+        loggers_call()
+
+    results['loggers_changed'] = measure(loggers_changed, max(1, number // 10), repeat)
+    results['env'] = measure(get(client, '/actuator/env'), number, repeat)
+    results['health'] = measure(get(client, app.config.get_health_check_path()), number, repeat)
+    app.solenoid.health.shutdown()
+
+    return {
+        'solenoid': solenoid.__version__,
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'parameters': {'number': number, 'repeat': repeat, 'loggers': loggers, 'trace_capacity': trace_capacity},
+        'results': results
+    }
+
+
+def report(run_results: Dict, baseline: Dict = None):
+    print(f'solenoid {run_results["solenoid"]} on {run_results["implementation"]} {run_results["python"]}')
+    print(f'{"benchmark":<18}{"median us":>12}{"min us":>12}{"peak bytes":>14}{"vs baseline":>14}')
+    for name, result in run_results['results'].items():
+        if not isinstance(result, dict):
+            continue
+        ratio = ''
+        previous = (baseline or {}).get('results', {}).get(name)
+        if isinstance(previous, dict) and previous.get('median_us'):
+            ratio = f'{result["median_us"] / previous["median_us"]:.2f}x'
+        print(f'{name:<18}{result["median_us"]:>12.1f}{result["min_us"]:>12.1f}'
+              f'{result["peak_alloc_bytes"]:>14}{ratio:>14}')
+    print(f'trace overhead: {run_results["results"]["trace_overhead_us"]:.1f}us per request')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks of the solenoid actuator endpoints and tracing')
+    parser.add_argument('--output', help='file the JSON results are written to, - for stdout')
+    parser.add_argument('--compare', help='JSON results of an earlier run to compare with')
+    parser.add_argument('--number', type=int, default=NUMBER, help='requests per timing')
+    parser.add_argument('--repeat', type=int, default=REPEAT, help='timings per benchmark')
+    parser.add_argument('--loggers', type=int, default=LOGGERS, help='loggers created for /actuator/loggers')
+    parser.add_argument('--trace-capacity', type=int, default=TRACE_CAPACITY, help='size of the trace buffer')
+    args = parser.parse_args(argv)
+
+    logging.getLogger().setLevel(logging.WARNING)
+    results = run(args.number, args.repeat, args.loggers, args.trace_capacity)
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'rt') as f:
+            baseline = json.load(f)
+    if args.output == '-':
+        json.dump(results, sys.stdout, indent=2)
+        print()
+        return
+    report(results, baseline)
+    if args.output:
+        with open(args.output, 'wt') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,208 @@
+from solenoid.config import ServiceConfig
+from solenoid.eureka import EurekaClientError, InstanceNotFoundError, retry_pause, attempt_timeout, should_retry, \
+    RETRIES, BACKOFF_FACTOR, POOL_MAXSIZE, CONNECT_TIMEOUT, DEFAULT_TIMEOUTS
+from solenoid.peers import EurekaPeer, PeerPool
+import asyncio
+import logging
+import time
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+class AsyncEurekaClient:
+    """asyncio version of EurekaClient backed by pooled aiohttp sessions, one per Eureka peer.
+
+    Retries and failover follow the same rules as EurekaClient (see should_retry and PeerPool), sleeping
+    with the same exponential backoff between attempts on the same peer. aiohttp's own retry of idempotent
+    requests after a disconnect is turned off in the sessions the client creates, so a request makes as many
+    attempts as with EurekaClient; a session passed in is used as it is and closing the client leaves it open.
+    """
+
+    def __init__(self, config: ServiceConfig, session=None):
+        if aiohttp is None:
+            raise ImportError('aiohttp is required for AsyncEurekaClient, install solenoid[async]')
+        self.config = config
+        self.retries = config.get_option('maxRetries', RETRIES)
+        self.backoff_factor = BACKOFF_FACTOR
+        self.pool_maxsize = config.get_option('poolMaxSize', POOL_MAXSIZE)
+        self.timeouts = dict(DEFAULT_TIMEOUTS)
+        self.timeouts.update(config.get_option('timeouts', {}) or {})
+        self.peers = PeerPool(config.get_eureka_server_urls(), cooldown=config.get_option('peerCooldownInSecs', 30))
+        self.session = session
+        self.log = logging.getLogger(__name__)
+
+    def _session(self, peer: EurekaPeer):
+        if self.session is not None:
+            return self.session
+        if peer.session is None or peer.session.closed:
+            peer.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_maxsize),
+                headers={'Accept': 'application/json'}
+            )
+            # aiohttp retries idempotent requests once when a pooled connection is dropped (3.9+, with no public
+            # option), on top of the retries made here
+            if hasattr(peer.session, '_retry_connection'):
+                peer.session._retry_connection = False
+        return peer.session
+
+    async def close(self):
+        """Closes the sessions the client created, not one it was given
+        """
+        for peer in self.peers.peers:
+            if peer.session is not None:
+                await peer.session.close()
+                peer.session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    def _timeout(self, operation: str, attempts: int, deadline: float):
+        read = min(attempt_timeout(self.timeouts[operation], attempts - 1), deadline - time.monotonic())
+        return aiohttp.ClientTimeout(total=read, connect=min(CONNECT_TIMEOUT, read))
+
+    async def _request(self, operation: str, method: str, path: str, write: bool = False, **kwargs):
+        """Makes a request returning (status, json body), the body is None unless the response was a 200
+        """
+        deadline = time.monotonic() + self.timeouts[operation]
+        plan = self.peers.plan(self.retries, write)
+        failover = len(self.peers) > 1
+        for attempt, peer in enumerate(plan, 1):
+            start = time.monotonic()
+            kwargs['timeout'] = self._timeout(operation, len(plan), deadline)
+            try:
+                async with self._session(peer).request(method, f'{peer.url}{path}', **kwargs) as res:
+                    if res.status < 500:
+                        self.peers.success(peer, time.monotonic() - start, write)
+                        return res.status, (await res.json(content_type=None) if res.status == 200 else None)
+                    self.peers.failure(peer)
+                    pause = retry_pause(plan, attempt, deadline, self.backoff_factor)
+                    if pause is None or not should_retry(method, failover, status=res.status):
+                        return res.status, None
+                    self.log.debug(f'Retrying {method} {path} after status {res.status} from {peer.url}')
+            except aiohttp.ClientConnectionError:
+                self.peers.failure(peer)
+                pause = retry_pause(plan, attempt, deadline, self.backoff_factor)
+                if pause is None:
+                    raise
+                self.log.debug(f'Retrying {method} {path} after connection error from {peer.url}')
+            except asyncio.TimeoutError:
+                self.peers.failure(peer)
+                pause = retry_pause(plan, attempt, deadline, self.backoff_factor)
+                if pause is None or not should_retry(method, failover, read_timeout=True):
+                    raise
+                self.log.debug(f'Retrying {method} {path} after timeout from {peer.url}')
+            await asyncio.sleep(pause)
+
+    async def register(self):
+        self.log.info(f'Registering {self.config.get_app()} with {self.config.get_app_url()}')
+        try:
+            status, _ = await self._request('register', 'POST', self.config.get_app_path(), write=True, json=self.config.get_service_metadata())
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            self.log.exception(f'Error registering with Eureka server {self.config.get_eureka_server_url()}')
+            raise
+        self.log.info(f'Response code for registration: {status}')
+        if status == 204:
+            self.log.info(f'successfully registered {self.config.get_app()}')
+            return True
+        self.log.error(f'Failed to register: {status}')
+        raise EurekaClientError(f'Failed to register: {status}')
+
+    async def deregister(self):
+        self.log.info(f'Deregistering {self.config.get_app()} with {self.config.get_instance_url()}')
+        try:
+            status, _ = await self._request('deregister', 'DELETE', self.config.get_instance_path(), write=True)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            self.log.exception(f'Error deregistering with Eureka server {self.config.get_eureka_server_url()}')
+            raise
+        self.log.info(f'Response code for deregistration: {status}')
+        if status == 200:
+            self.log.info(f'successfully deregistered {self.config.get_app()}')
+            return True
+        self.log.error(f'Failed to deregister: {status}')
+        raise EurekaClientError(f'Failed to deregister: {status}')
+
+    async def heartbeat(self):
+        self.log.info(f'Sending heartbeat for {self.config.get_app()} with {self.config.get_instance_url()}')
+        try:
+            status, _ = await self._request('heartbeat', 'PUT', self.config.get_instance_path(), write=True, params={'status': 'UP'})
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            self.log.exception(f'Error sending heartbeat to Eureka server {self.config.get_eureka_server_url()}')
+            raise
+        self.log.info(f'Response code for heartbeat: {status}')
+        if status == 200:
+            self.log.info(f'successful heartbeat for {self.config.get_instance_id()}')
+            return True
+        elif status == 404:
+            self.log.error(f'instance {self.config.get_instance_id()} does not exist')
+            raise InstanceNotFoundError(f'instance {self.config.get_instance_id()} does not exist')
+        self.log.error(f'Failed send heartbeat: {status}')
+        raise EurekaClientError(f'Failed to send heartbeat: {status}')
+
+    async def get_registry(self):
+        return await self._get('', 'registry', 'registry')
+
+    async def get_registry_delta(self):
+        return await self._get('/delta', 'registry delta', 'registry')
+
+    async def get_all_instances(self, app: str=None):
+        return await self._get(self.config.get_app_path(app),
+                               f'instances for {self.config.get_app() if app is None else app}')
+
+    async def get_app_instance(self, app: str=None, instance_id: str=None):
+        return await self._get(self.config.get_instance_path(app, instance_id),
+                               f'instance for {self.config.get_app() if app is None else app}:'
+                               f'{self.config.get_instance_id() if instance_id is None else instance_id}')
+
+    async def _get(self, path: str, description: str, operation: str = 'query'):
+        self.log.info(f'Retrieving {description} with {self.config.get_eureka_server_url()}{path}')
+        try:
+            status, body = await self._request(operation, 'GET', path)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            self.log.exception(f'Error retrieving {description} with Eureka server {self.config.get_eureka_server_url()}')
+            raise
+        if status == 200:
+            self.log.info(f'successfully retrieved {description}')
+            return body
+        self.log.error(f'Failed to retrieve {description}: {status}')
+        raise EurekaClientError(f'Failed to retrieve {description}: {status}')
+
+    async def out_of_service(self):
+        self.log.info(f'Taking instance out of service for {self.config.get_app()} with {self.config.get_instance_url()}')
+        return await self._status('PUT', params={'value': 'OUT_OF_SERVICE'}, description='take instance out of service')
+
+    async def back_in_service(self):
+        self.log.info(f'Putting instance back in service for {self.config.get_app()} with {self.config.get_instance_url()}')
+        return await self._status('DELETE', description='put instance back in service')
+
+    async def _status(self, method: str, description: str, params=None):
+        try:
+            status, _ = await self._request('status', method, self.config.get_status_path(), write=True, params=params)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            self.log.exception(f'Error trying to {description} with Eureka server {self.config.get_eureka_server_url()}')
+            raise
+        self.log.info(f'Response code for status request: {status}')
+        if status == 200:
+            self.log.info(f'successfully updated status of {self.config.get_instance_id()}')
+            return True
+        self.log.error(f'Failed to {description}: {status}')
+        raise EurekaClientError(f'Failed to {description}: {status}')
+
+    async def update_metadata(self, key, value):
+        self.log.info(f'Updating instance metadata {key}={value} for {self.config.get_app()} with {self.config.get_instance_url()}')
+        try:
+            status, _ = await self._request('metadata', 'PUT', self.config.get_metadata_update_path(), write=True, params={key: value})
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            self.log.exception(f'Error updating instance metadata with Eureka server {self.config.get_eureka_server_url()}')
+            raise
+        self.log.info(f'Response code for metadata update: {status}')
+        if status == 200:
+            self.log.info(f'successfully updated metadata for {self.config.get_instance_id()}')
+            return True
+        self.log.error(f'Failed to update metadata for service: {status}')
+        raise EurekaClientError(f'Failed to update metadata for service: {status}')
@@ -3,100 +3,190 @@ from .eureka import EurekaClient
 from flask import Flask
 from flask_cors import CORS
 from .solenoid import Solenoid
-import time
-import datetime
-from collections import deque
+from .traces import TraceBuffer, Tracer
+from .metrics import MetricsRegistry
+from .shared import SharedStore, SharedTraceBuffer, SharedMetricsRegistry, LeaderElection
+from .server import SolenoidServer
+from . import server, shared
+from .shutdown import InFlightRequests, ShutdownSequence
+from . import shutdown
+from typing import Callable
+from werkzeug.serving import make_server
 import logging
 import signal
-import sys
-
-
-class Trace:
-    def __init__(self, req, sess):
-        self.timestamp = datetime.datetime.now()
-        self.t1 = time.time()
-        self.t2 = self.t1
-        self.path = req.path
-        self.principal = req.remote_user
-        self.ipaddr = req.remote_addr
-        self.scheme = req.scheme
-        self.referrer = req.referrer
-        self.method = req.method
-        self.req_headers = {'Accept': req.content_type}
-        self.url = req.url
-        self.response = None
-        self.status = None
-        self.resp_headers = None
-        self.session_id = sess.sid if hasattr(sess, 'sid') else None
-
-    def _req_header(self, req):
-        if 'Authorization' in req.headers: self.req_headers['Authorization'] = req.headers['Authorization']
-
-    def complete(self, resp):
-        self.t2 = time.time()
-        self.status = resp.status_code
-        self.resp_headers = {k:v for k,v in resp.headers.items()}
-
-    def complete_exc(self):
-        self.t2 = time.time()
-        self.status = 500
-        self.resp_headers = {}
-
-    def render(self):
-        trace = {
-            'timestamp': self.timestamp.isoformat('T'),
-            'request': {
-                'method': self.method,
-                'uri': self.url,
-                'headers': self.req_headers
-            },
-            'response': {
-                'status': self.status,
-                'headers': self.resp_headers
-            },
-            'timeTaken': self.t2-self.t1
-        }
-        if self.principal is not None:
-            trace['principal'] = {'name': self.principal}
-        if self.session_id is not None:
-            trace['session'] = {'id': self.session_id}
-        return trace
+import threading
 
 
 class SolenoidFlaskApp:
 
     def __init__(self, config_file: str, cors=True, config_package: str=None):
         self.log = logging.getLogger(__name__)
-        self.traces = deque(maxlen=100)
         self.config = ServiceConfig()
         if config_package is not None:
             self.config.load_packaged_config(config_package, config_file)
         else:
             self.config.load_config(config_file)
+        shared_path = self.config.get_option('sharedStorePath', None)
+        self.shared = None
+        self.leader = None
+        if shared_path is not None:
+            self.shared = SharedStore(shared_path, self.config.get_option('sharedWorkers', shared.WORKERS),
+                                      self.config.get_option('traceCapacity', 100),
+                                      self.config.get_option('sharedTraceSlotSize', shared.TRACE_SLOT_SIZE))
+            self.traces = SharedTraceBuffer(self.shared, self.config.get_option('traceCapacity', 100),
+                                            self.config.get_option('traceMaxBytes', None))
+            self.metrics = SharedMetricsRegistry(self.shared)
+            self.leader = LeaderElection(f'{shared_path}.leader')
+        else:
+            self.traces = TraceBuffer(self.config.get_option('traceCapacity', 100),
+                                      self.config.get_option('traceMaxBytes', None))
+            self.metrics = MetricsRegistry()
         self.app = Flask(__name__)
         if cors: CORS(self.app)
         self.client = EurekaClient(self.config)
-        self.solenoid = Solenoid(self.config, self.app, self.traces)
+        self.tracer = Tracer(self.app, self.traces,
+                             sample_rate=self.config.get_option('traceSampleRate', 0.0),
+                             include=self.config.get_option('traceInclude', None),
+                             exclude=self.config.get_option('traceExclude', ['/actuator*']))
+        self.metrics.install(self.app)
+        self.solenoid = Solenoid(self.config, self.app, self.traces, self.metrics, self.client)
         self.heartbeat = None
-
-    def register_service(self):
-        self.client.register()
+        self.server = None
+        self._development_server = None
+        self.in_flight = InFlightRequests(self.app)
+        self._registering = False
+        self.shutdown_sequence = ShutdownSequence(
+            self.client, self.in_flight,
+            drain_timeout=self.config.get_option('shutdownDrainTimeoutInSecs', shutdown.DRAIN_TIMEOUT),
+            grace=self.config.get_option('shutdownGraceInSecs', shutdown.GRACE),
+            registered=self._leaves_eureka)
+        self.solenoid.shutdown_hook = self.shutdown
+
+    @property
+    def registered(self) -> bool:
+        return self.client.registered
+
+    def _leaves_eureka(self) -> bool:
+        """Whether shutting down this process takes the instance out of Eureka. Without a shared store that is
+        when it is registered. With one, the last worker to stop does it whichever worker registered, the others
+        leave the registration to the next leader. Each worker gives up its region before looking for others,
+        so when all of them stop at once at least the last one to look finds none.
+        """
+        if self.shared is None:
+            return self.client.registered
+        if not self._registering:
+            return False
+        self.shared.release()
+        workers = self.shared.live_workers()
+        if workers:
+            self.log.info(f'{workers} other workers still serving, leaving the instance registered')
+            return False
+        return True
+
+    def _as_leader(self, action):
+        """Runs action now, or with a shared store only in the worker elected leader, once it is elected
+        """
+        if self.leader is None:
+            action()
+        else:
+            self.leader.start(action)
+
+    def _register(self, register):
+        self._registering = True
+        if self.shared is not None:
+            # claimed now so idle workers count as serving when the leader shuts down
+            self.shared.claim()
+        self._as_leader(register)
+
+    def register_service(self, background: bool = None):
+        """Registers with Eureka. In background mode (option registerInBackground, always with a shared store)
+        registration is retried on the scheduler thread and the heartbeat starts once it succeeds, so the app
+        can start serving at once.
+        """
+        if not self.config.get_option('registerWithEureka', True):
+            self.log.info('registerWithEureka is false, not registering')
+            return
+        if background is None:
+            background = self.config.get_option('registerInBackground', False)
+        # a worker elected after a takeover may find Eureka down, it has to keep trying on its own
+        if background or self.leader is not None:
+            self._register(self.client.register_in_background)
+        else:
+            self._register(self.client.register)
 
     def start_heartbeat(self):
-        from threading import Timer
-
-        class Heartbeat(Timer):
-            def run(self):
-                while not self.finished.is_set():
-                    self.function(*self.args, **self.kwargs)
-                    self.finished.wait(self.interval)
-
-        self.heartbeat = Heartbeat(30.0, self.client.heartbeat)
-        self.heartbeat.setDaemon(True)
-        self.heartbeat.start()  # every 30 seconds, call heartbeat
-
-    def run(self):
-        self.app.run('0.0.0.0', self.config.get_port())
+        def start():
+            self.heartbeat = self.client.start_heartbeat()
+        self._as_leader(start)
+
+    def start_registry_cache(self):
+        self.client.start_registry_cache()
+
+    def create_server(self, host: str = '0.0.0.0', port: int = None) -> SolenoidServer:
+        """The production server for the app, configured from the server* options
+        """
+        return SolenoidServer(self.app, host, self.config.get_port() if port is None else port,
+                              threads=self.config.get_option('serverThreads', server.THREADS),
+                              max_threads=self.config.get_option('serverMaxThreads', None),
+                              backlog=self.config.get_option('serverBacklog', server.BACKLOG),
+                              timeout=self.config.get_option('serverTimeoutInSecs', server.TIMEOUT),
+                              keep_alive=self.config.get_option('serverKeepAlive', True),
+                              shutdown_timeout=self.config.get_option('serverShutdownTimeoutInSecs',
+                                                                      server.SHUTDOWN_TIMEOUT))
+
+    def run(self, production: bool = None):
+        """Serves the app until it is shut down. The production server is used when cheroot is installed unless
+        the server option is development, the Flask development server otherwise
+        """
+        if production is None:
+            production = server.wsgi is not None and self.config.get_option('server', 'production') != 'development'
+        self.install_signal_handlers()
+        if not production:
+            # werkzeug's own server rather than app.run, so it can be stopped from the shutdown sequence thread
+            self._development_server = make_server('0.0.0.0', self.config.get_port(), self.app, threaded=True)
+            try:
+                self._development_server.serve_forever()
+            finally:
+                self._development_server = None
+            return
+        self.server = self.create_server()
+        try:
+            self.server.serve_forever()
+        finally:
+            self.server = None
+
+    def _stop_server(self):
+        if self.server is not None:
+            self.server.stop()
+        elif self._development_server is not None:
+            self._development_server.shutdown()
+        else:
+            self.log.info('Not started by run, the server has to be stopped by whatever started it')
+
+    def shutdown(self, stop_server: Callable = None):
+        """Starts the graceful shutdown sequence (see ShutdownSequence) on its own thread and returns it.
+        stop_server defaults to stopping the server started by run.
+        """
+        stop_server = stop_server or self._stop_server
+        if self.leader is not None:
+            leader, stop = self.leader, stop_server
+            if not leader.is_leader:
+                # a worker on its way out must not be elected and register again
+                leader.release()
+
+            def stop_server():
+                # another worker can take over the heartbeat at once instead of when this process exits
+                leader.release()
+                stop()
+        return self.shutdown_sequence.start(stop_server)
+
+    def install_signal_handlers(self):
+        """Runs the shutdown sequence on SIGTERM, only possible from the main thread
+        """
+        if threading.current_thread() is not threading.main_thread():
+            self.log.warning('Not in the main thread, SIGTERM handler not installed')
+            return
+        signal.signal(signal.SIGTERM, lambda signum, frame: self.shutdown())
 
     def route(self, rule, **options):
         def decorator(f):
@@ -105,30 +195,22 @@ class SolenoidFlaskApp:
             return f
         return decorator
 
-    def trace(self, rule, **options):
+    def health_check(self, name: str, timeout: float = None, ttl: float = None):
+        """Registers a health check reported under name in the health endpoint, see HealthRegistry.register
+        """
         def decorator(f):
-            def wrapped_f(*args):
-                from flask import request, session
-
-                self.log.debug(f'Beginning HTTP trace for {request.path}')
-                t = Trace(request, session)
-                try:
-                    resp = f(*args)
-                except Exception:
-                    self.log.exception(f'Exception during HTTP trace for {request.path}')
-                    t.complete_exc()
-                    self.traces.append(t)
-                    raise
-                t.complete(resp)
-                self.traces.append(t)
-                self.log.debug(f'Finished HTTP trace for {request.path} -> status code:')
-                return resp
-
-            endpoint = options.pop('endpoint', None)
-            self.app.add_url_rule(rule, endpoint, wrapped_f, **options)
-
-            return wrapped_f
+            self.solenoid.health.register(name, f, timeout, ttl)
+            return f
 
         return decorator
 
+    def trace(self, rule, **options):
+        """Registers a route that is always traced, whatever the sampling rate
+        """
+        def decorator(f):
+            endpoint = options.pop('endpoint', None) or f.__name__
+            self.app.add_url_rule(rule, endpoint, f, **options)
+            self.tracer.always_trace(endpoint)
+            return f
 
+        return decorator
@@ -0,0 +1,170 @@
+from contextlib import contextmanager
+from itertools import count
+from threading import Lock
+from typing import Dict, List
+import logging
+import random
+
+from solenoid.eureka import EurekaClient
+from solenoid.model import InstanceInfo
+
+UP = 'UP'
+# the registry indexes a name is looked up in, in the order choose() tries them without a kind
+KINDS = ('app', 'vip', 'secure_vip')
+
+
+class NoInstanceAvailableError(Exception):
+    pass
+
+
+def instance_weight(instance: InstanceInfo) -> float:
+    try:
+        return max(float((instance.metadata or {}).get('weight', 1)), 0.0)
+    except (TypeError, ValueError):
+        return 1.0
+
+
+class RoundRobin:
+    """Cycles through the instances, next() on itertools.count is atomic so no lock is needed
+    """
+    def __init__(self, urls: List[str], weights: List[float]):
+        self.urls = urls
+        self._counter = count()
+
+    def choose(self, outstanding: Dict[str, int]) -> str:
+        return self.urls[next(self._counter) % len(self.urls)]
+
+
+class WeightedRandom:
+    """Weighted random selection using Vose's alias method, O(1) per choice after an O(n) build
+    """
+    def __init__(self, urls: List[str], weights: List[float]):
+        self.urls = urls
+        n = len(urls)
+        total = sum(weights)
+        if total <= 0:
+            weights, total = [1.0] * n, float(n)
+        scaled = [w * n / total for w in weights]
+        self._prob = [1.0] * n
+        self._alias = list(range(n))
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            s, l = small.pop(), large.pop()
+            self._prob[s] = scaled[s]
+            self._alias[s] = l
+            scaled[l] = scaled[l] + scaled[s] - 1.0
+            (small if scaled[l] < 1.0 else large).append(l)
+
+    def choose(self, outstanding: Dict[str, int]) -> str:
+        i = random.randrange(len(self.urls))
+        return self.urls[i if random.random() < self._prob[i] else self._alias[i]]
+
+
+class LeastOutstanding:
+    """Power of two choices: picks two instances at random and takes the one with fewer requests in flight
+    """
+    def __init__(self, urls: List[str], weights: List[float]):
+        self.urls = urls
+
+    def choose(self, outstanding: Dict[str, int]) -> str:
+        if len(self.urls) == 1:
+            return self.urls[0]
+        a, b = random.sample(self.urls, 2)
+        return a if outstanding.get(a, 0) <= outstanding.get(b, 0) else b
+
+
+STRATEGIES = {
+    'round_robin': RoundRobin,
+    'weighted_random': WeightedRandom,
+    'least_outstanding': LeastOutstanding
+}
+
+
+class InstanceChooser:
+    """Chooses an UP instance of an application or VIP address from the client's registry cache.
+
+    The registry cache is started with the chooser, if it can't be fetched yet choose() raises
+    NoInstanceAvailableError until its background refresh succeeds. Candidate lists are rebuilt only when
+    the registry cache changes, so choose() is O(1) and only takes a lock on the first call after a refresh.
+    """
+
+    def __init__(self, client: EurekaClient, strategy: str = 'round_robin', secure: bool = False):
+        if strategy not in STRATEGIES:
+            raise ValueError(f'Unknown load balancing strategy: {strategy}')
+        self.client = client
+        self.strategy = STRATEGIES[strategy]
+        self.secure = secure
+        self.log = logging.getLogger(__name__)
+        self.outstanding = {}
+        self._groups = {kind: {} for kind in KINDS}
+        self._version = None
+        self._lock = Lock()
+        self._outstanding_lock = Lock()
+        if client.registry is None:
+            try:
+                client.start_registry_cache()
+            except Exception as exc:
+                self.log.warning(f'Registry not available yet, refreshing it in the background: {str(exc)}')
+
+    def _rebuild(self, registry):
+        with self._lock:
+            if self._version == registry.version:
+                return
+            version = registry.version
+            apps = registry.applications
+            groups = {}
+            for kind, index in zip(KINDS, (apps.by_app, apps.by_vip, apps.by_secure_vip)):
+                groups[kind] = {}
+                for name, instances in index.items():
+                    up = [i for i in instances if i.status == UP]
+                    if up:
+                        groups[kind][name] = self.strategy([i.url(self.secure) for i in up],
+                                                           [instance_weight(i) for i in up])
+            self._groups = groups
+            self._version = version
+            self.log.debug(f'Rebuilt instance chooser with {len(groups["app"])} applications and '
+                           f'{len(groups["vip"]) + len(groups["secure_vip"])} VIP addresses')
+
+    def choose(self, name: str, kind: str = None) -> str:
+        """Chooses an instance of the application, VIP address or secure VIP address name, kind (one of app, vip
+        or secure_vip) says which one when an application and a VIP address share a name
+        """
+        if kind is not None and kind not in KINDS:
+            raise ValueError(f'Unknown kind {kind}, expected one of {", ".join(KINDS)}')
+        registry = self.client.registry
+        if registry is None or not registry.ready:
+            raise NoInstanceAvailableError(f'No registry available to choose an instance of {name}')
+        if self._version != registry.version:
+            self._rebuild(registry)
+        key = name.upper()
+        for group_kind in (KINDS if kind is None else (kind,)):
+            group = self._groups[group_kind].get(key)
+            if group is not None:
+                return group.choose(self.outstanding)
+        raise NoInstanceAvailableError(f'No UP instances available for {name}')
+
+    def acquire(self, name: str, kind: str = None) -> str:
+        url = self.choose(name, kind)
+        with self._outstanding_lock:
+            self.outstanding[url] = self.outstanding.get(url, 0) + 1
+        return url
+
+    def release(self, url: str):
+        with self._outstanding_lock:
+            count = self.outstanding.get(url, 0) - 1
+            # idle instances are dropped, so instances that left the registry don't accumulate
+            if count > 0:
+                self.outstanding[url] = count
+            else:
+                self.outstanding.pop(url, None)
+
+    @contextmanager
+    def instance(self, name: str, kind: str = None):
+        """Yields an instance URL, counting it as an outstanding request until the block exits
+        """
+        url = self.acquire(name, kind)
+        try:
+            yield url
+        finally:
+            self.release(url)
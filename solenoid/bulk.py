@@ -0,0 +1,208 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from threading import Lock
+from typing import Callable, Iterable, List, Sequence, Union
+import logging
+
+from solenoid.config import ClientOptions, DiscoveryServer, ServiceConfig, ServiceMetadata
+from solenoid.eureka import EurekaClient, EurekaClientError, requests_retry_session, POOL_MAXSIZE
+from solenoid.peers import PeerPool
+from solenoid.scheduler import Scheduler, default_scheduler, JITTER, EXP_BACKOFF_BOUND
+
+MAX_WORKERS = 16
+
+
+class BulkResult:
+    """Outcome of an operation on many instances, keyed by instance id
+    """
+
+    def __init__(self, operation: str):
+        self.operation = operation
+        self.results = {}
+        self.errors = {}
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+    @property
+    def succeeded(self) -> List[str]:
+        return list(self.results)
+
+    @property
+    def failed(self) -> List[str]:
+        return list(self.errors)
+
+    def raise_for_errors(self):
+        if self.errors:
+            raise EurekaClientError(f'{self.operation} failed for {len(self.errors)} instances: '
+                                    f'{", ".join(sorted(self.errors))}')
+
+    def __repr__(self):
+        return f'BulkResult({self.operation}, succeeded={len(self.results)}, failed={len(self.errors)})'
+
+
+class BulkEurekaClient:
+    """Registers, heartbeats and deregisters many instances at once, e.g. from a sidecar registering services
+    that can't do it themselves.
+
+    Each instance gets an EurekaClient, all of them sharing one PeerPool and so one set of connection pools,
+    and operations run for all instances concurrently on a pool of max_workers threads. Every operation
+    returns a BulkResult with the result or the exception of each instance rather than stopping at the
+    first failure. Scheduled heartbeats run on a pool of their own, so they aren't queued behind a bulk
+    operation and don't hold up the scheduler thread.
+    """
+
+    def __init__(self, discoveryServer: Union[DiscoveryServer, Sequence[DiscoveryServer]],
+                 instances: Iterable[ServiceMetadata] = (), options: ClientOptions = None,
+                 max_workers: int = MAX_WORKERS):
+        self.log = logging.getLogger(__name__)
+        self.discoveryServer = discoveryServer
+        self.options = options
+        self.max_workers = max_workers
+        self.clients = {}
+        self.peers = None
+        self.heartbeat_task = None
+        # the outcome of the last scheduled heartbeat round that completed
+        self.last_heartbeat = None
+        self._heartbeat_pending = 0
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix='solenoid-bulk')
+        self._heartbeat_executor = ThreadPoolExecutor(max_workers, thread_name_prefix='solenoid-bulk-heartbeat')
+        self._lock = Lock()
+        for metadata in instances:
+            self.add(metadata)
+
+    def _session(self, config: ServiceConfig):
+        # every worker thread may hold a connection to the same peer
+        pool_maxsize = max(config.get_option('poolMaxSize', POOL_MAXSIZE), self.max_workers)
+        session = requests_retry_session(0, status_forcelist=(), pool_maxsize=pool_maxsize)
+        session.headers.update({'Accept': 'application/json'})
+        return session
+
+    def add(self, metadata: ServiceMetadata) -> EurekaClient:
+        """Adds an instance, it isn't registered until register is called
+        """
+        config = ServiceConfig(metadata, self.discoveryServer, self.options)
+        with self._lock:
+            if self.peers is None:
+                self.peers = PeerPool(config.get_eureka_server_urls(), lambda: self._session(config),
+                                      cooldown=config.get_option('peerCooldownInSecs', 30))
+            client = EurekaClient(config, self.peers)
+            self.clients[config.get_instance_id()] = client
+        return client
+
+    def remove(self, instance_id: str) -> EurekaClient:
+        """Stops managing an instance without deregistering it
+        """
+        with self._lock:
+            return self.clients.pop(instance_id, None)
+
+    def _run(self, operation: str, call: Callable[[EurekaClient], object], instance_ids: Iterable[str] = None) -> BulkResult:
+        result = BulkResult(operation)
+        with self._lock:
+            if instance_ids is None:
+                clients = dict(self.clients)
+            else:
+                clients = {}
+                for instance_id in instance_ids:
+                    if instance_id in self.clients:
+                        clients[instance_id] = self.clients[instance_id]
+                    else:
+                        result.errors[instance_id] = KeyError(f'Unknown instance {instance_id}')
+        futures = {instance_id: self._executor.submit(call, client) for instance_id, client in clients.items()}
+        for instance_id, future in futures.items():
+            try:
+                result.results[instance_id] = future.result()
+            except Exception as exc:
+                result.errors[instance_id] = exc
+        if result.errors:
+            self.log.warning(f'{operation} failed for {len(result.errors)} of {len(futures)} instances')
+        return result
+
+    def register(self, instance_ids: Iterable[str] = None) -> BulkResult:
+        return self._run('register', EurekaClient.register, instance_ids)
+
+    def deregister(self, instance_ids: Iterable[str] = None) -> BulkResult:
+        return self._run('deregister', EurekaClient.deregister, instance_ids)
+
+    def heartbeat(self, instance_ids: Iterable[str] = None) -> BulkResult:
+        """Renews the leases, instances Eureka no longer knows about are registered again
+        """
+        return self._run('heartbeat', EurekaClient.renew, instance_ids)
+
+    def out_of_service(self, instance_ids: Iterable[str] = None) -> BulkResult:
+        return self._run('out_of_service', EurekaClient.out_of_service, instance_ids)
+
+    def back_in_service(self, instance_ids: Iterable[str] = None) -> BulkResult:
+        return self._run('back_in_service', EurekaClient.back_in_service, instance_ids)
+
+    def update_metadata(self, key: str, value: str, instance_ids: Iterable[str] = None) -> BulkResult:
+        return self._run('update_metadata', lambda client: client.update_metadata(key, value), instance_ids)
+
+    def _heartbeat_all(self):
+        """Starts a heartbeat round on the heartbeat pool and returns at once. Raises, so the scheduler backs off,
+        while the previous round is still running or when it got through for no instance at all, most likely
+        because Eureka itself is unavailable.
+        """
+        with self._lock:
+            if self._heartbeat_pending:
+                raise EurekaClientError(f'Previous heartbeat round still has {self._heartbeat_pending} instances pending')
+            clients = dict(self.clients)
+            self._heartbeat_pending = len(clients)
+        previous = self.last_heartbeat
+        result = BulkResult('heartbeat')
+        if not clients:
+            self.last_heartbeat = result
+        for instance_id, client in clients.items():
+            future = self._heartbeat_executor.submit(client.renew)
+            future.add_done_callback(partial(self._heartbeat_done, result, instance_id))
+        if previous is not None and previous.errors and not previous.results:
+            previous.raise_for_errors()
+
+    def _heartbeat_done(self, result: BulkResult, instance_id: str, future: Future):
+        try:
+            value = future.result()
+        except Exception as exc:
+            value, error = None, exc
+        else:
+            error = None
+        with self._lock:
+            if error is None:
+                result.results[instance_id] = value
+            else:
+                result.errors[instance_id] = error
+            self._heartbeat_pending -= 1
+            completed = self._heartbeat_pending == 0
+        if completed:
+            self.last_heartbeat = result
+            if result.errors:
+                self.log.warning(f'heartbeat failed for {len(result.errors)} of '
+                                 f'{len(result.errors) + len(result.results)} instances')
+
+    def start_heartbeat(self, scheduler: Scheduler = None):
+        """Renews every lease from a single scheduled task, at the shortest heartbeat interval of the instances
+        """
+        if self.heartbeat_task is None:
+            with self._lock:
+                configs = [client.config for client in self.clients.values()]
+            interval = min((config.get_heartbeat_interval() for config in configs), default=30)
+            options = configs[0] if configs else None
+            self.heartbeat_task = (scheduler if scheduler is not None else default_scheduler()).schedule(
+                self._heartbeat_all, interval, name='bulk-heartbeat',
+                jitter=options.get_option('jitter', JITTER) if options else JITTER,
+                exp_backoff_bound=options.get_option('expBackOffBound', EXP_BACKOFF_BOUND) if options else EXP_BACKOFF_BOUND
+            )
+        return self.heartbeat_task
+
+    def stop_heartbeat(self):
+        if self.heartbeat_task is not None:
+            self.heartbeat_task.cancel()
+            self.heartbeat_task = None
+
+    def close(self):
+        self.stop_heartbeat()
+        self._heartbeat_executor.shutdown(wait=True)
+        self._executor.shutdown(wait=True)
+        if self.peers is not None:
+            for peer in self.peers.peers:
+                peer.session.close()
@@ -1,12 +1,12 @@
 import json, os.path, yaml
 import logging
-from typing import Dict
+from typing import Dict, List, Sequence, Union
 import pkg_resources
 
 def _url_or_path(url):
     if url is None:
         return None
-    elif url.startsWith('http'):
+    elif url.startswith('http'):
         return url[url.index('/', 8):]
     return url
 
@@ -15,6 +15,9 @@ class ConfigError(Exception):
     pass
 
 
+_MISSING = object()
+
+
 class DataCenterInfo:
     def __init__(self, cls, name):
         self.cls = cls
@@ -57,11 +60,11 @@ class ServiceMetadata:
         self.port = port
         self.securePort = securePort
         self.healthCheckUrl = healthCheckUrl
-        self.healthCheckPath = healthCheckPath is not None if healthCheckPath else _url_or_path(healthCheckUrl)
+        self.healthCheckPath = healthCheckPath if healthCheckPath is not None else _url_or_path(healthCheckUrl)
         self.statusPageUrl = statusPageUrl
-        self.statusPagePath = statusPagePath is not None if statusPageUrl else _url_or_path(statusPageUrl)
+        self.statusPagePath = statusPagePath if statusPagePath is not None else _url_or_path(statusPageUrl)
         self.homePageUrl = homePageUrl
-        self.homePagePath = homePagePath is not None if homePagePath else _url_or_path(homePageUrl)
+        self.homePagePath = homePagePath if homePagePath is not None else _url_or_path(homePageUrl)
         self.dataCenterInfo = dataCenterInfo
 
     def render(self):
@@ -78,7 +81,7 @@ class ServiceMetadata:
                 'securePort': self.securePort.render(),
                 'statusPageUrl': self.statusPageUrl,
                 'healthCheckUrl': self.healthCheckUrl,
-                'homePageUrl': self.healthCheckUrl,
+                'homePageUrl': self.homePageUrl,
                 'dataCenterInfo': self.dataCenterInfo.render()
             }
         }
@@ -99,7 +102,7 @@ class DiscoveryServer:
 class ClientOptions:
 
     def __init__(self, requestImpl: str, maxRetries: int = 3,
-                 heartBeatIntervalInSecs: int = 30000, registryFetchIntervalInSecs: int = 30000,
+                 heartBeatIntervalInSecs: int = 30, registryFetchIntervalInSecs: int = 30,
                  registerWithEureka: bool = True):
         self.requestImpl = requestImpl
         self.maxRetries = maxRetries
@@ -108,10 +111,149 @@ class ClientOptions:
         self.registerWithEureka = registerWithEureka
 
 
+DEFAULT_OPTIONS = {
+    'requestImpl': 'requests',
+    'maxRetries': 3,
+    'heartBeatIntervalInSecs': 30,
+    'registryFetchIntervalInSecs': 30,
+    'registerWithEureka': True
+}
+
+DEFAULT_HOME_PAGE_PATH = '/'
+DEFAULT_HEALTH_CHECK_PATH = '/health'
+DEFAULT_STATUS_PAGE_PATH = '/info'
+
+
+class ResolvedConfig:
+    """Immutable view of a loaded configuration with every value and URL the client needs computed once.
+
+    Built by ServiceConfig when a configuration is loaded so missing or malformed keys are reported at
+    startup, the getters on ServiceConfig then return attributes of this object.
+    """
+    __slots__ = ('app', 'instanceId', 'hostName', 'port', 'serviceMetadata', 'serviceMetadataJson',
+                 'eurekaServerUrls', 'eurekaServerUrl', 'appPath', 'instancePath', 'statusPath', 'metadataUpdatePath',
+                 'registryUrl', 'deltaUrl', 'appUrl', 'instanceUrl', 'statusUrl',
+                 'metadataUpdateUrl', 'hostUrl', 'homePagePath', 'healthCheckPath', 'statusPagePath',
+                 'renewalIntervalInSecs', 'options')
+
+    def __init__(self, app: str, instanceId: str, hostName: str, port: int, serviceMetadata: Dict,
+                 eurekaServerUrls: Sequence[str], homePagePath: str, healthCheckPath: str, statusPagePath: str,
+                 options: Dict, renewalIntervalInSecs: float = None):
+        eurekaServerUrl = eurekaServerUrls[0]
+        values = {
+            'app': app,
+            'instanceId': instanceId,
+            'hostName': hostName,
+            'port': port,
+            'serviceMetadata': serviceMetadata,
+            'serviceMetadataJson': json.dumps(serviceMetadata),
+            'eurekaServerUrls': tuple(eurekaServerUrls),
+            'eurekaServerUrl': eurekaServerUrl,
+            'appPath': f'/{app}',
+            'instancePath': f'/{app}/{instanceId}',
+            'statusPath': f'/{app}/{instanceId}/status',
+            'metadataUpdatePath': f'/{app}/{instanceId}/metadata',
+            'registryUrl': eurekaServerUrl,
+            'deltaUrl': f'{eurekaServerUrl}/delta',
+            'appUrl': f'{eurekaServerUrl}/{app}',
+            'instanceUrl': f'{eurekaServerUrl}/{app}/{instanceId}',
+            'statusUrl': f'{eurekaServerUrl}/{app}/{instanceId}/status',
+            'metadataUpdateUrl': f'{eurekaServerUrl}/{app}/{instanceId}/metadata',
+            'hostUrl': f'http://{hostName}:{port}',
+            'homePagePath': homePagePath,
+            'healthCheckPath': healthCheckPath,
+            'statusPagePath': statusPagePath,
+            'renewalIntervalInSecs': float(renewalIntervalInSecs or options['heartBeatIntervalInSecs']),
+            'options': dict(options)
+        }
+        for k, v in values.items():
+            object.__setattr__(self, k, v)
+
+    def __setattr__(self, key, value):
+        raise AttributeError('ResolvedConfig is immutable')
+
+    def __delattr__(self, key):
+        raise AttributeError('ResolvedConfig is immutable')
+
+
+def _required(block: Dict, key: str, where: str):
+    try:
+        value = block[key]
+    except (KeyError, TypeError):
+        raise ConfigError(f'could not find {key} in {where} configuration')
+    if value is None:
+        raise ConfigError(f'{key} in {where} configuration must not be empty')
+    return value
+
+
+def _server_url(ssl: bool, host: str, port: int, servicePath: str) -> str:
+    proto = 'https' if ssl else 'http'
+    return f'{proto}://{host}:{port}{servicePath.rstrip("/")}'
+
+
+def _server_urls(eureka: Union[Dict, List[Dict]]) -> List[str]:
+    servers = eureka if isinstance(eureka, list) else [eureka]
+    if not servers:
+        raise ConfigError('at least one Eureka server must be configured')
+    return [_server_url(_required(server, 'ssl', 'eureka'), _required(server, 'host', 'eureka'),
+                        _required(server, 'port', 'eureka'), _required(server, 'servicePath', 'eureka'))
+            for server in servers]
+
+
+def _resolve_file(fileConfig: Dict) -> ResolvedConfig:
+    if not isinstance(fileConfig, dict):
+        raise ConfigError('configuration must be a mapping')
+    instance = _required(fileConfig, 'instance', 'top level')
+    eureka = _required(fileConfig, 'eureka', 'top level')
+    port = _required(instance, 'port', 'instance')
+    port = _required(port, '$', 'instance.port') if isinstance(port, dict) else port
+    options = dict(DEFAULT_OPTIONS)
+    options.update(fileConfig.get('options') or {})
+    return ResolvedConfig(
+        app=_required(instance, 'app', 'instance'),
+        instanceId=_required(instance, 'instanceId', 'instance'),
+        hostName=_required(instance, 'hostName', 'instance'),
+        port=int(port),
+        serviceMetadata={'instance': instance},
+        eurekaServerUrls=_server_urls(eureka),
+        homePagePath=instance.get('homePagePath') or _url_or_path(instance.get('homePageUrl')) or DEFAULT_HOME_PAGE_PATH,
+        healthCheckPath=instance.get('healthCheckPath') or _url_or_path(instance.get('healthCheckUrl'))
+                        or DEFAULT_HEALTH_CHECK_PATH,
+        statusPagePath=instance.get('statusPagePath') or _url_or_path(instance.get('statusPageUrl'))
+                       or DEFAULT_STATUS_PAGE_PATH,
+        options=options,
+        renewalIntervalInSecs=(instance.get('leaseInfo') or {}).get('renewalIntervalInSecs')
+    )
+
+
+def _resolve_objects(serviceMetadata: ServiceMetadata,
+                     discoveryServer: Union[DiscoveryServer, Sequence[DiscoveryServer]],
+                     clientOptions: ClientOptions) -> ResolvedConfig:
+    servers = discoveryServer if isinstance(discoveryServer, (list, tuple)) else [discoveryServer]
+    if not servers:
+        raise ConfigError('at least one Eureka server must be configured')
+    options = dict(DEFAULT_OPTIONS)
+    if clientOptions is not None:
+        options.update(vars(clientOptions))
+    return ResolvedConfig(
+        app=serviceMetadata.app,
+        instanceId=serviceMetadata.instanceId,
+        hostName=serviceMetadata.hostName,
+        port=serviceMetadata.port.port,
+        serviceMetadata=serviceMetadata.render(),
+        eurekaServerUrls=[_server_url(server.ssl, server.hostName, server.port, server.servicePath)
+                          for server in servers],
+        homePagePath=serviceMetadata.homePagePath or DEFAULT_HOME_PAGE_PATH,
+        healthCheckPath=serviceMetadata.healthCheckPath or DEFAULT_HEALTH_CHECK_PATH,
+        statusPagePath=serviceMetadata.statusPagePath or DEFAULT_STATUS_PAGE_PATH,
+        options=options
+    )
+
+
 class ServiceConfig:
 
     def __init__(self, serviceMetadata: ServiceMetadata = None,
-                 discoveryServer: DiscoveryServer = None,
+                 discoveryServer: Union[DiscoveryServer, Sequence[DiscoveryServer]] = None,
                  options: ClientOptions = None):
         self.log = logging.getLogger(__name__)
         self.serviceMetadata = serviceMetadata
@@ -119,6 +261,16 @@ class ServiceConfig:
         self.clientOptions = options
         self.fileConfig = None
         self.configfile = None
+        self.resolved = None
+        if serviceMetadata is not None and discoveryServer is not None:
+            self.resolved = _resolve_objects(serviceMetadata, discoveryServer, options)
+
+    def _resolve(self, source):
+        try:
+            self.resolved = _resolve_file(self.fileConfig)
+        except ConfigError as exc:
+            self.log.error(f'Invalid Eureka configuration {source}: {str(exc)}')
+            raise
 
     def load_packaged_config(self, package, config_file):
         try:
@@ -131,6 +283,7 @@ class ServiceConfig:
             self.log.exception(f'Error loading Eureka configuration file: {package}.{config_file} -> {str(exc)}')
             raise
         self.log.debug(self.fileConfig)
+        self._resolve(f'{package}.{config_file}')
 
     def load_config(self, config_file):
         self.configfile = config_file
@@ -139,139 +292,108 @@ class ServiceConfig:
             with open(config_file, 'rt') as f:
                 try:
                     self.fileConfig = yaml.safe_load(f.read())
-                except yaml.YAMLError as exc:
+                except yaml.YAMLError:
                     self.log.exception(f'Error loading Eureka configuration file: {config_file}')
                     raise
                 self.log.debug(self.fileConfig)
+            self._resolve(config_file)
         else:
             raise FileNotFoundError(f'Could not load config file: {config_file}')
 
-    def get_option(self, option):
-        if self.fileConfig is not None:
-            try:
-                return self.fileConfig['options'][option]
-            except KeyError:
-                self.log.exception(f'could not find option:{option} in configuration')
-                raise ConfigError(f'could not find option:{option} in configuration')
-        return getattr(self.clientOptions, option)
+    def _config(self) -> ResolvedConfig:
+        if self.resolved is None:
+            raise ConfigError('no configuration has been loaded')
+        return self.resolved
+
+    def get_option(self, option, default=_MISSING):
+        try:
+            return self._config().options[option]
+        except KeyError:
+            if default is not _MISSING:
+                return default
+            self.log.exception(f'could not find option:{option} in configuration')
+            raise ConfigError(f'could not find option:{option} in configuration')
 
     def get_app(self):
-        if self.fileConfig is not None:
-            try:
-                return self.fileConfig['instance']['app']
-            except KeyError:
-                self.log.exception('could not find app in configuration')
-                raise ConfigError('could not find app in configuration')
-        return self.serviceMetadata.app
+        return self._config().app
 
     def get_instance_id(self):
-        if self.fileConfig is not None:
-            try:
-                return self.fileConfig['instance']['instanceId']
-            except KeyError:
-                self.log.exception('could not find instanceId in configuration')
-                raise ConfigError('could not find instanceId in configuration')
-        return self.serviceMetadata.instanceId
+        return self._config().instanceId
 
     def get_service_metadata(self) -> Dict:
-        if self.fileConfig is not None:
-            try:
-                return {'instance': self.fileConfig['instance']}
-            except KeyError:
-                self.log.exception('instance block missing from configuration')
-                raise ConfigError('instance block missing from configuration')
-        return self.serviceMetadata.render()
+        return self._config().serviceMetadata
 
     def get_service_metadata_json(self) -> str:
-        try:
-            return json.dumps(self.get_service_metadata())
-        except Exception as exc:
-            self.log.exception('Error serialising metadata to JSON')
-            raise exc
+        return self._config().serviceMetadataJson
 
     def get_eureka_server_url(self) -> str:
-        if self.fileConfig is not None:
-            try:
-                host = self.fileConfig['eureka']['host']
-                port = self.fileConfig['eureka']['port']
-                ssl = self.fileConfig['eureka']['ssl']
-                servicePath = self.fileConfig['eureka']['servicePath']
-            except KeyError as exc:
-                self.log.exception('Eureka server block misconfigured')
-                raise ConfigError('Eureka server block misconfigured')
-        else:
-            host = self.discoveryServer.hostName
-            port = self.discoveryServer.port
-            ssl = self.discoveryServer.ssl
-            servicePath = self.discoveryServer.servicePath
-        proto = 'https' if ssl else 'http'
-        return f'{proto}://{host}:{port}{servicePath}'
+        return self._config().eurekaServerUrl
+
+    def get_eureka_server_urls(self) -> Sequence[str]:
+        return self._config().eurekaServerUrls
+
+    def get_app_path(self, app: str=None):
+        if app is not None:
+            return f'/{app}'
+        return self._config().appPath
+
+    def get_instance_path(self, app: str=None, instance_id: str=None):
+        if app is not None and instance_id is not None:
+            return f'/{app}/{instance_id}'
+        return self._config().instancePath
+
+    def get_status_path(self, app: str=None, instance_id: str=None):
+        if app is not None and instance_id is not None:
+            return f'/{app}/{instance_id}/status'
+        return self._config().statusPath
+
+    def get_metadata_update_path(self, app: str=None, instance_id: str=None):
+        if app is not None and instance_id is not None:
+            return f'/{app}/{instance_id}/metadata'
+        return self._config().metadataUpdatePath
+
+    def get_registry_url(self):
+        return self._config().registryUrl
+
+    def get_delta_url(self):
+        return self._config().deltaUrl
 
     def get_app_url(self, app: str=None):
         if app is not None:
             return f'{self.get_eureka_server_url()}/{app}'
-        return f'{self.get_eureka_server_url()}/{self.get_app()}'
+        return self._config().appUrl
 
     def get_instance_url(self, app: str=None, instance_id: str=None):
         if app is not None and instance_id is not None:
             return f'{self.get_eureka_server_url()}/{app}/{instance_id}'
-        return f'{self.get_eureka_server_url()}/{self.get_app()}/{self.get_instance_id()}'
+        return self._config().instanceUrl
 
     def get_status_url(self, app: str=None, instance_id: str=None):
         if app is not None and instance_id is not None:
             return f'{self.get_eureka_server_url()}/{app}/{instance_id}/status'
-        return f'{self.get_eureka_server_url()}/{self.get_app()}/{self.get_instance_id()}/status'
+        return self._config().statusUrl
 
     def get_metadata_update_url(self, app: str=None, instance_id: str=None):
         if app is not None and instance_id is not None:
             return f'{self.get_eureka_server_url()}/{app}/{instance_id}/metadata'
-        return f'{self.get_eureka_server_url()}/{self.get_app()}/{self.get_instance_id()}/metadata'
+        return self._config().metadataUpdateUrl
 
     def get_home_page_path(self):
-        if self.fileConfig is not None:
-            try:
-                return self.fileConfig['instance']['homePagePath']
-            except KeyError:
-                self.log.exception('could not find homePagePath in configuration')
-                raise ConfigError('could not find homePagePath in configuration')
-        return self.serviceMetadata.homePagePath
+        return self._config().homePagePath
 
     def get_health_check_path(self):
-        if self.fileConfig is not None:
-            try:
-                return self.fileConfig['instance']['healthCheckPath']
-            except KeyError:
-                self.log.exception('could not find healthCheckPath in configuration')
-                raise ConfigError('could not find healthCheckPath in configuration')
-        return self.serviceMetadata.healthCheckPath
+        return self._config().healthCheckPath
 
     def get_status_page_path(self):
-        if self.fileConfig is not None:
-            try:
-                return self.fileConfig['instance']['statusPagePath']
-            except KeyError:
-                self.log.exception('could not find statusPagePath in configuration')
-                raise ConfigError('could not find statusPagePath in configuration')
-        return self.serviceMetadata.statusPagePath
+        return self._config().statusPagePath
 
     def get_host_url(self):
-        if self.fileConfig is not None:
-            try:
-                hostname = self.fileConfig['instance']['hostName']
-                port = self.fileConfig['instance']['port']['$']
-            except KeyError:
-                self.log.exception('could not find host or port in configuration')
-                raise ConfigError('could not find host or port in configuration')
-        else:
-            hostname = self.serviceMetadata.hostName
-            port = self.serviceMetadata.port
-        return f'http://{hostname}:{port}'
+        return self._config().hostUrl
+
+    def get_heartbeat_interval(self) -> float:
+        """leaseInfo.renewalIntervalInSecs when the instance declares one, otherwise heartBeatIntervalInSecs
+        """
+        return self._config().renewalIntervalInSecs
 
     def get_port(self):
-        if self.fileConfig is not None:
-            try:
-                return self.fileConfig['instance']['port']['$']
-            except KeyError:
-                self.log.exception('could not find port in configuration')
-                raise ConfigError('could not find port in configuration')
-        return self.serviceMetadata.port
+        return self._config().port
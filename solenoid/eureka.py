@@ -1,20 +1,117 @@
 from solenoid.config import ServiceConfig
+from solenoid.peers import PeerPool
+from solenoid.registry import RegistryCache
+from solenoid.scheduler import Scheduler, default_scheduler, JITTER, EXP_BACKOFF_BOUND
+from solenoid.snapshot import RegistrySnapshot
+from solenoid import snapshot
 import requests
-from requests.exceptions import RequestException
+from requests.exceptions import RequestException, ConnectionError, ConnectTimeout, ReadTimeout, Timeout
 from requests.adapters import HTTPAdapter
 from requests.packages.urllib3.util.retry import Retry
+from requests.packages.urllib3.exceptions import ProtocolError, ReadTimeoutError
+from threading import Lock
 import logging
+import time
+
+
+RETRIES = 3
+BACKOFF_FACTOR = 0.3
+STATUS_FORCELIST = (500, 502, 504)
+POOL_MAXSIZE = 10
+CONNECT_TIMEOUT = 3.05
+# bytes of a response body read at a time, the operation's deadline is checked between reads
+BODY_CHUNK_SIZE = 16 * 1024
+# total time allowed for each operation, split evenly between the initial attempt and its retries
+DEFAULT_TIMEOUTS = {
+    'register': 10,
+    'deregister': 5,
+    'heartbeat': 5,
+    'status': 5,
+    'metadata': 5,
+    'query': 10,
+    'registry': 30
+}
+# methods retried after a read timeout or a status in STATUS_FORCELIST, connection errors are always retried
+IDEMPOTENT_METHODS = frozenset(['HEAD', 'GET', 'PUT', 'DELETE', 'OPTIONS', 'TRACE'])
 
 
 class EurekaClientError(Exception):
     pass
 
 
+class InstanceNotFoundError(EurekaClientError):
+    pass
+
+
+def backoff_time(attempt: int, backoff_factor: float = BACKOFF_FACTOR) -> float:
+    """Time to sleep before the given retry attempt, the same formula urllib3's Retry uses
+    """
+    if attempt <= 1:
+        return 0
+    return backoff_factor * (2 ** (attempt - 1))
+
+
+def attempt_timeout(budget: float, retries: int) -> float:
+    """Timeout for a single attempt so that the attempt and all of its retries fit within the budget
+    """
+    return budget / (max(retries, 0) + 1)
+
+
+def retry_pause(plan: list, attempt: int, deadline: float, backoff_factor: float = BACKOFF_FACTOR) -> float:
+    """Seconds to sleep before the attempt following the given one, None when there is none: the plan is done or
+    the deadline would pass before the next attempt could start
+    """
+    if attempt >= len(plan):
+        return None
+    pause = backoff_time(attempt, backoff_factor) if plan[attempt] is plan[attempt - 1] else 0
+    if time.monotonic() + pause >= deadline:
+        return None
+    return pause
+
+
+def read_body(res: requests.Response, deadline: float):
+    """Reads the body of a streamed response, giving up once the deadline passes. The read timeout only bounds each
+    socket read, a server trickling the body could hold an attempt for far longer.
+    """
+    # read1 returns whatever arrived instead of waiting for a full chunk (urllib3 2)
+    read = getattr(res.raw, 'read1', res.raw.read)
+    chunks = []
+    try:
+        while True:
+            if time.monotonic() >= deadline:
+                res.close()
+                raise ReadTimeout('Response body not read within the time budget', response=res)
+            chunk = read(BODY_CHUNK_SIZE, decode_content=True)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    except ReadTimeoutError as exc:
+        raise ReadTimeout(exc, response=res)
+    except ProtocolError as exc:
+        raise ConnectionError(exc, response=res)
+    res._content = b''.join(chunks)
+    res._content_consumed = True
+
+
+def should_retry(method: str, failover: bool, status: int = None, read_timeout: bool = False) -> bool:
+    """Whether a failed attempt is tried again. A single server follows urllib3's Retry rules, with several
+    servers any 5xx or timeout fails over to the next one.
+    """
+    if status is not None:
+        if failover:
+            return status >= 500
+        return status in STATUS_FORCELIST and method in IDEMPOTENT_METHODS
+    if read_timeout:
+        return failover or method in IDEMPOTENT_METHODS
+    return True
+
+
 def requests_retry_session(
-    retries=3,
-    backoff_factor=0.3,
-    status_forcelist=(500, 502, 504),
+    retries=RETRIES,
+    backoff_factor=BACKOFF_FACTOR,
+    status_forcelist=STATUS_FORCELIST,
     session=None,
+    pool_maxsize=POOL_MAXSIZE,
 ):
     session = session or requests.Session()
     retry = Retry(
@@ -24,28 +121,178 @@ def requests_retry_session(
         backoff_factor=backoff_factor,
         status_forcelist=status_forcelist,
     )
-    adapter = HTTPAdapter(max_retries=retry)
+    adapter = HTTPAdapter(max_retries=retry, pool_maxsize=pool_maxsize)
     session.mount('http://', adapter)
     session.mount('https://', adapter)
     return session
 
 
 class EurekaClient:
-    def __init__(self, config: ServiceConfig):
+    def __init__(self, config: ServiceConfig, peers: PeerPool = None):
+        """peers lets several clients share one set of Eureka peers and their connection pools,
+        by default the client has its own
+        """
         self.config = config
-        self.session = requests_retry_session(config.clientOptions)
+        self.retries = config.get_option('maxRetries', RETRIES)
+        self.timeouts = dict(DEFAULT_TIMEOUTS)
+        self.timeouts.update(config.get_option('timeouts', {}) or {})
+        if peers is None:
+            peers = PeerPool(config.get_eureka_server_urls(), self._session,
+                             cooldown=config.get_option('peerCooldownInSecs', 30))
+        self.peers = peers
+        self.session = self.peers.peers[0].session
         self.log = logging.getLogger(__name__)
+        self.registry = None
+        self.heartbeat_task = None
+        self.registration_task = None
+        # whether Eureka accepted the last registration and it wasn't deregistered since
+        self.registered = False
+
+    def _session(self):
+        # retries are made by _request so they can fail over between peers
+        session = requests_retry_session(0, status_forcelist=(),
+                                         pool_maxsize=self.config.get_option('poolMaxSize', POOL_MAXSIZE))
+        session.headers.update({'Accept': 'application/json'})
+        return session
+
+    def _timeout(self, operation: str, attempts: int, deadline: float):
+        read = min(attempt_timeout(self.timeouts[operation], attempts - 1), deadline - time.monotonic())
+        return min(CONNECT_TIMEOUT, read), read
+
+    def _request(self, operation: str, method: str, path: str, write: bool = False, **kwargs):
+        """Sends a request to the best Eureka peer, retrying or failing over to the next peer on connection
+        errors, timeouts and server errors until the operation's time budget, backoff sleeps included, runs out
+        """
+        deadline = time.monotonic() + self.timeouts[operation]
+        plan = self.peers.plan(self.retries, write)
+        failover = len(self.peers) > 1
+        for attempt, peer in enumerate(plan, 1):
+            start = time.monotonic()
+            try:
+                res = peer.session.request(method, f'{peer.url}{path}', stream=True,
+                                           timeout=self._timeout(operation, len(plan), deadline), **kwargs)
+                read_body(res, deadline)
+            except (ConnectionError, Timeout) as exc:
+                self.peers.failure(peer)
+                pause = retry_pause(plan, attempt, deadline)
+                read_timeout = isinstance(exc, Timeout) and not isinstance(exc, ConnectTimeout)
+                if pause is None or not should_retry(method, failover, read_timeout=read_timeout):
+                    raise
+                self.log.debug(f'Retrying {method} {path} after {exc.__class__.__name__} from {peer.url}')
+            else:
+                if res.status_code < 500:
+                    self.peers.success(peer, time.monotonic() - start, write)
+                    return res
+                self.peers.failure(peer)
+                pause = retry_pause(plan, attempt, deadline)
+                if pause is None or not should_retry(method, failover, status=res.status_code):
+                    return res
+                self.log.debug(f'Retrying {method} {path} after status {res.status_code} from {peer.url}')
+            time.sleep(pause)
+
+    def _schedule(self, scheduler: Scheduler, function, interval: float, name: str, initial_delay: float = None):
+        return (scheduler if scheduler is not None else default_scheduler()).schedule(
+            function, interval, name=name, initial_delay=initial_delay,
+            jitter=self.config.get_option('jitter', JITTER),
+            exp_backoff_bound=self.config.get_option('expBackOffBound', EXP_BACKOFF_BOUND)
+        )
+
+    def start_registry_cache(self, scheduler: Scheduler = None):
+        """Fetches the full registry and keeps it refreshed in the background, instance lookups are
+        then answered from memory.
+
+        With the registrySnapshotPath option the registry is loaded from the snapshot there if there is one,
+        and the first fetch then happens in the background instead of holding up startup. If the first fetch
+        fails its error is raised, but the background refresh is scheduled all the same.
+        """
+        if self.registry is None:
+            interval = self.config.get_option('registryFetchIntervalInSecs', 30)
+            path = self.config.get_option('registrySnapshotPath', None)
+            registry_snapshot = None
+            if path is not None:
+                registry_snapshot = RegistrySnapshot(
+                    path, self.config.get_option('registrySnapshotIntervalInSecs', snapshot.INTERVAL),
+                    self.config.get_option('registrySnapshotMaxAgeInSecs', None))
+            self.registry = RegistryCache(self, interval, registry_snapshot)
+            self.registry.load_snapshot()
+        try:
+            if not self.registry.stale:
+                self.registry.refresh()
+        finally:
+            # scheduled even when the first fetch fails, so the cache fills in once Eureka answers
+            if self.registry.task is None:
+                self.registry.task = self._schedule(scheduler, self.registry.refresh, self.registry.interval,
+                                                    f'registry-refresh:{self.config.get_app()}',
+                                                    initial_delay=0 if self.registry.stale else None)
+        return self.registry
+
+    def stop_registry_cache(self):
+        if self.registry is not None and self.registry.task is not None:
+            self.registry.task.cancel()
+            self.registry.task = None
+
+    def renew(self):
+        """Sends a heartbeat, registering again if Eureka no longer knows about this instance
+        """
+        try:
+            return self.heartbeat()
+        except InstanceNotFoundError:
+            self.log.warning(f'Re-registering {self.config.get_instance_id()} after heartbeat returned 404')
+            return self.register()
+
+    def start_heartbeat(self, scheduler: Scheduler = None):
+        """Renews the lease every leaseInfo.renewalIntervalInSecs (or heartBeatIntervalInSecs) on the scheduler
+        """
+        if self.heartbeat_task is None:
+            self.heartbeat_task = self._schedule(scheduler, self.renew, self.config.get_heartbeat_interval(),
+                                                 f'heartbeat:{self.config.get_instance_id()}')
+        return self.heartbeat_task
+
+    def register_in_background(self, scheduler: Scheduler = None, heartbeat: bool = True):
+        """Registers from the scheduler thread, retrying with backoff until Eureka accepts the registration,
+        then starts the heartbeat. Returns immediately so startup doesn't wait on Eureka.
+        """
+        if self.registration_task is not None:
+            return self.registration_task
+        # the first attempt runs at once on the scheduler thread, it waits on the lock until the task is assigned
+        assigned = Lock()
+
+        def attempt():
+            self.register()
+            with assigned:
+                task.cancel()
+                # a later call registers again, e.g. after a deregistration
+                if self.registration_task is task:
+                    self.registration_task = None
+            if heartbeat:
+                self.start_heartbeat(scheduler)
+
+        with assigned:
+            task = (scheduler if scheduler is not None else default_scheduler()).schedule(
+                attempt, self.config.get_option('registrationRetryIntervalInSecs', 5), initial_delay=0,
+                name=f'register:{self.config.get_instance_id()}',
+                jitter=self.config.get_option('jitter', JITTER),
+                exp_backoff_bound=self.config.get_option('expBackOffBound', EXP_BACKOFF_BOUND)
+            )
+            self.registration_task = task
+        return task
+
+    def stop_heartbeat(self):
+        if self.heartbeat_task is not None:
+            self.heartbeat_task.cancel()
+            self.heartbeat_task = None
 
     def register(self):
         self.log.info(f'Registering {self.config.get_app()} with {self.config.get_app_url()}')
         try:
-            res = self.session.post(self.config.get_app_url(), json=self.config.get_service_metadata())
+            res = self._request('register', 'POST', self.config.get_app_path(), write=True, json=self.config.get_service_metadata())
         except RequestException:
             self.log.exception(f'Error registering with Eureka server {self.config.get_eureka_server_url()}')
             raise
         self.log.info(f'Response code for registration: {res.status_code}')
         if res.status_code == 204:
             self.log.info(f'successfully registered {self.config.get_app()}')
+            self.registered = True
             return True
         self.log.error(f'Failed to register: {res.status_code}')
         raise EurekaClientError(f'Failed to register: {res.status_code}')
@@ -53,13 +300,14 @@ class EurekaClient:
     def deregister(self):
         self.log.info(f'Deregistering {self.config.get_app()} with {self.config.get_instance_url()}')
         try:
-            res = self.session.delete(self.config.get_instance_url())
+            res = self._request('deregister', 'DELETE', self.config.get_instance_path(), write=True)
         except RequestException:
             self.log.exception(f'Error deregistering with Eureka server {self.config.get_eureka_server_url()}')
             raise
         self.log.info(f'Response code for deregistration: {res.status_code}')
         if res.status_code == 200:
             self.log.info(f'successfully deregistered {self.config.get_app()}')
+            self.registered = False
             return True
         self.log.error(f'Failed to deregister: {res.status_code}')
         raise EurekaClientError(f'Failed to deregister: {res.status_code}')
@@ -67,7 +315,7 @@ class EurekaClient:
     def heartbeat(self):
         self.log.info(f'Sending heartbeat for {self.config.get_app()} with {self.config.get_instance_url()}')
         try:
-            res = self.session.put(self.config.get_instance_url(), params={'status': 'UP'})
+            res = self._request('heartbeat', 'PUT', self.config.get_instance_path(), write=True, params={'status': 'UP'})
         except RequestException:
             self.log.exception(f'Error sending heartbeat to Eureka server {self.config.get_eureka_server_url()}')
             raise
@@ -77,14 +325,42 @@ class EurekaClient:
             return True
         elif res.status_code == 404:
             self.log.error(f'instance {self.config.get_instance_id()} does not exist')
-            raise EurekaClientError(f'instance {self.config.get_instance_id()} does not exist')
+            raise InstanceNotFoundError(f'instance {self.config.get_instance_id()} does not exist')
         self.log.error(f'Failed send heartbeat: {res.status_code}')
         raise EurekaClientError(f'Failed to send heartbeat: {res.status_code}')
 
+    def get_registry(self):
+        self.log.debug(f'Retrieving registry from {self.config.get_registry_url()}')
+        try:
+            res = self._request('registry', 'GET', '')
+        except RequestException:
+            self.log.exception(f'Error retrieving registry from Eureka server {self.config.get_eureka_server_url()}')
+            raise
+        if res.status_code == 200:
+            return res.json()
+        self.log.error(f'Failed to retrieve registry: {res.status_code}')
+        raise EurekaClientError(f'Failed to retrieve registry: {res.status_code}')
+
+    def get_registry_delta(self):
+        self.log.debug(f'Retrieving registry delta from {self.config.get_delta_url()}')
+        try:
+            res = self._request('registry', 'GET', '/delta')
+        except RequestException:
+            self.log.exception(f'Error retrieving registry delta from Eureka server {self.config.get_eureka_server_url()}')
+            raise
+        if res.status_code == 200:
+            return res.json()
+        self.log.error(f'Failed to retrieve registry delta: {res.status_code}')
+        raise EurekaClientError(f'Failed to retrieve registry delta: {res.status_code}')
+
     def get_all_instances(self, app: str=None):
+        if self.registry is not None and self.registry.ready:
+            cached = self.registry.get_application(self.config.get_app() if app is None else app)
+            if cached is not None:
+                return cached
         self.log.info(f'Retrieving all instances of {self.config.get_app()} with {self.config.get_app_url(app)}')
         try:
-            res = self.session.get(self.config.get_app_url(app))
+            res = self._request('query', 'GET', self.config.get_app_path(app))
         except RequestException:
             self.log.exception(f'Error retrieving instances with Eureka server {self.config.get_eureka_server_url()}')
             raise
@@ -96,9 +372,14 @@ class EurekaClient:
         raise EurekaClientError(f'Failed to retrieve instances for {self.config.get_app() if app is None else app}: {res.status_code}')
 
     def get_app_instance(self, app: str=None, instance_id: str=None):
+        if self.registry is not None and self.registry.ready:
+            cached = self.registry.get_instance(self.config.get_app() if app is None else app,
+                                                self.config.get_instance_id() if instance_id is None else instance_id)
+            if cached is not None:
+                return cached
         self.log.info(f'Retrieving instance of {self.config.get_app()} with {self.config.get_instance_url(app, instance_id)}')
         try:
-            res = self.session.get(self.config.get_instance_url(app, instance_id))
+            res = self._request('query', 'GET', self.config.get_instance_path(app, instance_id))
         except RequestException:
             self.log.exception(f'Error retrieving instance with Eureka server {self.config.get_eureka_server_url()}')
             raise
@@ -115,7 +396,7 @@ class EurekaClient:
     def out_of_service(self):
         self.log.info(f'Taking instance out of service for {self.config.get_app()} with {self.config.get_instance_url()}')
         try:
-            res = self.session.put(self.config.get_status_url(), params={'value': 'OUT_OF_SERVICE'})
+            res = self._request('status', 'PUT', self.config.get_status_path(), write=True, params={'value': 'OUT_OF_SERVICE'})
         except RequestException:
             self.log.exception(f'Error taking instance out of service with Eureka server {self.config.get_eureka_server_url()}')
             raise
@@ -129,7 +410,7 @@ class EurekaClient:
     def back_in_service(self):
         self.log.info(f'Taking instance out of service for {self.config.get_app()} with {self.config.get_instance_url()}')
         try:
-            res = self.session.delete(self.config.get_status_url())
+            res = self._request('status', 'DELETE', self.config.get_status_path(), write=True)
         except RequestException:
             self.log.exception(f'Error taking instance out of service with Eureka server {self.config.get_eureka_server_url()}')
             raise
@@ -143,7 +424,7 @@ class EurekaClient:
     def update_metadata(self, key, value):
         self.log.info(f'Updating instance metadata {key}={value} for {self.config.get_app()} with {self.config.get_instance_url()}')
         try:
-            res = self.session.put(self.config.get_metadata_update_url(), params={key: value})
+            res = self._request('metadata', 'PUT', self.config.get_metadata_update_path(), write=True, params={key: value})
         except RequestException:
             self.log.exception(f'Error updating instance metadata with Eureka server {self.config.get_eureka_server_url()}')
             raise
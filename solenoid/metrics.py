@@ -0,0 +1,212 @@
+from array import array
+from threading import Lock
+from typing import Dict, Iterable, List, Tuple
+from flask import Flask, g, request
+import math
+import time
+
+# smallest latency distinguished by the histogram, in seconds
+RESOLUTION = 1e-6
+# linear sub-buckets per power of two, bounding the relative error of a percentile to 1/SUB_BUCKETS
+SUB_BUCKETS = 16
+# powers of two covered above RESOLUTION, 2**36 microseconds is about 19 hours
+MAGNITUDES = 36
+BUCKETS = MAGNITUDES * SUB_BUCKETS
+PERCENTILES = (0.5, 0.95, 0.99)
+MAX_SERIES = 1000
+
+HTTP_SERVER_REQUESTS = 'http.server.requests'
+TAGS = ('exception', 'method', 'outcome', 'status', 'uri')
+
+
+def bucket_index(value: float) -> int:
+    """HDR style bucket for a value: the power of two it falls in, then a linear sub-bucket within it
+    """
+    if value < RESOLUTION:
+        return 0
+    mantissa, exponent = math.frexp(value / RESOLUTION)
+    index = (exponent - 1) * SUB_BUCKETS + int((mantissa - 0.5) * 2 * SUB_BUCKETS)
+    return index if index < BUCKETS else BUCKETS - 1
+
+
+def bucket_upper_bound(index: int) -> float:
+    exponent, sub = divmod(index, SUB_BUCKETS)
+    return math.ldexp(0.5 + (sub + 1) / (2 * SUB_BUCKETS), exponent + 1) * RESOLUTION
+
+
+class LatencyHistogram:
+    """Fixed memory streaming histogram of latencies in seconds.
+
+    Recording is O(1) and takes no lock, under the GIL a concurrent update can very occasionally be lost,
+    which is an acceptable error for monitoring data.
+    """
+    __slots__ = ('count', 'total', 'max', 'counts', 'version')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.counts = array('Q', bytes(8 * BUCKETS))
+        self.version = 0
+
+    def record(self, value: float):
+        self.counts[bucket_index(value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+        self.version += 1
+
+    def merge(self, other: 'LatencyHistogram'):
+        counts = self.counts
+        for i, c in enumerate(other.counts):
+            if c:
+                counts[i] += c
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+        self.version += 1
+
+    def percentile(self, p: float) -> float:
+        if self.count == 0:
+            return 0.0
+        rank = max(1, math.ceil(p * self.count))
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= rank:
+                return min(bucket_upper_bound(i), self.max)
+        return self.max
+
+
+def outcome(status: int) -> str:
+    if status < 200:
+        return 'INFORMATIONAL'
+    if status < 300:
+        return 'SUCCESS'
+    if status < 400:
+        return 'REDIRECTION'
+    if status < 500:
+        return 'CLIENT_ERROR'
+    return 'SERVER_ERROR'
+
+
+class MetricsRegistry:
+    """Latency histograms for http.server.requests keyed by the same tags Spring Boot uses.
+
+    Series are created under a lock the first time a tag combination is seen, after that recording only
+    touches the series' histogram. Past MAX_SERIES distinct combinations the uri tag is reported as OTHER.
+    """
+
+    def __init__(self, max_series: int = MAX_SERIES):
+        self.max_series = max_series
+        self.series = {}
+        self._lock = Lock()
+
+    def _histogram(self, key: Tuple[str, ...]) -> LatencyHistogram:
+        histogram = self.series.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self.series.get(key)
+                if histogram is None:
+                    if len(self.series) >= self.max_series:
+                        key = key[:4] + ('OTHER',)
+                        histogram = self.series.get(key)
+                    if histogram is None:
+                        histogram = LatencyHistogram()
+                        self.series[key] = histogram
+        return histogram
+
+    def record(self, method: str, uri: str, status: int, seconds: float, exception: str = 'None'):
+        self._histogram((exception, method, outcome(status), str(status), uri)).record(seconds)
+
+    def snapshot(self) -> List[Tuple]:
+        """The series as plain tuples, (key, count, total, max, [(bucket, count), ...]) with empty buckets left out
+        """
+        return [(key, h.count, h.total, h.max, [(i, c) for i, c in enumerate(h.counts) if c])
+                for key, h in list(self.series.items())]
+
+    def load(self, snapshot: Iterable[Tuple]):
+        """Adds the counts of a snapshot to this registry
+        """
+        for key, count, total, maximum, buckets in snapshot:
+            histogram = self._histogram(tuple(key))
+            counts = histogram.counts
+            for i, c in buckets:
+                counts[i] += c
+            histogram.count += count
+            histogram.total += total
+            histogram.max = max(histogram.max, maximum)
+            histogram.version += count
+
+    def view(self) -> 'MetricsRegistry':
+        """The registry the actuator endpoints read, this one unless metrics are shared between processes
+        """
+        return self
+
+    def names(self) -> List[str]:
+        return [HTTP_SERVER_REQUESTS] if self.series else []
+
+    def select(self, tags: Iterable[Tuple[str, str]] = ()) -> Dict[Tuple[str, ...], LatencyHistogram]:
+        """Series whose tags match all the given (tag, value) pairs
+        """
+        selected = dict(self.series)
+        for tag, value in tags:
+            if tag not in TAGS:
+                raise ValueError(f'Unknown tag {tag}')
+            position = TAGS.index(tag)
+            selected = {k: v for k, v in selected.items() if k[position] == value}
+        return selected
+
+    def render(self, tags: Iterable[Tuple[str, str]] = ()) -> Dict:
+        tags = list(tags)
+        selected = self.select(tags)
+        merged = LatencyHistogram()
+        for histogram in selected.values():
+            merged.merge(histogram)
+        filtered = {tag for tag, _ in tags}
+        measurements = [
+            {'statistic': 'COUNT', 'value': merged.count},
+            {'statistic': 'TOTAL_TIME', 'value': merged.total},
+            {'statistic': 'MAX', 'value': merged.max}
+        ]
+        for p in PERCENTILES:
+            measurements.append({'statistic': f'PERCENTILE_{p:g}', 'value': merged.percentile(p)})
+        return {
+            'name': HTTP_SERVER_REQUESTS,
+            'description': None,
+            'baseUnit': 'seconds',
+            'measurements': measurements,
+            'availableTags': [
+                {'tag': tag, 'values': sorted({k[i] for k in selected})}
+                for i, tag in enumerate(TAGS) if tag not in filtered
+            ]
+        }
+
+    def install(self, app: Flask):
+        """Records every request made to the app
+        """
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+
+    def _before_request(self):
+        g._solenoid_start = time.perf_counter()
+
+    def _uri(self) -> str:
+        rule = request.url_rule
+        return rule.rule if rule is not None else 'UNKNOWN'
+
+    def _after_request(self, response):
+        g._solenoid_status = response.status_code
+        return response
+
+    def _teardown_request(self, exc):
+        # recorded here rather than in after_request, which also runs for the 500 Flask answers on an unhandled
+        # exception but doesn't get the exception
+        start = g.pop('_solenoid_start', None)
+        if start is not None:
+            status = g.pop('_solenoid_status', 500)
+            uri = self._uri() if status != 404 else 'NOT_FOUND'
+            self.record(request.method, uri, status, time.perf_counter() - start,
+                        exc.__class__.__name__ if exc is not None else 'None')
@@ -0,0 +1,192 @@
+from sys import intern
+from typing import Dict, Iterable, Tuple
+import logging
+
+log = logging.getLogger(__name__)
+
+EMPTY = ()
+
+
+def _as_list(value):
+    """Eureka collapses single element arrays into objects in some versions, normalise them back
+    """
+    if value is None:
+        return []
+    if isinstance(value, list):
+        return value
+    return [value]
+
+
+def _port(value) -> Tuple[int, bool]:
+    if value is None:
+        return 0, False
+    if isinstance(value, dict):
+        enabled = value.get('@enabled', True)
+        return int(value.get('$', 0)), enabled is True or enabled == 'true'
+    return int(value), True
+
+
+def _intern(value):
+    return intern(value) if isinstance(value, str) else value
+
+
+def _timestamp(value):
+    return int(value) if value is not None else None
+
+
+class InstanceInfo:
+    """Compact record of a registered instance, parsed from the Eureka JSON representation
+    """
+    __slots__ = ('instanceId', 'app', 'hostName', 'ipAddr', 'vipAddress', 'secureVipAddress', 'status',
+                 'port', 'portEnabled', 'securePort', 'securePortEnabled', 'homePageUrl', 'statusPageUrl',
+                 'healthCheckUrl', 'metadata', 'lastUpdatedTimestamp', 'lastDirtyTimestamp', 'actionType')
+
+    def __init__(self, instanceId: str, app: str, hostName: str, ipAddr: str = None, vipAddress: str = None,
+                 secureVipAddress: str = None, status: str = 'UNKNOWN', port: int = 0, portEnabled: bool = True,
+                 securePort: int = 0, securePortEnabled: bool = False, homePageUrl: str = None,
+                 statusPageUrl: str = None, healthCheckUrl: str = None, metadata: Dict = None,
+                 lastUpdatedTimestamp: int = None, lastDirtyTimestamp: int = None, actionType: str = None):
+        self.instanceId = instanceId
+        self.app = _intern(app.upper())
+        self.hostName = _intern(hostName)
+        self.ipAddr = _intern(ipAddr)
+        self.vipAddress = _intern(vipAddress)
+        self.secureVipAddress = _intern(secureVipAddress)
+        self.status = _intern(status)
+        self.port = port
+        self.portEnabled = portEnabled
+        self.securePort = securePort
+        self.securePortEnabled = securePortEnabled
+        self.homePageUrl = homePageUrl
+        self.statusPageUrl = statusPageUrl
+        self.healthCheckUrl = healthCheckUrl
+        self.metadata = metadata or None
+        self.lastUpdatedTimestamp = lastUpdatedTimestamp
+        self.lastDirtyTimestamp = lastDirtyTimestamp
+        self.actionType = _intern(actionType)
+
+    @classmethod
+    def parse(cls, instance: Dict) -> 'InstanceInfo':
+        port, port_enabled = _port(instance.get('port'))
+        secure_port, secure_port_enabled = _port(instance.get('securePort'))
+        metadata = instance.get('metadata')
+        if metadata is not None:
+            metadata = {k: v for k, v in metadata.items() if k != '@class'}
+        return cls(
+            instanceId=instance['instanceId'],
+            app=instance['app'],
+            hostName=instance.get('hostName'),
+            ipAddr=instance.get('ipAddr'),
+            vipAddress=instance.get('vipAddress'),
+            secureVipAddress=instance.get('secureVipAddress'),
+            status=instance.get('status', 'UNKNOWN'),
+            port=port,
+            portEnabled=port_enabled,
+            securePort=secure_port,
+            securePortEnabled=secure_port_enabled,
+            homePageUrl=instance.get('homePageUrl'),
+            statusPageUrl=instance.get('statusPageUrl'),
+            healthCheckUrl=instance.get('healthCheckUrl'),
+            metadata=metadata,
+            lastUpdatedTimestamp=_timestamp(instance.get('lastUpdatedTimestamp')),
+            lastDirtyTimestamp=_timestamp(instance.get('lastDirtyTimestamp')),
+            actionType=instance.get('actionType')
+        )
+
+    def url(self, secure: bool = False) -> str:
+        if secure and self.securePortEnabled:
+            return f'https://{self.hostName}:{self.securePort}'
+        return f'http://{self.hostName}:{self.port}'
+
+    def render(self) -> Dict:
+        instance = {
+            'instanceId': self.instanceId,
+            'app': self.app,
+            'hostName': self.hostName,
+            'ipAddr': self.ipAddr,
+            'vipAddress': self.vipAddress,
+            'secureVipAddress': self.secureVipAddress,
+            'status': self.status,
+            'port': {'$': self.port, '@enabled': self.portEnabled},
+            'securePort': {'$': self.securePort, '@enabled': self.securePortEnabled},
+            'homePageUrl': self.homePageUrl,
+            'statusPageUrl': self.statusPageUrl,
+            'healthCheckUrl': self.healthCheckUrl,
+            'metadata': dict(self.metadata) if self.metadata else {}
+        }
+        if self.lastUpdatedTimestamp is not None:
+            instance['lastUpdatedTimestamp'] = self.lastUpdatedTimestamp
+        if self.lastDirtyTimestamp is not None:
+            instance['lastDirtyTimestamp'] = self.lastDirtyTimestamp
+        return instance
+
+    def __repr__(self):
+        return f'InstanceInfo({self.app}:{self.instanceId}:{self.status})'
+
+
+def _index(instances: Iterable[InstanceInfo], attr: str) -> Dict[str, Tuple[InstanceInfo, ...]]:
+    index = {}
+    for instance in instances:
+        key = getattr(instance, attr)
+        if key:
+            index.setdefault(key.upper() if attr != 'status' else key, []).append(instance)
+    return {k: tuple(v) for k, v in index.items()}
+
+
+class Applications:
+    """Immutable snapshot of the registry indexed by app, VIP address, secure VIP address, status and
+    instanceId. Changes produce a new snapshot so it can be shared between threads without locking.
+    """
+    __slots__ = ('by_id', 'by_app', 'by_vip', 'by_secure_vip', 'by_status')
+
+    def __init__(self, instances: Iterable[InstanceInfo] = ()):
+        self.by_id = {i.instanceId: i for i in instances}
+        values = self.by_id.values()
+        self.by_app = _index(values, 'app')
+        self.by_vip = _index(values, 'vipAddress')
+        self.by_secure_vip = _index(values, 'secureVipAddress')
+        self.by_status = _index(values, 'status')
+
+    @classmethod
+    def parse(cls, doc: Dict) -> 'Applications':
+        instances = []
+        for application in _as_list(doc.get('applications', {}).get('application')):
+            for instance in _as_list(application.get('instance')):
+                try:
+                    instances.append(InstanceInfo.parse(instance))
+                except (KeyError, TypeError, ValueError):
+                    log.warning(f'Ignoring malformed instance in {application.get("name")}')
+        return cls(instances)
+
+    def apply(self, changes: Iterable[InstanceInfo]) -> 'Applications':
+        by_id = dict(self.by_id)
+        for instance in changes:
+            if instance.actionType == 'DELETED':
+                by_id.pop(instance.instanceId, None)
+            else:
+                instance.actionType = None
+                by_id[instance.instanceId] = instance
+        return Applications(by_id.values())
+
+    def __len__(self):
+        return len(self.by_id)
+
+    def app(self, app: str) -> Tuple[InstanceInfo, ...]:
+        return self.by_app.get(app.upper(), EMPTY)
+
+    def vip(self, vip_address: str) -> Tuple[InstanceInfo, ...]:
+        return self.by_vip.get(vip_address.upper(), EMPTY)
+
+    def secure_vip(self, secure_vip_address: str) -> Tuple[InstanceInfo, ...]:
+        return self.by_secure_vip.get(secure_vip_address.upper(), EMPTY)
+
+    def status(self, status: str) -> Tuple[InstanceInfo, ...]:
+        return self.by_status.get(status, EMPTY)
+
+    def instance(self, instance_id: str) -> InstanceInfo:
+        return self.by_id.get(instance_id)
+
+    def hashcode(self) -> str:
+        """Computes the Eureka apps__hashcode, e.g. DOWN_1_UP_4_
+        """
+        return ''.join(f'{status}_{len(self.by_status[status])}_' for status in sorted(self.by_status))
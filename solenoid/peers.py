@@ -0,0 +1,89 @@
+from threading import Lock
+from typing import List, Sequence
+import logging
+import time
+
+EWMA_ALPHA = 0.3
+COOLDOWN = 30.0
+MAX_COOLDOWN = 300.0
+
+
+class EurekaPeer:
+    """A Eureka server together with its pooled session and latency/health statistics
+    """
+
+    def __init__(self, url: str, session=None):
+        self.url = url
+        self.session = session
+        self.latency = None
+        self.failures = 0
+        self.down_until = 0.0
+
+    @property
+    def healthy(self) -> bool:
+        return self.down_until <= time.monotonic()
+
+    def __repr__(self):
+        return f'EurekaPeer({self.url}, latency={self.latency}, healthy={self.healthy})'
+
+
+class PeerPool:
+    """Orders Eureka peers for each request.
+
+    Reads go to the healthy peer with the lowest latency, tracked as an exponentially weighted moving average.
+    Writes (register, heartbeat, status and metadata changes) stick to one peer for as long as it stays
+    healthy, so an instance's lease isn't bounced between peers and replicated back and forth. A peer that
+    fails is skipped for a cooldown that doubles with each consecutive failure, but is still tried as a last
+    resort when no healthy peer is left.
+    """
+
+    def __init__(self, urls: Sequence[str], session_factory=None, alpha: float = EWMA_ALPHA,
+                 cooldown: float = COOLDOWN):
+        self.peers = [EurekaPeer(url, session_factory() if session_factory is not None else None) for url in urls]
+        self.alpha = alpha
+        self.cooldown = cooldown
+        self.writer = self.peers[0]
+        self.log = logging.getLogger(__name__)
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self.peers)
+
+    def read_order(self) -> List[EurekaPeer]:
+        healthy = [p for p in self.peers if p.healthy]
+        healthy.sort(key=lambda p: p.latency if p.latency is not None else 0.0)
+        down = sorted((p for p in self.peers if not p.healthy), key=lambda p: p.down_until)
+        return healthy + down
+
+    def write_order(self) -> List[EurekaPeer]:
+        order = self.read_order()
+        writer = self.writer
+        if writer.healthy:
+            order.remove(writer)
+            order.insert(0, writer)
+        return order
+
+    def plan(self, retries: int, write: bool = False) -> List[EurekaPeer]:
+        """Peers to try in turn for one request: a single peer is retried `retries` times, several peers
+        are failed over between, visiting each at least once
+        """
+        order = self.write_order() if write else self.read_order()
+        attempts = max(retries + 1, len(order))
+        return [order[i % len(order)] for i in range(attempts)]
+
+    def success(self, peer: EurekaPeer, elapsed: float, write: bool = False):
+        with self._lock:
+            peer.latency = elapsed if peer.latency is None else self.alpha * elapsed + (1 - self.alpha) * peer.latency
+            peer.failures = 0
+            peer.down_until = 0.0
+            if write and peer is not self.writer:
+                self.log.info(f'Sending writes to Eureka peer {peer.url}')
+                self.writer = peer
+
+    def failure(self, peer: EurekaPeer):
+        if len(self.peers) == 1:
+            return
+        with self._lock:
+            peer.failures += 1
+            peer.down_until = time.monotonic() + min(self.cooldown * 2 ** (peer.failures - 1), MAX_COOLDOWN)
+        self.log.warning(f'Eureka peer {peer.url} failed, {peer.failures} consecutive failures')
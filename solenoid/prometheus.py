@@ -0,0 +1,177 @@
+from threading import Lock
+from typing import List, Tuple
+import os
+import platform
+import threading
+import time
+
+from solenoid.metrics import MetricsRegistry, LatencyHistogram, bucket_upper_bound, TAGS
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+# le boundaries exported for http_server_requests_seconds, the histogram itself is much finer
+LE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+MIN_INTERVAL = 1.0
+
+
+
+def _process_start_time() -> float:
+    """The start time of the process from /proc (boot time plus its start in clock ticks since boot), the time
+    this module was imported where /proc isn't available
+    """
+    try:
+        with open('/proc/stat') as stat:
+            boot_time = next(float(line.split()[1]) for line in stat if line.startswith('btime '))
+        with open('/proc/self/stat') as stat:
+            # the command name in parentheses may contain spaces, starttime is the 20th field after it
+            started = int(stat.read().rsplit(')', 1)[1].split()[19])
+        return boot_time + started / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError, StopIteration, AttributeError):
+        return time.time()
+
+
+_START_TIME = _process_start_time()
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(pairs: List[Tuple[str, str]]) -> str:
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}' if pairs else ''
+
+
+def _number(value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_histogram(key: Tuple[str, ...], histogram: LatencyHistogram) -> str:
+    labels = list(zip(TAGS, key))
+    lines = []
+    counts = histogram.counts
+    cumulative = 0
+    index = 0
+    for le in LE_BUCKETS:
+        while index < len(counts) and bucket_upper_bound(index) <= le:
+            cumulative += counts[index]
+            index += 1
+        lines.append(f'http_server_requests_seconds_bucket{_labels(labels + [("le", repr(le))])} {cumulative}')
+    lines.append(f'http_server_requests_seconds_bucket{_labels(labels + [("le", "+Inf")])} {histogram.count}')
+    lines.append(f'http_server_requests_seconds_count{_labels(labels)} {histogram.count}')
+    lines.append(f'http_server_requests_seconds_sum{_labels(labels)} {_number(histogram.total)}')
+    return '\n'.join(lines) + '\n'
+
+
+def _rss_bytes():
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _open_fds():
+    try:
+        return len(os.listdir('/proc/self/fd'))
+    except OSError:
+        return None
+
+
+class PrometheusExporter:
+    """Renders metrics in the Prometheus text format.
+
+    The body is rebuilt at most once every min_interval seconds, scrapes in between are served the
+    previous output. When it is rebuilt, request series whose histogram hasn't changed reuse their
+    previously rendered text.
+    """
+
+    def __init__(self, metrics: MetricsRegistry, client=None, min_interval: float = MIN_INTERVAL):
+        self.metrics = metrics
+        self.client = client
+        self.min_interval = min_interval
+        self._series = {}
+        self._body = None
+        self._rendered_at = 0.0
+        self._lock = Lock()
+
+    def scrape(self) -> bytes:
+        now = time.monotonic()
+        if self._body is not None and now - self._rendered_at < self.min_interval:
+            return self._body
+        with self._lock:
+            if self._body is None or time.monotonic() - self._rendered_at >= self.min_interval:
+                self._body = self._render().encode('utf-8')
+                self._rendered_at = time.monotonic()
+            return self._body
+
+    def _render(self) -> str:
+        parts = [self._render_requests()]
+        if self.client is not None:
+            parts.append(self._render_eureka())
+        parts.append(self._render_process())
+        return ''.join(parts)
+
+    def _render_requests(self) -> str:
+        series = dict(self.metrics.view().series)
+        # only the series still in the view are kept, so dropped ones don't pin their rendered text
+        previous, self._series = self._series, {}
+        if not series:
+            return ''
+        buckets, maxes = [], []
+        for key, histogram in sorted(series.items()):
+            cached = previous.get(key)
+            if cached is None or cached[0] != histogram.version:
+                cached = (histogram.version, render_histogram(key, histogram))
+            self._series[key] = cached
+            buckets.append(cached[1])
+            maxes.append(f'http_server_requests_seconds_max{_labels(list(zip(TAGS, key)))} {_number(histogram.max)}\n')
+        return ('# HELP http_server_requests_seconds Duration of HTTP server requests\n'
+                '# TYPE http_server_requests_seconds histogram\n' + ''.join(buckets) +
+                '# HELP http_server_requests_seconds_max Longest HTTP server request\n'
+                '# TYPE http_server_requests_seconds_max gauge\n' + ''.join(maxes))
+
+    def _render_eureka(self) -> str:
+        lines = []
+        task = self.client.heartbeat_task
+        if task is not None:
+            lines += ['# HELP eureka_heartbeats_total Heartbeats sent to Eureka',
+                      '# TYPE eureka_heartbeats_total counter',
+                      f'eureka_heartbeats_total{{result="success"}} {task.runs - task.failures}',
+                      f'eureka_heartbeats_total{{result="failure"}} {task.failures}']
+        registry = self.client.registry
+        if registry is not None and registry.ready:
+            lines += ['# HELP eureka_registry_cache_age_seconds Time since the registry cache was last refreshed',
+                      '# TYPE eureka_registry_cache_age_seconds gauge',
+                      f'eureka_registry_cache_age_seconds {_number(time.time() - registry.updated_at)}',
+                      '# HELP eureka_registry_cache_stale Whether the registry cache is a snapshot Eureka has not confirmed',
+                      '# TYPE eureka_registry_cache_stale gauge',
+                      f'eureka_registry_cache_stale {1 if registry.stale else 0}',
+                      '# HELP eureka_registry_instances Instances in the registry cache',
+                      '# TYPE eureka_registry_instances gauge',
+                      f'eureka_registry_instances {len(registry.applications)}']
+        return '\n'.join(lines) + '\n' if lines else ''
+
+    def _render_process(self) -> str:
+        times = os.times()
+        lines = ['# HELP process_cpu_seconds_total Total user and system CPU time spent in seconds',
+                 '# TYPE process_cpu_seconds_total counter',
+                 f'process_cpu_seconds_total {_number(times.user + times.system)}',
+                 '# HELP process_start_time_seconds Start time of the process since unix epoch in seconds',
+                 '# TYPE process_start_time_seconds gauge',
+                 f'process_start_time_seconds {_number(_START_TIME)}',
+                 '# HELP process_threads Number of Python threads',
+                 '# TYPE process_threads gauge',
+                 f'process_threads {threading.active_count()}']
+        rss = _rss_bytes()
+        if rss is not None:
+            lines += ['# HELP process_resident_memory_bytes Resident memory size in bytes',
+                      '# TYPE process_resident_memory_bytes gauge',
+                      f'process_resident_memory_bytes {rss}']
+        fds = _open_fds()
+        if fds is not None:
+            lines += ['# HELP process_open_fds Number of open file descriptors',
+                      '# TYPE process_open_fds gauge',
+                      f'process_open_fds {fds}']
+        lines += ['# HELP python_info Python platform information',
+                  '# TYPE python_info gauge',
+                  f'python_info{_labels([("implementation", platform.python_implementation()), ("version", platform.python_version())])} 1']
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,141 @@
+from threading import Lock
+from typing import Dict, Tuple
+import logging
+import time
+
+from solenoid.model import Applications, InstanceInfo, _as_list
+from solenoid.snapshot import RegistrySnapshot
+
+
+def reconcile_hashcode(apps: Applications) -> str:
+    """Computes the Eureka apps__hashcode for a set of applications, e.g. DOWN_1_UP_4_
+    """
+    return apps.hashcode()
+
+
+class RegistryCache:
+    """Local copy of the Eureka registry, kept current with delta fetches.
+
+    A full fetch of /eureka/apps is made the first time the cache is refreshed, subsequent refreshes
+    fetch /eureka/apps/delta and apply it. If the apps__hashcode of the result does not match the one
+    returned by the server the cache falls back to a full fetch. Lookups never touch the network, the
+    applications map is replaced wholesale on every change so readers always see a consistent snapshot.
+
+    With a RegistrySnapshot the cache can be loaded from disk before the first fetch, it is then stale until
+    a fetch succeeds, and every good registry is written back to it at the snapshot's interval.
+    """
+
+    def __init__(self, client, interval: float = 30.0, snapshot: RegistrySnapshot = None):
+        self.client = client
+        self.interval = interval
+        self.snapshot = snapshot
+        self.log = logging.getLogger(__name__)
+        self._apps = Applications()
+        self._hashcode = None
+        self._lock = Lock()
+        self.task = None
+        self.last_fetch = None
+        self.snapshot_time = None
+        self.version = 0
+        self.full_fetches = 0
+        self.delta_fetches = 0
+
+    @property
+    def ready(self) -> bool:
+        return self.last_fetch is not None or self.stale
+
+    @property
+    def stale(self) -> bool:
+        """Whether the cache holds a snapshot from disk that no fetch from Eureka has replaced yet
+        """
+        return self.last_fetch is None and self.snapshot_time is not None
+
+    @property
+    def updated_at(self):
+        """When the cached registry was fetched, or written for a snapshot
+        """
+        return self.last_fetch if self.last_fetch is not None else self.snapshot_time
+
+    def load_snapshot(self) -> bool:
+        """Loads the snapshot if there is a usable one and nothing has been fetched yet
+        """
+        if self.snapshot is None:
+            return False
+        loaded = self.snapshot.load()
+        if loaded is None:
+            return False
+        with self._lock:
+            if self.last_fetch is not None:
+                return False
+            self._apps, self._hashcode, self.snapshot_time = loaded
+            self.version += 1
+        return True
+
+    @property
+    def hashcode(self):
+        return self._hashcode
+
+    def refresh(self):
+        with self._lock:
+            if self.last_fetch is None:
+                self._full_fetch()
+            else:
+                self._delta_fetch()
+            self.last_fetch = time.time()
+            apps, hashcode, version = self._apps, self._hashcode, self.version
+        if self.snapshot is not None and self.snapshot.due(version):
+            try:
+                self.snapshot.save(apps, hashcode, version)
+            except OSError as exc:
+                self.log.warning(f'Could not write registry snapshot {self.snapshot.path}: {str(exc)}')
+
+    def _full_fetch(self):
+        doc = self.client.get_registry()
+        self._apps = Applications.parse(doc)
+        self._hashcode = doc.get('applications', {}).get('apps__hashcode')
+        self.version += 1
+        self.full_fetches += 1
+        self.log.debug(f'Fetched full registry of {len(self._apps)} instances')
+
+    def _delta_fetch(self):
+        doc = self.client.get_registry_delta()
+        delta = doc.get('applications', {})
+        changed = [InstanceInfo.parse(instance)
+                   for application in _as_list(delta.get('application'))
+                   for instance in _as_list(application.get('instance'))]
+        apps = self._apps.apply(changed) if changed else self._apps
+        self.delta_fetches += 1
+
+        remote = delta.get('apps__hashcode')
+        if remote is not None and remote != reconcile_hashcode(apps):
+            self.log.warning(f'Registry hashcode mismatch after delta (server:{remote}), fetching full registry')
+            self._full_fetch()
+            return
+        if changed:
+            self._apps = apps
+            self.version += 1
+        self._hashcode = remote
+
+    @property
+    def applications(self) -> Applications:
+        return self._apps
+
+    def get_application(self, app: str):
+        instances = self._apps.app(app)
+        if not instances:
+            return None
+        return {
+            'application': {
+                'name': app.upper(),
+                'instance': [i.render() for i in instances]
+            }
+        }
+
+    def get_instance(self, app: str, instance_id: str):
+        instance = self._apps.instance(instance_id)
+        if instance is None or instance.app != app.upper():
+            return None
+        return {'instance': instance.render()}
+
+    def get_applications(self) -> Dict[str, Tuple[InstanceInfo, ...]]:
+        return dict(self._apps.by_app)
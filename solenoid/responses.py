@@ -0,0 +1,61 @@
+from flask import Request, Response
+from typing import Union
+import gzip
+import hashlib
+
+# payloads smaller than this aren't worth the CPU to compress
+GZIP_MIN_SIZE = 1024
+GZIP_LEVEL = 6
+
+
+def accepts_gzip(request: Request) -> bool:
+    return request.accept_encodings.quality('gzip') > 0
+
+
+def _gzip_response(response: Response, body: bytes, request: Request) -> Response:
+    response.vary.add('Accept-Encoding')
+    if len(body) >= GZIP_MIN_SIZE and accepts_gzip(request):
+        response.set_data(gzip.compress(body, GZIP_LEVEL))
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+
+def compressed(body: Union[str, bytes], request: Request, content_type: str, status: int = 200) -> Response:
+    """Response for a dynamic payload, gzip compressed when it is large and the client accepts gzip
+    """
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    return _gzip_response(Response(body, status=status, content_type=content_type), body, request)
+
+
+class CachedBody:
+    """A serialized payload served with a strong ETag, its gzip encoding is compressed at most once.
+
+    Requests whose If-None-Match matches get a 304 without a body.
+    """
+    __slots__ = ('body', 'content_type', 'etag', '_gzipped')
+
+    def __init__(self, body: Union[str, bytes], content_type: str):
+        self.body = body.encode('utf-8') if isinstance(body, str) else body
+        self.content_type = content_type
+        self.etag = hashlib.sha1(self.body).hexdigest()
+        self._gzipped = None
+
+    def gzipped(self) -> bytes:
+        if self._gzipped is None:
+            self._gzipped = gzip.compress(self.body, GZIP_LEVEL)
+        return self._gzipped
+
+    def response(self, request: Request) -> Response:
+        # each encoding is a different representation so needs its own strong tag
+        encode = len(self.body) >= GZIP_MIN_SIZE and accepts_gzip(request)
+        etag = f'{self.etag}-gzip' if encode else self.etag
+        if request.if_none_match.contains_weak(etag):
+            response = Response(status=304)
+        else:
+            response = Response(self.gzipped() if encode else self.body, content_type=self.content_type)
+            if encode:
+                response.headers['Content-Encoding'] = 'gzip'
+        response.set_etag(etag)
+        response.vary.add('Accept-Encoding')
+        return response
@@ -0,0 +1,151 @@
+from threading import Condition, Lock, Thread
+from typing import Callable
+import heapq
+import itertools
+import logging
+import random
+import time
+
+JITTER = 0.1
+EXP_BACKOFF_BOUND = 10
+
+
+class ScheduledTask:
+    """A function run periodically by a Scheduler.
+
+    Each delay is the interval randomised by +/- jitter (as a fraction of the interval) so tasks started
+    at the same moment across a fleet drift apart. After a failure the interval doubles for every
+    consecutive failure, bounded at interval * exp_backoff_bound, and returns to normal on the next success.
+    """
+
+    def __init__(self, scheduler: 'Scheduler', function: Callable, interval: float, name: str,
+                 jitter: float, exp_backoff_bound: int, on_error: Callable):
+        self.scheduler = scheduler
+        self.function = function
+        self.interval = interval
+        self.name = name
+        self.jitter = jitter
+        self.exp_backoff_bound = exp_backoff_bound
+        self.on_error = on_error
+        self.cancelled = False
+        self.runs = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.last_success = None
+        self.last_error = None
+
+    def delay(self) -> float:
+        backoff = min(2 ** self.consecutive_failures, self.exp_backoff_bound)
+        delay = self.interval * backoff
+        if self.jitter:
+            delay += random.uniform(-self.jitter, self.jitter) * self.interval
+        return max(delay, 0.0)
+
+    def run(self):
+        self.runs += 1
+        try:
+            self.function()
+        except Exception as exc:
+            self.failures += 1
+            self.consecutive_failures += 1
+            self.last_error = exc
+            if self.on_error is not None:
+                self.on_error(exc)
+            else:
+                logging.getLogger(__name__).exception(f'Scheduled task {self.name} failed, '
+                                                      f'{self.consecutive_failures} consecutive failures')
+            return
+        self.consecutive_failures = 0
+        self.last_success = time.time()
+
+    def cancel(self):
+        self.cancelled = True
+        self.scheduler.wakeup()
+
+
+class Scheduler:
+    """Runs any number of periodic tasks (heartbeats, registry refreshes) on a single daemon thread
+    """
+
+    def __init__(self, name: str = 'solenoid-scheduler'):
+        self.name = name
+        self.log = logging.getLogger(__name__)
+        self._queue = []
+        self._sequence = itertools.count()
+        self._condition = Condition()
+        self._thread = None
+        self._stopped = False
+
+    def schedule(self, function: Callable, interval: float, name: str = None, initial_delay: float = None,
+                 jitter: float = JITTER, exp_backoff_bound: int = EXP_BACKOFF_BOUND,
+                 on_error: Callable = None) -> ScheduledTask:
+        task = ScheduledTask(self, function, interval, name or getattr(function, '__name__', 'task'),
+                             jitter, exp_backoff_bound, on_error)
+        delay = task.delay() if initial_delay is None else initial_delay
+        self._push(time.monotonic() + delay, task)
+        self._start()
+        return task
+
+    def _push(self, when: float, task: ScheduledTask):
+        with self._condition:
+            heapq.heappush(self._queue, (when, next(self._sequence), task))
+            self._condition.notify()
+
+    def wakeup(self):
+        with self._condition:
+            self._condition.notify()
+
+    def _start(self):
+        with self._condition:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopped = False
+                self._thread = Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+
+    def _next(self):
+        with self._condition:
+            while not self._stopped:
+                while self._queue and self._queue[0][2].cancelled:
+                    heapq.heappop(self._queue)
+                if not self._queue:
+                    self._condition.wait()
+                    continue
+                when, _, task = self._queue[0]
+                now = time.monotonic()
+                if when <= now:
+                    heapq.heappop(self._queue)
+                    return task
+                self._condition.wait(when - now)
+            return None
+
+    def _run(self):
+        while True:
+            task = self._next()
+            if task is None:
+                return
+            task.run()
+            if not task.cancelled:
+                self._push(time.monotonic() + task.delay(), task)
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._queue.clear()
+            self._condition.notify()
+
+    def __len__(self):
+        return sum(1 for _, _, task in self._queue if not task.cancelled)
+
+
+_default = None
+_default_lock = Lock()
+
+
+def default_scheduler() -> Scheduler:
+    """The process wide scheduler shared by every client that isn't given one explicitly
+    """
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = Scheduler()
+        return _default
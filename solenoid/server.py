@@ -0,0 +1,95 @@
+from threading import Thread
+from typing import Callable
+import logging
+
+try:
+    from cheroot import wsgi
+except ImportError:
+    wsgi = None
+
+THREADS = 10
+BACKLOG = 128
+TIMEOUT = 10
+SHUTDOWN_TIMEOUT = 5
+
+# WSGI environ key of the function that stops the server handling the request
+SHUTDOWN_KEY = 'solenoid.server.shutdown'
+
+
+class _Middleware:
+    """Gives requests a way to stop the server, and closes connections after each response when keep-alive is off
+    """
+
+    def __init__(self, app: Callable, shutdown: Callable, keep_alive: bool):
+        self.app = app
+        self.shutdown = shutdown
+        self.keep_alive = keep_alive
+
+    def __call__(self, environ, start_response):
+        environ[SHUTDOWN_KEY] = self.shutdown
+        if self.keep_alive:
+            return self.app(environ, start_response)
+
+        def close_connection(status, headers, exc_info=None):
+            headers = [(k, v) for k, v in headers if k.lower() != 'connection']
+            headers.append(('Connection', 'close'))
+            return start_response(status, headers, exc_info)
+
+        return self.app(environ, close_connection)
+
+
+class SolenoidServer:
+    """A production WSGI server (cheroot, installed with the server extra) with a fixed pool of worker threads.
+
+    backlog is the listen queue of the socket, timeout the seconds a connection may stay idle, whether
+    between keep-alive requests or while a request is being read, and on stop in-flight requests are given
+    shutdown_timeout seconds to finish.
+    """
+
+    def __init__(self, app: Callable, host: str, port: int, threads: int = THREADS, max_threads: int = None,
+                 backlog: int = BACKLOG, timeout: float = TIMEOUT, keep_alive: bool = True,
+                 shutdown_timeout: float = SHUTDOWN_TIMEOUT, server_name: str = None):
+        if wsgi is None:
+            raise RuntimeError('The production server needs cheroot, install solenoid[server]')
+        self.log = logging.getLogger(__name__)
+        self.host = host
+        self.port = port
+        self.on_stop = []
+        self._prepared = False
+        self.server = wsgi.Server((host, port), _Middleware(app, self.shutdown, keep_alive),
+                                  numthreads=threads, max=threads if max_threads is None else max_threads,
+                                  request_queue_size=backlog, timeout=timeout, shutdown_timeout=shutdown_timeout,
+                                  server_name=server_name)
+
+    @property
+    def bind_addr(self):
+        return self.server.bind_addr
+
+    def prepare(self):
+        """Binds the socket and starts the worker threads without serving yet, the port is known afterwards
+        """
+        self.server.prepare()
+        self._prepared = True
+
+    def serve_forever(self):
+        """Serves requests until stop is called
+        """
+        if not self._prepared:
+            self.prepare()
+        self.log.info(f'Serving on {self.host}:{self.bind_addr[1]}')
+        try:
+            self.server.serve()
+        except KeyboardInterrupt:
+            self.stop()
+        finally:
+            for hook in self.on_stop:
+                hook()
+
+    def stop(self):
+        self.log.info('Stopping server')
+        self.server.stop()
+
+    def shutdown(self):
+        """Stops the server from another thread, so a request handler can call it and still send its response
+        """
+        Thread(target=self.stop, name='solenoid-server-stop', daemon=True).start()
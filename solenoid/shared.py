@@ -0,0 +1,430 @@
+from threading import Lock
+from typing import Callable, List, Optional
+import datetime
+import fcntl
+import json
+import logging
+import marshal
+import mmap
+import os
+import struct
+import time
+
+from .metrics import MetricsRegistry, MAX_SERIES
+from .scheduler import Scheduler, default_scheduler
+from .traces import Trace, TraceBuffer
+
+MAGIC = b'SOLSHM01'
+WORKERS = 16
+TRACE_SLOT_SIZE = 4096
+METRICS_SIZE = 262144
+PUBLISH_INTERVAL = 1.0
+ELECTION_INTERVAL = 5.0
+
+# magic, workers, region size, trace slots, trace slot size, metrics size
+_HEADER = struct.Struct('<8sIIIII')
+HEADER_SIZE = 64
+# seqlock sequence of the metrics blob, traces written, pid, metrics length
+_REGION = struct.Struct('<QQII')
+REGION_HEADER_SIZE = 64
+# seqlock sequence, payload length
+_SLOT = struct.Struct('<QI')
+_SEQ = struct.Struct('<Q')
+# a reader gives up on a record being rewritten after this many attempts
+READ_ATTEMPTS = 10
+
+
+class SharedTrace:
+    """A trace read back from the shared store, it has the attributes TraceBuffer.query filters on
+    """
+    __slots__ = ('timestamp', 'path', 'status', 'size', '_rendered')
+
+    def __init__(self, timestamp: float, path: str, status: int, rendered: dict):
+        self.timestamp = timestamp
+        self.path = path
+        self.status = status
+        self.size = 0
+        self._rendered = rendered
+
+    def render(self) -> dict:
+        return self._rendered
+
+
+class SharedStore:
+    """Traces and metrics of every worker process of a server, in a memory mapped file.
+
+    Each worker claims a region of the file by holding an fcntl lock on its first byte, the lock is released
+    by the kernel when the worker exits however it exits, and a new worker then takes the region over. Only
+    the owner writes to a region, readers take no lock: every trace slot and the metrics blob are guarded by
+    a sequence counter (a seqlock), odd while being written, and a read is retried when it changes under it.
+
+    Regions are claimed on first use, so the store can be created before a pre-forking server forks. POSIX
+    record locks belong to the process and closing any descriptor of the file drops them, so open a path
+    with one SharedStore per process.
+    """
+
+    def __init__(self, path: str, workers: int = WORKERS, trace_slots: int = 100,
+                 trace_slot_size: int = TRACE_SLOT_SIZE, metrics_size: int = METRICS_SIZE):
+        self.log = logging.getLogger(__name__)
+        self.path = path
+        self.workers = workers
+        self.trace_slots = trace_slots
+        self.trace_slot_size = trace_slot_size
+        self.metrics_size = metrics_size
+        self.region_size = REGION_HEADER_SIZE + trace_slots * trace_slot_size + metrics_size
+        self.size = HEADER_SIZE + workers * self.region_size
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        self._init_file()
+        self._map = mmap.mmap(self._fd, self.size)
+        self._lock = Lock()
+        self._pid = None
+        self.region = None
+
+    def _init_file(self):
+        header = _HEADER.pack(MAGIC, self.workers, self.region_size, self.trace_slots, self.trace_slot_size,
+                              self.metrics_size)
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            existing = os.pread(self._fd, _HEADER.size, 0)
+            if existing == header:
+                return
+            if any(self._live(offset) for offset in self._region_offsets(existing)):
+                raise ValueError(f'Shared store {self.path} is in use with a different layout')
+            os.ftruncate(self._fd, 0)
+            os.ftruncate(self._fd, self.size)
+            os.pwrite(self._fd, header, 0)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _region_offsets(self, header: bytes) -> List[int]:
+        """Offsets of the regions of a file created with another layout
+        """
+        try:
+            magic, workers, region_size = _HEADER.unpack(header)[:3]
+        except struct.error:
+            return []
+        return [HEADER_SIZE + r * region_size for r in range(workers)] if magic == MAGIC else []
+
+    def _offset(self, region: int) -> int:
+        return HEADER_SIZE + region * self.region_size
+
+    def _live(self, offset: int) -> bool:
+        """Whether another process holds the region at offset
+        """
+        try:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB, 1, offset)
+        except OSError:
+            return True
+        fcntl.lockf(self._fd, fcntl.LOCK_UN, 1, offset)
+        return False
+
+    def claim(self) -> Optional[int]:
+        """The region of this process, claimed the first time it is needed in each process
+        """
+        pid = os.getpid()
+        if self._pid == pid:
+            return self.region
+        with self._lock:
+            if self._pid != pid:
+                self.region = None
+                for region in range(self.workers):
+                    try:
+                        fcntl.lockf(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB, 1, self._offset(region))
+                    except OSError:
+                        continue
+                    self.region = region
+                    _, traces, _, metrics_len = self._region_header(region)
+                    _REGION.pack_into(self._map, self._offset(region), self._seq(self._offset(region)),
+                                      traces, pid, metrics_len)
+                    self.log.debug(f'Worker {pid} claimed shared region {region}')
+                    break
+                else:
+                    self.log.warning(f'All {self.workers} regions of {self.path} are in use, '
+                                     f'worker {pid} only reports its own traces and metrics')
+                self._pid = pid
+        return self.region
+
+    def release(self):
+        """Gives up the region of this process for good, it then only reports its own traces and metrics
+        """
+        pid = os.getpid()
+        with self._lock:
+            if self._pid == pid and self.region is not None:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, 1, self._offset(self.region))
+                self.log.debug(f'Worker {pid} released shared region {self.region}')
+            self._pid, self.region = pid, None
+
+    def live_workers(self) -> int:
+        """Number of other processes holding a region, workers that haven't claimed one yet aren't counted
+        """
+        own = self.region if self._pid == os.getpid() else None
+        # testing our own region would release its lock, record locks aren't counted per descriptor
+        return sum(1 for region in range(self.workers) if region != own and self._live(self._offset(region)))
+
+    def _seq(self, offset: int) -> int:
+        return _SEQ.unpack_from(self._map, offset)[0]
+
+    def _region_header(self, region: int):
+        return _REGION.unpack_from(self._map, self._offset(region))
+
+    def _write(self, seq_offset: int, write: Callable):
+        seq = self._seq(seq_offset)
+        _SEQ.pack_into(self._map, seq_offset, seq + 1)
+        write()
+        _SEQ.pack_into(self._map, seq_offset, seq + 2)
+
+    def _read(self, seq_offset: int, read: Callable):
+        for _ in range(READ_ATTEMPTS):
+            before = self._seq(seq_offset)
+            if before & 1:
+                time.sleep(0)
+                continue
+            value = read()
+            if self._seq(seq_offset) == before:
+                return value
+        return None
+
+    def _slot_offset(self, region: int, slot: int) -> int:
+        return self._offset(region) + REGION_HEADER_SIZE + slot * self.trace_slot_size
+
+    def append_trace(self, trace: Trace) -> bool:
+        region = self.claim()
+        if region is None:
+            return False
+        payload = json.dumps([trace.timestamp, trace.path, trace.status, trace.render()]).encode('utf-8')
+        if _SLOT.size + len(payload) > self.trace_slot_size:
+            self.log.debug(f'Trace of {trace.path} is too large for a shared trace slot')
+            return False
+        base = self._offset(region)
+        with self._lock:
+            seq, traces, pid, metrics_len = self._region_header(region)
+            offset = self._slot_offset(region, traces % self.trace_slots)
+
+            def write():
+                _SLOT.pack_into(self._map, offset, self._seq(offset), len(payload))
+                self._map[offset + _SLOT.size:offset + _SLOT.size + len(payload)] = payload
+
+            self._write(offset, write)
+            # the count is only read as a hint of which slots are in use, it needs no seqlock
+            struct.pack_into('<Q', self._map, base + 8, traces + 1)
+        return True
+
+    def traces(self) -> List[SharedTrace]:
+        """Traces of all workers, oldest first
+        """
+        traces = []
+        for region in range(self.workers):
+            _, written, pid, _ = self._region_header(region)
+            if not pid:
+                continue
+            for i in range(min(written, self.trace_slots)):
+                offset = self._slot_offset(region, i)
+
+                def read():
+                    length = _SLOT.unpack_from(self._map, offset)[1]
+                    return bytes(self._map[offset + _SLOT.size:offset + _SLOT.size + length])
+
+                payload = self._read(offset, read)
+                if payload:
+                    try:
+                        traces.append(SharedTrace(*json.loads(payload.decode('utf-8'))))
+                    except (ValueError, TypeError):
+                        continue
+        traces.sort(key=lambda t: t.timestamp)
+        return traces
+
+    def publish_metrics(self, snapshot: list) -> bool:
+        region = self.claim()
+        if region is None:
+            return False
+        blob = marshal.dumps(snapshot)
+        if len(blob) > self.metrics_size:
+            self.log.warning(f'Metrics snapshot of {len(blob)} bytes does not fit the shared store')
+            return False
+        base = self._offset(region)
+        start = base + REGION_HEADER_SIZE + self.trace_slots * self.trace_slot_size
+
+        def write():
+            self._map[start:start + len(blob)] = blob
+            struct.pack_into('<I', self._map, base + 20, len(blob))
+
+        with self._lock:
+            self._write(base, write)
+        return True
+
+    def region_metrics(self, region: int) -> Optional[list]:
+        """The last metrics snapshot published in a region
+        """
+        base = self._offset(region)
+        start = base + REGION_HEADER_SIZE + self.trace_slots * self.trace_slot_size
+
+        def read():
+            length = _REGION.unpack_from(self._map, base)[3]
+            return bytes(self._map[start:start + length])
+
+        blob = self._read(base, read)
+        if not blob:
+            return None
+        try:
+            return marshal.loads(blob)
+        except (EOFError, ValueError, TypeError):
+            return None
+
+    def metrics(self, include_own: bool = True) -> List[list]:
+        """The last published metrics snapshot of every worker, dead workers' included so counters never go back
+        """
+        own = self.region if self._pid == os.getpid() else None
+        snapshots = (self.region_metrics(region) for region in range(self.workers)
+                     if include_own or region != own)
+        return [snapshot for snapshot in snapshots if snapshot is not None]
+
+    def close(self):
+        self._map.close()
+        os.close(self._fd)
+
+
+class SharedTraceBuffer(TraceBuffer):
+    """A TraceBuffer that also writes its traces to a SharedStore, and is read as the merged traces of every worker
+    """
+
+    def __init__(self, store: SharedStore, capacity: int = 100, max_bytes: int = None):
+        super().__init__(capacity, max_bytes)
+        self.store = store
+
+    def append(self, trace: Trace):
+        super().append(trace)
+        self.store.append_trace(trace)
+
+    def __iter__(self):
+        if self.store.claim() is None:
+            return super().__iter__()
+        return iter(self.store.traces())
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+
+class SharedMetricsRegistry(MetricsRegistry):
+    """A MetricsRegistry that publishes its series to a SharedStore every publish_interval seconds (when they
+    changed), its view merges the series of every worker.
+
+    A worker taking over the region of a dead worker starts from that worker's counts, so counters don't go
+    back when a worker is replaced.
+    """
+
+    def __init__(self, store: SharedStore, max_series: int = MAX_SERIES, publish_interval: float = PUBLISH_INTERVAL,
+                 scheduler: Scheduler = None):
+        super().__init__(max_series)
+        self.store = store
+        self.publish_interval = publish_interval
+        self.scheduler = scheduler
+        self._pid = None
+        self._published = None
+
+    def _start(self):
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._lock:
+            if self._pid == pid:
+                return
+            self._pid = pid
+        region = self.store.claim()
+        if region is not None:
+            self.load(self.store.region_metrics(region) or [])
+        scheduler = self.scheduler if self.scheduler is not None else default_scheduler()
+        scheduler.schedule(self.publish, self.publish_interval, name='publish-metrics', jitter=0)
+
+    def record(self, method: str, uri: str, status: int, seconds: float, exception: str = 'None'):
+        if self._pid != os.getpid():
+            self._start()
+        super().record(method, uri, status, seconds, exception)
+
+    def publish(self):
+        state = sum(h.count for h in list(self.series.values()))
+        if state != self._published and self.store.publish_metrics(self.snapshot()):
+            self._published = state
+
+    def view(self) -> MetricsRegistry:
+        if self._pid != os.getpid():
+            self._start()
+        if self.store.region is None:
+            return self
+        merged = MetricsRegistry(self.max_series)
+        merged.load(self.snapshot())
+        for snapshot in self.store.metrics(include_own=False):
+            merged.load(snapshot)
+        return merged
+
+
+class LeaderElection:
+    """Elects one process among the workers of a server by an exclusive flock on a file.
+
+    The kernel releases the lock when the leader exits, the other workers retry every interval seconds and
+    the first to get the lock becomes the leader. flock locks are shared with child processes, so only start
+    the election in the worker processes, never in a master that forks them.
+    """
+
+    def __init__(self, path: str, interval: float = ELECTION_INTERVAL, scheduler: Scheduler = None):
+        self.log = logging.getLogger(__name__)
+        self.path = path
+        self.interval = interval
+        self.scheduler = scheduler
+        self.is_leader = False
+        self.task = None
+        self._fd = None
+        self._on_elected = []
+
+    def try_acquire(self) -> bool:
+        if self.is_leader:
+            return True
+        if self._fd is None:
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return False
+        os.ftruncate(self._fd, 0)
+        os.pwrite(self._fd, f'{os.getpid()} {datetime.datetime.now().isoformat()}\n'.encode('utf-8'), 0)
+        self.is_leader = True
+        self.log.info(f'Worker {os.getpid()} is the leader')
+        return True
+
+    def start(self, on_elected: Callable):
+        """Calls on_elected once this process becomes the leader, at once if it can be elected now. A callback
+        that raises is called again every interval seconds until it succeeds.
+        """
+        self._on_elected.append(on_elected)
+        self._elect()
+        if self._on_elected and self.task is None:
+            scheduler = self.scheduler if self.scheduler is not None else default_scheduler()
+            self.task = scheduler.schedule(self._elect, self.interval, name='leader-election')
+
+    def _elect(self) -> bool:
+        if not self.try_acquire():
+            return False
+        callbacks, self._on_elected = self._on_elected, []
+        failed = []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as exc:
+                self.log.warning(f'Leader callback {getattr(callback, "__name__", callback)} failed, '
+                                 f'retrying in {self.interval}s: {str(exc)}')
+                failed.append(callback)
+        # callbacks may have been added while these ran
+        self._on_elected = failed + self._on_elected
+        if not self._on_elected and self.task is not None:
+            self.task.cancel()
+            self.task = None
+        return True
+
+    def release(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+        self.is_leader = False
@@ -0,0 +1,117 @@
+from threading import Condition, Lock, Thread
+from typing import Callable
+from flask import Flask, g
+import logging
+import time
+
+DRAIN_TIMEOUT = 30.0
+GRACE = 0.0
+
+
+class InFlightRequests:
+    """Counts the requests an app is handling, from its before_request and teardown_request hooks
+    """
+
+    def __init__(self, app: Flask = None):
+        self.count = 0
+        self._condition = Condition()
+        if app is not None:
+            self.install(app)
+
+    def install(self, app: Flask):
+        app.before_request(self._before_request)
+        app.teardown_request(self._teardown_request)
+
+    def _before_request(self):
+        g._solenoid_in_flight = True
+        with self._condition:
+            self.count += 1
+
+    def _teardown_request(self, exc):
+        # teardown runs even when an earlier before_request hook answered and this one never ran
+        if not g.pop('_solenoid_in_flight', False):
+            return
+        with self._condition:
+            self.count -= 1
+            self._condition.notify_all()
+
+    def wait_idle(self, timeout: float, ignore: int = 0) -> bool:
+        """Waits until at most `ignore` requests are in flight, returns False if that didn't happen within timeout
+        """
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while self.count > ignore:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+        return True
+
+
+class ShutdownSequence:
+    """Takes an instance out of Eureka before it stops, so callers stop routing to it while it still answers.
+
+    The instance is marked OUT_OF_SERVICE, given grace seconds for clients to refresh their registry, then
+    in-flight requests are drained up to drain_timeout seconds, the heartbeat and registry refreshes are
+    stopped, the instance is deregistered and finally stop_server is called. Eureka failures are logged and
+    don't hold up the sequence. It runs once on its own thread however many times it is started.
+    """
+
+    def __init__(self, client, in_flight: InFlightRequests, drain_timeout: float = DRAIN_TIMEOUT,
+                 grace: float = GRACE, registered: Callable[[], bool] = lambda: True):
+        self.log = logging.getLogger(__name__)
+        self.client = client
+        self.in_flight = in_flight
+        self.drain_timeout = drain_timeout
+        self.grace = grace
+        self.registered = registered
+        self.thread = None
+        self.steps = []
+        self._lock = Lock()
+
+    def start(self, stop_server: Callable = None, ignore: int = 0) -> Thread:
+        """Starts the sequence, ignore is the number of in-flight requests not to wait for, such as the one
+        asking for the shutdown
+        """
+        with self._lock:
+            if self.thread is None:
+                self.thread = Thread(target=self.run, args=(stop_server, ignore), name='solenoid-shutdown',
+                                     daemon=True)
+                self.thread.start()
+            return self.thread
+
+    def _step(self, name: str, function: Callable):
+        try:
+            function()
+            self.steps.append(name)
+        except Exception as exc:
+            self.log.warning(f'Shutdown step {name} failed: {str(exc)}')
+
+    def run(self, stop_server: Callable = None, ignore: int = 0):
+        registered = self.registered()
+        self.log.info('Shutting down')
+        if registered:
+            self._step('out_of_service', self.client.out_of_service)
+        if self.grace > 0:
+            time.sleep(self.grace)
+        if self.in_flight.wait_idle(self.drain_timeout, ignore):
+            self.steps.append('drained')
+        else:
+            self.log.warning(f'{self.in_flight.count} requests still in flight after {self.drain_timeout}s')
+        self._step('stop_heartbeat', self._stop_tasks)
+        if registered:
+            self._step('deregister', self.client.deregister)
+        if stop_server is not None:
+            self._step('stop_server', stop_server)
+        self.log.info('Shutdown complete')
+
+    def _stop_tasks(self):
+        if self.client.registration_task is not None:
+            self.client.registration_task.cancel()
+        self.client.stop_heartbeat()
+        self.client.stop_registry_cache()
+
+    def wait(self, timeout: float = None) -> bool:
+        if self.thread is not None:
+            self.thread.join(timeout)
+        return self.thread is not None and not self.thread.is_alive()
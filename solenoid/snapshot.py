@@ -0,0 +1,105 @@
+from typing import Optional, Tuple
+import logging
+import marshal
+import os
+import tempfile
+import time
+
+from solenoid.model import Applications, InstanceInfo
+
+INTERVAL = 300.0
+MAGIC = b'SLNRS'
+FORMAT = 1
+# marshal format 4 shares repeated strings (app, status, VIP...) between records
+MARSHAL_VERSION = 4
+# every InstanceInfo field but actionType, in the order of InstanceInfo's arguments
+FIELDS = InstanceInfo.__slots__[:-1]
+
+
+def dumps(apps: Applications, hashcode: str, written_at: float = None) -> bytes:
+    rows = [tuple(getattr(instance, field) for field in FIELDS) for instance in apps.by_id.values()]
+    return MAGIC + marshal.dumps((FORMAT, FIELDS, time.time() if written_at is None else written_at, hashcode, rows),
+                                 MARSHAL_VERSION)
+
+
+def loads(data: bytes) -> Tuple[Applications, str, float]:
+    """Decodes a snapshot as (applications, hashcode, written_at), raises ValueError if it isn't one this
+    version wrote
+    """
+    if not data.startswith(MAGIC):
+        raise ValueError('not a registry snapshot')
+    try:
+        fmt, fields, written_at, hashcode, rows = marshal.loads(data[len(MAGIC):])
+    except (EOFError, TypeError, ValueError) as exc:
+        raise ValueError(f'corrupt registry snapshot: {str(exc)}')
+    if fmt != FORMAT or tuple(fields) != FIELDS:
+        raise ValueError(f'unsupported registry snapshot format {fmt}')
+    return Applications(InstanceInfo(*row) for row in rows), hashcode, written_at
+
+
+class RegistrySnapshot:
+    """The last good registry on local disk, so a process can resolve instances before its first fetch from
+    Eureka completes, or at all while Eureka is unreachable.
+
+    Snapshots are marshalled tuples of the InstanceInfo fields, much smaller than the registry JSON and decoded
+    without parsing it. They are written at most every interval seconds, to a temporary file renamed over the
+    previous one so readers (including other processes sharing the path) never see a partial snapshot.
+    Snapshots older than max_age seconds are ignored.
+    """
+
+    def __init__(self, path: str, interval: float = INTERVAL, max_age: float = None):
+        self.log = logging.getLogger(__name__)
+        self.path = path
+        self.interval = interval
+        self.max_age = max_age
+        self.written_at = None
+        self.written_version = None
+
+    def load(self) -> Optional[Tuple[Applications, str, float]]:
+        """The snapshot as (applications, hashcode, written_at), None if there is no usable one
+        """
+        try:
+            with open(self.path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        except OSError as exc:
+            self.log.warning(f'Could not read registry snapshot {self.path}: {str(exc)}')
+            return None
+        try:
+            apps, hashcode, written_at = loads(data)
+        except ValueError as exc:
+            self.log.warning(f'Ignoring registry snapshot {self.path}: {str(exc)}')
+            return None
+        if self.max_age is not None and time.time() - written_at > self.max_age:
+            self.log.info(f'Ignoring registry snapshot {self.path} written {int(time.time() - written_at)}s ago')
+            return None
+        self.log.info(f'Loaded registry snapshot of {len(apps)} instances written {int(time.time() - written_at)}s ago')
+        return apps, hashcode, written_at
+
+    def due(self, version: int) -> bool:
+        if version == self.written_version:
+            return False
+        return self.written_at is None or time.monotonic() - self.written_at >= self.interval
+
+    def save(self, apps: Applications, hashcode: str, version: int = None):
+        """Writes the snapshot atomically
+        """
+        data = dumps(apps, hashcode)
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix=f'.{os.path.basename(self.path)}.')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+        except BaseException:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+        self.written_at = time.monotonic()
+        self.written_version = version
+        self.log.debug(f'Wrote registry snapshot of {len(apps)} instances ({len(data)} bytes) to {self.path}')
@@ -1,104 +1,227 @@
-from flask import Flask, Response, make_response
+from flask import Flask, Response, has_request_context, make_response, send_file
 from flask.json import dumps, request
 from .solenoids import log, health, runtime
 from .config import ServiceConfig
+from .traces import TraceBuffer
+from .metrics import MetricsRegistry, HTTP_SERVER_REQUESTS
+from .responses import CachedBody, compressed
+from .server import SHUTDOWN_KEY
+from . import prometheus
 import logging
-from collections import deque
 
 CONTENT_TYPE = 'application/vnd.spring-boot.actuator.v2+json;charset=UTF-8'
 
 
 def shutdown_server():
     '''
-    Function to gracefully shutdown server. Only works with DEV Flask server
+    Function to gracefully shutdown server from within a request handler. Works with the production server (see
+    solenoid.server) and the DEV Flask server. The environ function is bound to the request, code running outside
+    one, such as the shutdown sequence, has to stop the server itself (SolenoidServer.stop, or shutdown on the
+    werkzeug server)
     :return: None
     '''
-    func = request.environ.get('werkzeug.server.shutdown')
+    if not has_request_context():
+        raise RuntimeError('shutdown_server only works within a request, stop the server directly instead')
+    func = request.environ.get(SHUTDOWN_KEY) or request.environ.get('werkzeug.server.shutdown')
     if func is None:
-        raise RuntimeError('Not running with the Werkzeug Server')
+        raise RuntimeError('Not running with the Solenoid or Werkzeug Server')
     func()
 
 
 class Solenoid:
 
-    def __init__(self, config: ServiceConfig, app: Flask, httptraces: deque):
+    def __init__(self, config: ServiceConfig, app: Flask, httptraces: TraceBuffer, metrics: MetricsRegistry = None,
+                 client=None):
         self.app = app
         self.config = config
         self.traces = httptraces
+        if metrics is None:
+            metrics = MetricsRegistry()
+            metrics.install(app)
+        self.metrics = metrics
+        self.prometheus = prometheus.PrometheusExporter(
+            metrics, client, config.get_option('prometheusMinIntervalInSecs', prometheus.MIN_INTERVAL))
         self.log = logging.getLogger(__name__)
+        self._loggers_body = None
+        # called with the function stopping the server instead of stopping it at once, see SolenoidFlaskApp.shutdown
+        self.shutdown_hook = None
+        self._env_body = None
+        runtime.preload()
+        self.health = health.HealthRegistry(config.get_option('healthCheckThreads', health.MAX_WORKERS),
+                                            config.get_option('healthCheckTimeoutInSecs', health.TIMEOUT),
+                                            config.get_option('healthCheckTtlInSecs', health.TTL))
+        threshold = config.get_option('diskSpaceThreshold', health.THRESHOLD)
+        self.health.register('diskSpace', lambda: health.get_disk_health('/', threshold))
+        self._prometheus_body = None
+        # static payloads, serialized once
+        self._links = CachedBody(dumps(
+            {
+                '_links': {
+                    'self': f'{self.config.get_host_url()}/actuator',
+                    'templated': False
+                },
+                'health': {
+                    'self': f'{self.config.get_host_url()}{self.config.get_health_check_path()}',
+                    'templated': False
+                },
+                'info': {
+                    'self': f'{self.config.get_host_url()}{self.config.get_status_page_path()}',
+                    'templated': False
+                },
+                'logfile': {
+                    'self': f'{self.config.get_host_url()}/actuator/logfile',
+                    'templated': False
+                },
+                'loggers': {
+                    'self': f'{self.config.get_host_url()}/actuator/loggers',
+                    'templated': False
+                },
+                'loggers-name': {
+                    'self': f'{self.config.get_host_url()}/actuator/loggers/{{name}}',
+                    'templated': True
+                },
+                'env': {
+                    'self': f'{self.config.get_host_url()}/actuator/env',
+                    'templated': False
+                },
+                'metrics': {
+                    'self': f'{self.config.get_host_url()}/actuator/metrics',
+                    'templated': False
+                },
+                'metrics-requiredMetricName': {
+                    'self': f'{self.config.get_host_url()}/actuator/metrics/{{requiredMetricName}}',
+                    'templated': True
+                },
+                'prometheus': {
+                    'self': f'{self.config.get_host_url()}/actuator/prometheus',
+                    'templated': False
+                },
+                'shutdown': {
+                    'self': f'{self.config.get_host_url()}/actuator/shutdown',
+                    'templated': False
+                }
+            }
+        ), CONTENT_TYPE)
+        self._status = CachedBody(dumps({'status':'UP'}), CONTENT_TYPE)
 
         @app.route('/actuator')
         def actuator():
-            return Response(dumps(
-                {
-                    '_links': {
-                        'self': f'{self.config.get_host_url()}/actuator',
-                        'templated': False
-                    },
-                    'health': {
-                        'self': f'{self.config.get_host_url()}{self.config.get_health_check_path()}',
-                        'templated': False
-                    },
-                    'info': {
-                        'self': f'{self.config.get_host_url()}{self.config.get_status_page_path()}',
-                        'templated': False
-                    },
-                    'logfile': {
-                        'self': f'{self.config.get_host_url()}/actuator/logfile',
-                        'templated': False
-                    },
-                    'loggers': {
-                        'self': f'{self.config.get_host_url()}/actuator/loggers',
-                        'templated': False
-                    },
-                    'env': {
-                        'self': f'{self.config.get_host_url()}/actuator/env',
-                        'templated': False
-                    },
-                    'shutdown': {
-                        'self': f'{self.config.get_host_url()}/actuator/shutdown',
-                        'templated': False
-                    }
-                }
-            ), mimetype=CONTENT_TYPE)
+            return self._links.response(request)
 
         @app.route(self.config.get_status_page_path())
         def status():
-            return Response(dumps({'status':'UP'}), mimetype=CONTENT_TYPE)
+            return self._status.response(request)
 
         @app.route(self.config.get_health_check_path())
         def health_check():
-            return Response(dumps({'status':'UP', 'details': {'diskSpace': health.get_disk_health('/')}}), mimetype=CONTENT_TYPE)
+            body = self.health.health()
+            return Response(dumps(body), status=health.http_status(body['status']), mimetype=CONTENT_TYPE)
 
         @app.route('/actuator/logfile')
-        def logfile():
-            l = log.get_log()
-            if l is None:
-                print('No log file configured!')
-            return Response(l, mimetype='text/plain')
+        @app.route('/actuator/logfile/<path:name>')
+        def logfile(name=None):
+            try:
+                filename = log.find_log_file(name)
+            except log.LogRetrievalException as exc:
+                return Response(dumps({'error': str(exc)}), status=409, mimetype=CONTENT_TYPE)
+            if filename is None:
+                ring = log.find_memory_handler() if name is None else None
+                if ring is not None:
+                    body = ring.render()
+                    resp = Response(body, mimetype='text/plain')
+                    return resp.make_conditional(request, accept_ranges=True, complete_length=len(body))
+                self.log.warning(f'No log file {name or ""} configured!')
+                return make_response(('', 404))
+            # send_file streams through wsgi.file_wrapper (sendfile where the server supports it) and
+            # answers Range requests, including suffix ranges used to tail the log
+            return send_file(filename, mimetype='text/plain', conditional=True)
 
         @app.route('/actuator/loggers')
         def loggers():
-            return Response(dumps(log.get_loggers()), mimetype=CONTENT_TYPE)
+            version = log.loggers_version()
+            cached = self._loggers_body
+            if cached is None or cached[0] != version:
+                cached = (version, CachedBody(dumps(log.get_loggers()), CONTENT_TYPE))
+                self._loggers_body = cached
+            return cached[1].response(request)
+
+        @app.route('/actuator/loggers/<logger>')
+        def get_logger(logger):
+            config = log.get_logger(logger)
+            if config is None:
+                return make_response(('', 404))
+            return Response(dumps(config), mimetype=CONTENT_TYPE)
 
         @app.route('/actuator/loggers/<logger>', methods=['POST'])
         def set_logger_level(logger):
-            self.log.info(f'Setting log level for {logger} to {request.json["configuredLevel"]}')
-            log.set_logger_level(logger, request.json['configuredLevel'])
+            if log.get_logger(logger) is None:
+                return make_response(('', 404))
+            body = request.get_json(silent=True)
+            if not isinstance(body, dict):
+                return Response(dumps({'error': 'Expected a JSON object with configuredLevel'}), status=400,
+                                mimetype=CONTENT_TYPE)
+            level = body.get('configuredLevel')
+            self.log.info(f'Setting log level for {logger} to {level}')
+            try:
+                log.set_logger_level(logger, level)
+            except log.LogRetrievalException as exc:
+                return Response(dumps({'error': str(exc)}), status=400, mimetype=CONTENT_TYPE)
             return make_response(('', 204))
 
         @app.route('/actuator/env')
         def env():
-            return Response(dumps(runtime.get_runtime(self.config)), mimetype=CONTENT_TYPE)
+            env = runtime.get_runtime(self.config)
+            cached = self._env_body
+            if cached is None or cached[0] is not env:
+                cached = (env, CachedBody(dumps(env), CONTENT_TYPE))
+                self._env_body = cached
+            return cached[1].response(request)
 
         @app.route('/actuator/shutdown', methods=['POST'])
         def shutdown():
-            shutdown_server()
+            if self.shutdown_hook is not None:
+                # the sequence outlives the request, it stops the server through the app rather than the environ
+                self.shutdown_hook()
+            else:
+                shutdown_server()
             return Response(dumps({'message' : 'Shutting down, bye...'}), mimetype=CONTENT_TYPE)
 
         @app.route('/actuator/httptrace')
         def httptrace():
-            traces = { 'traces': [t.render() for t in self.traces] }
-            return Response(dumps(traces), mimetype=CONTENT_TYPE)
-
-
+            try:
+                selected = self.traces.query(limit=request.args.get('limit', type=int),
+                                             since=request.args.get('since'),
+                                             path=request.args.get('path'),
+                                             status=request.args.get('status'))
+            except ValueError as exc:
+                return Response(dumps({'error': f'Invalid httptrace filter: {str(exc)}'}), status=400,
+                                mimetype=CONTENT_TYPE)
+            traces = { 'traces': [t.render() for t in selected] }
+            return compressed(dumps(traces), request, CONTENT_TYPE)
+
+        @app.route('/actuator/metrics')
+        def metrics():
+            return Response(dumps({'names': self.metrics.view().names()}), mimetype=CONTENT_TYPE)
+
+        @app.route('/actuator/metrics/<name>')
+        def metric(name):
+            if name != HTTP_SERVER_REQUESTS:
+                return make_response(('', 404))
+            try:
+                tags = [tuple(tag.split(':', 1)) for tag in request.args.getlist('tag')]
+                if any(len(tag) != 2 for tag in tags):
+                    raise ValueError('tags must be given as tag=name:value')
+                body = self.metrics.view().render(tags)
+            except ValueError as exc:
+                return Response(dumps({'error': str(exc)}), status=400, mimetype=CONTENT_TYPE)
+            return compressed(dumps(body), request, CONTENT_TYPE)
+
+        @app.route('/actuator/prometheus')
+        def prometheus_scrape():
+            # the exporter returns the same bytes until it renders again
+            scrape = self.prometheus.scrape()
+            cached = self._prometheus_body
+            if cached is None or cached[0] is not scrape:
+                cached = (scrape, CachedBody(scrape, prometheus.CONTENT_TYPE))
+                self._prometheus_body = cached
+            return cached[1].response(request)
@@ -1,16 +1,29 @@
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from threading import RLock
+from typing import Callable, Dict, Tuple
+import logging
 import os
+import time
 
 THRESHOLD = 10485760
+MAX_WORKERS = 4
+TIMEOUT = 5.0
+TTL = 5.0
 
-def get_disk_health(path):
+# Spring's default status order, most severe first, statuses it doesn't know sort last
+STATUS_ORDER = ('DOWN', 'OUT_OF_SERVICE', 'UP', 'UNKNOWN')
+# statuses answered with 503 Service Unavailable
+UNAVAILABLE = ('DOWN', 'OUT_OF_SERVICE')
+
+def get_disk_health(path, threshold=THRESHOLD):
     res = os.statvfs(path)
-    if res.f_frsize*res.f_bavail < THRESHOLD:
+    if res.f_frsize*res.f_bavail < threshold:
         return {
             'status': 'DOWN',
             'details': {
                 'total': res.f_frsize * res.f_blocks,
                 'free': res.f_frsize * res.f_bavail,
-                'threshold': THRESHOLD
+                'threshold': threshold
             }
         }
 
@@ -19,6 +32,132 @@ def get_disk_health(path):
         'details': {
             'total': res.f_frsize*res.f_blocks,
             'free': res.f_frsize*res.f_bavail,
-            'threshold': THRESHOLD
+            'threshold': threshold
         }
     }
+
+
+def aggregate_status(statuses) -> str:
+    """The most severe of the statuses in Spring's order, UNKNOWN when there are none
+    """
+    rank = {status: i for i, status in enumerate(STATUS_ORDER)}
+    return min(statuses, key=lambda s: rank.get(s, len(STATUS_ORDER)), default='UNKNOWN')
+
+
+def http_status(status: str) -> int:
+    return 503 if status in UNAVAILABLE else 200
+
+
+def _down(error: str) -> Dict:
+    return {'status': 'DOWN', 'details': {'error': error}}
+
+
+def _normalise(result) -> Dict:
+    """Checks may return a health dict, a status string or a bool
+    """
+    if isinstance(result, bool):
+        return {'status': 'UP' if result else 'DOWN'}
+    if isinstance(result, str):
+        return {'status': result}
+    if isinstance(result, dict) and 'status' in result:
+        return result
+    return _down(f'Invalid health check result {result!r}')
+
+
+class _Check:
+    __slots__ = ('name', 'function', 'timeout', 'ttl', 'result', 'checked_at', 'future')
+
+    def __init__(self, name: str, function: Callable, timeout: float, ttl: float):
+        self.name = name
+        self.function = function
+        self.timeout = timeout
+        self.ttl = ttl
+        self.result = None
+        self.checked_at = 0.0
+        self.future = None
+
+
+class HealthRegistry:
+    """Named health checks, run concurrently on a bounded thread pool.
+
+    A result is reused for ttl seconds. A check that doesn't answer within its timeout is reported DOWN, it
+    isn't started again while it is still running and its result is cached once it finishes, so slow
+    dependencies aren't hit harder the more often health is polled.
+    """
+
+    def __init__(self, max_workers: int = MAX_WORKERS, timeout: float = TIMEOUT, ttl: float = TTL):
+        self.log = logging.getLogger(__name__)
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.ttl = ttl
+        self._checks = {}
+        self._executor = None
+        # reentrant, a future that is already done runs its callback as soon as it is added
+        self._lock = RLock()
+
+    def register(self, name: str, function: Callable, timeout: float = None, ttl: float = None):
+        """Adds a check, a callable returning a dict with a status and optional details, a status or a bool.
+        Exceptions it raises are reported as DOWN.
+        """
+        with self._lock:
+            self._checks[name] = _Check(name, function, self.timeout if timeout is None else timeout,
+                                        self.ttl if ttl is None else ttl)
+
+    def unregister(self, name: str):
+        with self._lock:
+            self._checks.pop(name, None)
+
+    def names(self):
+        return list(self._checks)
+
+    def _run(self, check: _Check) -> Dict:
+        try:
+            return _normalise(check.function())
+        except Exception as exc:
+            self.log.warning(f'Health check {check.name} failed: {str(exc)}')
+            return _down(f'{exc.__class__.__name__}: {str(exc)}')
+
+    def _done(self, check: _Check, future):
+        with self._lock:
+            check.result = future.result()
+            check.checked_at = time.monotonic()
+            check.future = None
+
+    def _submit(self, check: _Check):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix='solenoid-health')
+        future = self._executor.submit(self._run, check)
+        check.future = future
+        future.add_done_callback(lambda f: self._done(check, f))
+        return future
+
+    def check_all(self) -> Tuple[str, Dict[str, Dict]]:
+        """Aggregate status and the result of every check
+        """
+        start = time.monotonic()
+        results = {}
+        pending = []
+        with self._lock:
+            checks = list(self._checks.values())
+            for check in checks:
+                if check.result is not None and start - check.checked_at < check.ttl:
+                    results[check.name] = check.result
+                else:
+                    pending.append((check, check.future or self._submit(check)))
+        for check, future in pending:
+            try:
+                results[check.name] = future.result(max(0.0, start + check.timeout - time.monotonic()))
+            except TimeoutError:
+                self.log.warning(f'Health check {check.name} timed out after {check.timeout}s')
+                results[check.name] = _down(f'Timed out after {check.timeout}s')
+        results = {check.name: results[check.name] for check in checks}
+        return aggregate_status(r['status'] for r in results.values()), results
+
+    def health(self) -> Dict:
+        status, results = self.check_all()
+        return {'status': status, 'details': results}
+
+    def shutdown(self):
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
@@ -1,8 +1,18 @@
+import copy
 import logging
-from typing import Dict
+import logging.handlers
+import os
+import queue
+from collections import deque
+from typing import Dict, List
+
+RING_MAX_BYTES = 1048576
+# approximate fixed cost of a log record on top of its message
+RECORD_OVERHEAD = 500
 
 levels = [
     'OFF',
+    'FATAL',
     'ERROR',
     'WARN',
     'INFO',
@@ -10,6 +20,7 @@ levels = [
 ]
 
 levelMap = {
+    logging.CRITICAL: 'FATAL',
     logging.ERROR: 'ERROR',
     logging.WARNING: 'WARN',
     logging.INFO: 'INFO',
@@ -18,6 +29,7 @@ levelMap = {
 }
 
 reverseMap = {
+    'FATAL': logging.CRITICAL,
     'ERROR': logging.ERROR,
     'WARN': logging.WARNING,
     'INFO': logging.INFO,
@@ -30,63 +42,218 @@ class LogRetrievalException(Exception):
     pass
 
 
+_listeners = []
+
+
+class MemoryRingHandler(logging.Handler):
+    """Keeps the most recent log records in memory, bounded by an approximate size in bytes.
+
+    Records are only formatted when the log is read, and each record is formatted at most once. Messages
+    are rendered against their arguments at read time, so put it behind a QueueHandler (see
+    start_queue_logging) if arguments may be mutated after the logging call.
+    """
+
+    def __init__(self, max_bytes: int = RING_MAX_BYTES, level=logging.NOTSET):
+        super().__init__(level)
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._records = deque()
+
+    def emit(self, record: logging.LogRecord):
+        if record.exc_info:
+            # keep the rendered traceback rather than the traceback and its frames, on a copy so handlers
+            # after this one still see exc_info
+            exc_text = record.exc_text or logging.Formatter().formatException(record.exc_info)
+            record = copy.copy(record)
+            record.exc_info = None
+            record.exc_text = exc_text
+        size = RECORD_OVERHEAD + len(str(record.msg)) + len(record.exc_text or '')
+        with self.lock:
+            self._records.append([record, None, size])
+            self.bytes += size
+            while self.bytes > self.max_bytes and len(self._records) > 1:
+                self.bytes -= self._records.popleft()[2]
+
+    def render(self) -> bytes:
+        with self.lock:
+            entries = list(self._records)
+        lines = []
+        for entry in entries:
+            if entry[1] is None:
+                try:
+                    entry[1] = self.format(entry[0])
+                except Exception:
+                    entry[1] = f'Unable to format log record: {entry[0].msg!r}'
+            lines.append(entry[1])
+        return ('\n'.join(lines) + '\n' if lines else '').encode('utf-8')
+
+    def clear(self):
+        with self.lock:
+            self._records.clear()
+            self.bytes = 0
+
+
+def start_queue_logging(handlers: List[logging.Handler] = None, logger: logging.Logger = None):
+    """Moves the handlers of a logger (root by default) behind a QueueHandler so logging calls only enqueue
+    records and a QueueListener thread does any disk I/O. Returns the started listener.
+    """
+    logger = logger if logger is not None else logging.getLogger()
+    handlers = list(logger.handlers) if handlers is None else handlers
+    for h in handlers:
+        logger.removeHandler(h)
+    records = queue.Queue(-1)
+    logger.addHandler(logging.handlers.QueueHandler(records))
+    listener = logging.handlers.QueueListener(records, *handlers, respect_handler_level=True)
+    listener.start()
+    _listeners.append(listener)
+    return listener
+
+
+def _root_handlers() -> List[logging.Handler]:
+    handlers = list(logging.getLogger().handlers)
+    for listener in _listeners:
+        handlers.extend(listener.handlers)
+    return handlers
+
+
+def find_memory_handler():
+    """The last MemoryRingHandler added to the root logger, directly or behind a queue
+    """
+    for h in reversed(_root_handlers()):
+        if isinstance(h, MemoryRingHandler):
+            return h
+    return None
+
+
+def _find_basefilenames() -> List[str]:
+    """Finds the base filenames of all file handlers on the root logger (including handlers moved behind a
+    queue by start_queue_logging), in the order they were added
+    """
+    log_files = []
+    for h in _root_handlers():
+        if isinstance(h, logging.FileHandler) and h.baseFilename not in log_files:
+            log_files.append(h.baseFilename)
+    return log_files
+
+
 def _find_basefilename():
-    """Finds the logger base filename(s) currently there is only one
+    """Finds the logger base filename served by default, the last file handler added to the root logger
     """
-    log_file = None
-    root = logging.getLogger()
-    for h in root.__dict__['handlers']:
-        if h.__class__.__name__ in ('TimedRotatingFileHandler','RotatingFileHandler','FileHandler'):
-            log_file = h.baseFilename
+    log_files = _find_basefilenames()
+    return log_files[-1] if log_files else None
 
-    return log_file
 
+def find_log_file(name: str = None):
+    """Path of the named log file, or the default log file when name is None. Files are named by their basename
+    or their full path (the leading / is optional), a basename shared by several files raises LogRetrievalException
+    """
+    if name is None:
+        return _find_basefilename()
+    filenames = _find_basefilenames()
+    for filename in filenames:
+        if filename.lstrip('/') == name.lstrip('/'):
+            return filename
+    matches = [filename for filename in filenames if os.path.basename(filename) == name]
+    if len(matches) > 1:
+        raise LogRetrievalException(f'Log file name {name} is ambiguous, use one of {", ".join(matches)}')
+    return matches[0] if matches else None
 
-def get_log() -> str:
-    filename = _find_basefilename()
-    if filename is None:
-        return None
-    with open(filename) as log:
-        return log.read()
 
+_loggers_cache = None
+_generation = 0
+_placeholders_replaced = 0
+_fixup_children = logging.Manager._fixupChildren
 
-def _logger_config(name: str, logger: logging.Logger) -> Dict[str,Dict[str,str]]:
+
+def _count_fixup_children(manager, placeholder, logger):
+    # called by Manager.getLogger, under the logging lock, when a logger takes over a PlaceHolder
+    global _placeholders_replaced
+    _placeholders_replaced += 1
+    _fixup_children(manager, placeholder, logger)
+
+
+logging.Manager._fixupChildren = _count_fixup_children
+
+
+def _level_name(level: int) -> str:
+    name = levelMap.get(level)
+    return name if name is not None else logging.getLevelName(level)
+
+
+def _logger_config(logger: logging.Logger) -> Dict[str, str]:
     return {
-        name: {
-            'configuredLevel': levelMap[logger.getEffectiveLevel()],
-            'effectiveLevel': levelMap[logger.getEffectiveLevel()]
-        }
+        'configuredLevel': _level_name(logger.level) if logger.level != logging.NOTSET else None,
+        'effectiveLevel': _level_name(logger.getEffectiveLevel())
     }
 
 
+def _root_config() -> Dict[str, str]:
+    root = logging.getLogger()
+    return {
+        'configuredLevel': _level_name(root.level),
+        'effectiveLevel': _level_name(root.getEffectiveLevel())
+    }
+
+
+def loggers_version():
+    """Changes whenever a logger is added or set_logger_level changes a level. A new logger either adds an entry
+    to loggerDict or replaces the PlaceHolder a child left for it, which _fixupChildren counts, so no scan is needed
+    """
+    return len(logging.Logger.manager.loggerDict), _placeholders_replaced, _generation
+
+
 def get_loggers() -> Dict:
+    """Levels of the root logger and every configured logger.
+
+    Computed once per loggers_version() and shared between calls, so callers must not modify the result.
+    """
+    global _loggers_cache
+    version = loggers_version()
+    cached = _loggers_cache
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
     # add levels and root logger
-    loggers = {'levels':levels, 'loggers': {
-        'ROOT' : {
-            'configuredLevel': levelMap[logging.getLogger().getEffectiveLevel()],
-            'effectiveLevel': levelMap[logging.getLogger().getEffectiveLevel()]
-        }
-    }}
-
-    # get all configured loggers
-    for name, logger in logging.Logger.manager.loggerDict.items():
-        if hasattr(logger, 'getEffectiveLevel'):
-            loggers['loggers'].update(_logger_config(name, logger))
+    loggers = {'levels':levels, 'loggers': {'ROOT': _root_config()}}
+
+    # get all configured loggers, placeholders for parents of named loggers have no level
+    for name, logger in list(logging.Logger.manager.loggerDict.items()):
+        if isinstance(logger, logging.Logger):
+            loggers['loggers'][name] = _logger_config(logger)
 
+    _loggers_cache = (version, loggers)
     return loggers
 
 
+def get_logger(name: str) -> Dict[str, str]:
+    """Levels of a single logger, None when no such logger exists
+    """
+    if name == 'ROOT':
+        return _root_config()
+    logger = logging.Logger.manager.loggerDict.get(name)
+    if not isinstance(logger, logging.Logger):
+        return None
+    return _logger_config(logger)
+
+
 def set_logger_level(logger: str, level: str):
+    """Sets the level of a logger, a level of None makes a logger inherit its parent's level again
+    """
+    global _generation
     log = logging.getLogger(__name__)
+    if level is not None and level not in reverseMap:
+        raise LogRetrievalException(f'Unknown level {level}')
+    value = reverseMap[level] if level is not None else logging.NOTSET
     if logger == 'ROOT':
         log.debug('Setting level for root logger')
-        logging.getLogger().setLevel(reverseMap[level])
+        logging.getLogger().setLevel(value)
+        _generation += 1
         return
 
-    if logger not in logging.Logger.manager.loggerDict:
+    if not isinstance(logging.Logger.manager.loggerDict.get(logger), logging.Logger):
         log.error(f'No logger {logger} is defined')
         raise LogRetrievalException(f'Could find logger {logger} is defined set of logs')
 
-    log.debug('Returning logger from ')
-    logging.Logger.manager.loggerDict[logger].setLevel(reverseMap[level])
-
+    log.debug(f'Setting level for logger {logger}')
+    logging.Logger.manager.loggerDict[logger].setLevel(value)
+    _generation += 1
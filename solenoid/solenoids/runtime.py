@@ -1,27 +1,101 @@
 import platform, sys, socket
+import re
+import threading
+from typing import Any, Dict, Iterator, Tuple
 from solenoid.config import ServiceConfig
 
-#TODO needs to be depth first traversal to capture a.b.c config props
-def _config(key, value):
+_static_sources = None
+_host_info = None
+_host_info_ready = threading.Event()
+_host_info_started = False
+_env_cache = None
+# how long an env request waits for the host address before answering without it
+HOST_INFO_TIMEOUT = 1.0
+# keys whose values are masked, as Spring Boot's Sanitizer does
+SANITIZE_KEYS = re.compile(r'(password|secret|key|token)$|credential', re.IGNORECASE)
+SANITIZED = '******'
+
+
+def flatten(value: Any, prefix: str = '') -> Iterator[Tuple[str, Any]]:
+    """Depth first traversal of a nested config yielding a.b.c keys for mappings and a[0] for lists,
+    empty mappings and lists are yielded as values
+    """
+    if isinstance(value, dict) and value:
+        for k, v in value.items():
+            yield from flatten(v, f'{prefix}.{k}' if prefix else str(k))
+    elif isinstance(value, (list, tuple)) and value:
+        for i, v in enumerate(value):
+            yield from flatten(v, f'{prefix}[{i}]')
+    elif prefix:
+        yield prefix, value
+
+
+def sanitize(key: str, value: Any) -> Any:
+    """The value, masked if the key looks like it holds a password, secret, key, token or credentials
+    """
+    return SANITIZED if value is not None and SANITIZE_KEYS.search(re.sub(r'\[\d+\]', '', key)) else value
+
+
+def _config(key, value, origin='Python dictionary config'):
     return {
         key: {
             'value': value,
-            'origin': 'Python dictionary config'
+            'origin': origin
         }
     }
 
-def get_runtime(config: ServiceConfig):
-    env = {
-        'activeProfiles': [],
-        'propertySources': [
-            {
-                "name": "server.ports",
-                "properties": {
-                    "local.server.port": {
-                        "value": config.get_port()
-                    }
-                }
+
+def _config_properties(config: ServiceConfig) -> Dict:
+    if config.fileConfig is not None:
+        source, origin = config.fileConfig, config.configfile or 'Python dictionary config'
+    else:
+        source, origin = dict(config.get_service_metadata(), options=config._config().options), 'ServiceConfig'
+    properties = {}
+    for key, value in flatten(source):
+        properties.update(_config(key, sanitize(key, value), origin))
+    return {
+        'name': f'applicationConfig: [{origin}]',
+        'properties': properties
+    }
+
+
+def _make_host_info(address):
+    return {
+        "name": "springCloudClientHostInfo",
+        "properties": {
+            "spring.cloud.client.hostname": {
+                "value": platform.node()
             },
+            "spring.cloud.client.ip-address": {
+                "value": address
+            }
+        }
+    }
+
+
+def _resolve_host_info():
+    global _host_info
+    try:
+        address = socket.gethostbyname(socket.gethostname())
+    except (OSError, UnicodeError):
+        address = None
+    _host_info = _make_host_info(address)
+    _host_info_ready.set()
+
+
+def preload():
+    """Starts resolving the host address in the background so the first env request doesn't wait on DNS
+    """
+    global _host_info_started
+    if not _host_info_started:
+        _host_info_started = True
+        threading.Thread(target=_resolve_host_info, name='solenoid-host-info', daemon=True).start()
+
+
+def _get_static_sources():
+    global _static_sources
+    if _static_sources is None:
+        _static_sources = [
             {
                 'name': 'systemProperties',
                 'properties': {
@@ -56,21 +130,44 @@ def get_runtime(config: ServiceConfig):
                         'origin': 'sys module'
                     }
                 }
-            },
+            }
+        ]
+    return _static_sources
+
+
+def get_runtime(config: ServiceConfig):
+    """The env document for a config. Nothing in it changes while the process runs, so it is built once per
+    loaded config and the same object is returned after that
+    """
+    global _env_cache
+    cached = _env_cache
+    if cached is not None and cached[0] is config.resolved:
+        return cached[1]
+    if not _host_info_ready.is_set():
+        preload()
+        _host_info_ready.wait(HOST_INFO_TIMEOUT)
+    # while DNS hangs the env is answered without the address and not cached, so a later request picks it up
+    resolved = _host_info_ready.is_set()
+    host_info = _host_info if resolved else _make_host_info(None)
+    env = {
+        'activeProfiles': [],
+        'propertySources': [
             {
-                "name": "springCloudClientHostInfo",
+                "name": "server.ports",
                 "properties": {
-                    "spring.cloud.client.hostname": {
-                        "value": platform.node()
-                    },
-                    "spring.cloud.client.ip-address": {
-                        "value": socket.gethostbyname(socket.gethostname())
+                    "local.server.port": {
+                        "value": config.get_port()
                     }
                 }
             },
+            *_get_static_sources(),
+            host_info,
+            _config_properties(config),
             {
                 "name": "defaultProperties",
                 "properties": {}
             }
         ]}
+    if resolved:
+        _env_cache = (config.resolved, env)
     return env
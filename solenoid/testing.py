@@ -0,0 +1,313 @@
+from collections import Counter, deque
+from fnmatch import fnmatchcase
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from typing import Dict, List, Optional
+from urllib.parse import parse_qsl, urlsplit, unquote
+import copy
+import json
+import logging
+import random
+import socket
+import struct
+import time
+
+from solenoid.config import DiscoveryServer
+
+SERVICE_PATH = '/eureka/apps'
+# how long changes are reported by /delta, Eureka's default retention is 3 minutes
+DELTA_RETENTION = 180.0
+SLOW_BODY_CHUNKS = 10
+
+
+class Faults:
+    """Faults injected into the requests of a FakeEurekaServer whose path matches one of paths (all by default).
+
+    latency seconds (plus up to latency_jitter more) are waited before answering, a fraction error_rate of
+    requests get error_status, reset_rate of them have their connection reset without any response, and
+    bodies are trickled out over slow_body seconds. The attributes can be changed while the server runs.
+    """
+
+    def __init__(self, latency: float = 0.0, latency_jitter: float = 0.0, error_rate: float = 0.0,
+                 error_status: int = 503, reset_rate: float = 0.0, slow_body: float = 0.0, paths: List[str] = None):
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.reset_rate = reset_rate
+        self.slow_body = slow_body
+        self.paths = paths
+
+    def applies(self, path: str) -> bool:
+        return self.paths is None or any(fnmatchcase(path, pattern) for pattern in self.paths)
+
+
+def simulated_instance(app: str, n: int, status: str = 'UP') -> Dict:
+    """An instance document like the ones Eureka returns
+    """
+    return {
+        'instanceId': f'{app.lower()}-{n}:{8000 + n % 1000}',
+        'hostName': f'{app.lower()}-{n}.local',
+        'app': app.upper(),
+        'ipAddr': f'10.{n // 65536 % 256}.{n // 256 % 256}.{n % 256}',
+        'vipAddress': app.lower(),
+        'secureVipAddress': app.lower(),
+        'status': status,
+        'port': {'$': 8000 + n % 1000, '@enabled': 'true'},
+        'securePort': {'$': 443, '@enabled': 'false'},
+        'homePageUrl': f'http://{app.lower()}-{n}.local:{8000 + n % 1000}/',
+        'statusPageUrl': f'http://{app.lower()}-{n}.local:{8000 + n % 1000}/info',
+        'healthCheckUrl': f'http://{app.lower()}-{n}.local:{8000 + n % 1000}/health',
+        'dataCenterInfo': {'@class': 'com.netflix.appinfo.InstanceInfo$DefaultDataCenterInfo', 'name': 'MyOwn'},
+        'leaseInfo': {'renewalIntervalInSecs': 30, 'durationInSecs': 90},
+        'metadata': {'@class': 'java.util.Collections$EmptyMap'}
+    }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'FakeEureka/1.0'
+
+    def log_message(self, format, *args):
+        self.server.fake.log.debug(format % args)
+
+    def finish(self):
+        try:
+            super().finish()
+        except OSError:
+            pass
+
+    def _dispatch(self):
+        fake = self.server.fake
+        url = urlsplit(self.path)
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        faults = fake.faults
+        if faults.applies(url.path):
+            if faults.latency or faults.latency_jitter:
+                time.sleep(faults.latency + random.uniform(0, faults.latency_jitter))
+            if faults.reset_rate and random.random() < faults.reset_rate:
+                fake.count('reset')
+                self._reset()
+                return
+            if faults.error_rate and random.random() < faults.error_rate:
+                fake.count('error')
+                self._send(faults.error_status, None)
+                return
+        status, document = fake.handle(self.command, unquote(url.path), dict(parse_qsl(url.query)), body)
+        self._send(status, document, faults.slow_body if faults.applies(url.path) else 0.0)
+
+    def _reset(self):
+        # SO_LINGER with a zero timeout makes close send a RST instead of a FIN
+        self.connection.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+        self.close_connection = True
+        self.connection.close()
+
+    def _send(self, status: int, document, slow_body: float = 0.0):
+        payload = json.dumps(document).encode('utf-8') if document is not None else b''
+        self.send_response(status)
+        if payload:
+            self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        if not payload or self.command == 'HEAD':
+            return
+        if slow_body > 0:
+            step = max(1, len(payload) // SLOW_BODY_CHUNKS)
+            for start in range(0, len(payload), step):
+                self.wfile.write(payload[start:start + step])
+                self.wfile.flush()
+                time.sleep(slow_body / SLOW_BODY_CHUNKS)
+        else:
+            self.wfile.write(payload)
+
+    do_GET = do_POST = do_PUT = do_DELETE = _dispatch
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+    def handle_error(self, request, client_address):
+        self.fake.log.debug(f'Error handling request from {client_address}', exc_info=True)
+
+
+class FakeEurekaServer:
+    """An in-process Eureka server for tests and load tests, implementing the REST API EurekaClient uses:
+    registration, heartbeats, status and metadata changes, deregistration, and full, delta, application and
+    instance queries, with faults injected through `faults`.
+
+    Counts of requests per operation (and of injected faults) are kept in `requests`.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, service_path: str = SERVICE_PATH,
+                 faults: Faults = None, delta_retention: float = DELTA_RETENTION):
+        self.log = logging.getLogger(__name__)
+        self.service_path = service_path.rstrip('/')
+        self.faults = faults if faults is not None else Faults()
+        self.delta_retention = delta_retention
+        self.apps = {}
+        self.requests = Counter()
+        self._changes = deque()
+        self._lock = Lock()
+        self._server = _Server((host, port), _Handler)
+        self._server.fake = self
+        self._thread = None
+
+    @property
+    def host(self) -> str:
+        return self._server.server_address[0]
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    @property
+    def url(self) -> str:
+        return f'http://{self.host}:{self.port}{self.service_path}'
+
+    def discovery_server(self) -> DiscoveryServer:
+        return DiscoveryServer(self.host, self.port, False, self.service_path)
+
+    def start(self) -> 'FakeEurekaServer':
+        if self._thread is None:
+            self._thread = Thread(target=self._server.serve_forever, name='fake-eureka', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread is not None:
+            self._server.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def count(self, operation: str):
+        with self._lock:
+            self.requests[operation] += 1
+
+    # registry
+
+    def _change(self, instance: Dict, action: str):
+        changed = copy.deepcopy(instance)
+        changed['actionType'] = action
+        now = time.time()
+        self._changes.append((now, changed))
+        while self._changes and self._changes[0][0] < now - self.delta_retention:
+            self._changes.popleft()
+
+    def add_instance(self, instance: Dict) -> Dict:
+        """Registers an instance document directly, without a request
+        """
+        with self._lock:
+            return self._add(instance)
+
+    def _add(self, instance: Dict) -> Dict:
+        instance = dict(instance)
+        instance['app'] = instance['app'].upper()
+        instance.setdefault('status', 'UP')
+        instance['lastUpdatedTimestamp'] = instance['lastDirtyTimestamp'] = str(int(time.time() * 1000))
+        instance['actionType'] = 'ADDED'
+        self.apps.setdefault(instance['app'], {})[instance['instanceId']] = instance
+        self._change(instance, 'ADDED')
+        return instance
+
+    def populate(self, instances: int, apps: int = 1, prefix: str = 'SIMULATED'):
+        """Registers `instances` simulated instances spread over `apps` applications
+        """
+        with self._lock:
+            for n in range(instances):
+                self._add(simulated_instance(f'{prefix}-{n % apps}', n))
+
+    def instance(self, app: str, instance_id: str) -> Optional[Dict]:
+        return self.apps.get(app.upper(), {}).get(instance_id)
+
+    def hashcode(self) -> str:
+        counts = Counter(i['status'] for instances in self.apps.values() for i in instances.values())
+        return ''.join(f'{status}_{counts[status]}_' for status in sorted(counts))
+
+    def _applications(self, apps: Dict[str, List[Dict]]) -> Dict:
+        return {
+            'applications': {
+                'versions__delta': '1',
+                'apps__hashcode': self.hashcode(),
+                'application': [{'name': name, 'instance': instances} for name, instances in apps.items()]
+            }
+        }
+
+    def handle(self, method: str, path: str, params: Dict[str, str], body: bytes):
+        """Answers a request as (status, document)
+        """
+        if not path.startswith(self.service_path):
+            return 404, None
+        parts = [p for p in path[len(self.service_path):].split('/') if p]
+        with self._lock:
+            if not parts and method == 'GET':
+                self.requests['registry'] += 1
+                return 200, self._applications({name: list(instances.values())
+                                                for name, instances in self.apps.items() if instances})
+            if parts == ['delta'] and method == 'GET':
+                self.requests['delta'] += 1
+                changes = {}
+                for _, instance in self._changes:
+                    changes.setdefault(instance['app'], []).append(instance)
+                return 200, self._applications(changes)
+            app = parts[0].upper()
+            if len(parts) == 1:
+                if method == 'POST':
+                    self.requests['register'] += 1
+                    try:
+                        instance = json.loads(body.decode('utf-8'))['instance']
+                        instance['app'] = instance.get('app') or app
+                        self._add(instance)
+                    except (ValueError, KeyError, TypeError):
+                        return 400, None
+                    return 204, None
+                if method == 'GET':
+                    self.requests['query'] += 1
+                    instances = self.apps.get(app)
+                    if not instances:
+                        return 404, None
+                    return 200, {'application': {'name': app, 'instance': list(instances.values())}}
+                return 405, None
+            instance = self.apps.get(app, {}).get(parts[1])
+            if len(parts) == 2:
+                if method == 'PUT':
+                    self.requests['heartbeat'] += 1
+                    if instance is None:
+                        return 404, None
+                    instance['lastUpdatedTimestamp'] = str(int(time.time() * 1000))
+                    return 200, None
+                if method == 'DELETE':
+                    self.requests['deregister'] += 1
+                    if instance is None:
+                        return 404, None
+                    del self.apps[app][parts[1]]
+                    self._change(instance, 'DELETED')
+                    return 200, None
+                if method == 'GET':
+                    self.requests['query'] += 1
+                    return (200, {'instance': instance}) if instance is not None else (404, None)
+                return 405, None
+            if instance is None:
+                return 404, None
+            if parts[2] == 'status' and method in ('PUT', 'DELETE'):
+                self.requests['status'] += 1
+                instance['status'] = params.get('value', 'UP') if method == 'PUT' else 'UP'
+                instance['actionType'] = 'MODIFIED'
+                self._change(instance, 'MODIFIED')
+                return 200, None
+            if parts[2] == 'metadata' and method == 'PUT':
+                self.requests['metadata'] += 1
+                metadata = instance.setdefault('metadata', {})
+                metadata.update(params)
+                instance['actionType'] = 'MODIFIED'
+                self._change(instance, 'MODIFIED')
+                return 200, None
+            return 404, None
@@ -0,0 +1,234 @@
+from fnmatch import fnmatchcase, translate
+from threading import Lock
+from typing import Dict, List, Sequence
+from flask import Flask, g, request, session
+import datetime
+import logging
+import random
+import re
+import time
+
+# approximate fixed cost of a trace record on top of its strings
+TRACE_OVERHEAD = 400
+
+
+class Trace:
+    __slots__ = ('timestamp', 't1', 't2', 'path', 'principal', 'ipaddr', 'scheme', 'referrer', 'method',
+                 'content_type', 'authorization', 'url', 'status', 'resp_headers', 'session_id', 'size', '_rendered')
+
+    def __init__(self, req, sess):
+        self.timestamp = time.time()
+        self.t1 = time.perf_counter()
+        self.t2 = self.t1
+        self.path = req.path
+        self.principal = req.remote_user
+        self.ipaddr = req.remote_addr
+        self.scheme = req.scheme
+        self.referrer = req.referrer
+        self.method = req.method
+        self.content_type = req.content_type
+        self.authorization = None
+        self.url = req.url
+        self.status = None
+        self.resp_headers = ()
+        self.session_id = sess.sid if hasattr(sess, 'sid') else None
+        self.size = 0
+        self._rendered = None
+
+    def _req_header(self, req):
+        if 'Authorization' in req.headers: self.authorization = req.headers['Authorization']
+
+    def complete(self, resp):
+        self.t2 = time.perf_counter()
+        self.status = resp.status_code
+        self.resp_headers = tuple(resp.headers.items())
+        self._measure()
+
+    def complete_exc(self):
+        self.t2 = time.perf_counter()
+        self.status = 500
+        self.resp_headers = ()
+        self._measure()
+
+    def _measure(self):
+        size = TRACE_OVERHEAD + len(self.url) + len(self.path)
+        for k, v in self.resp_headers:
+            size += len(k) + len(v)
+        self.size = size
+
+    def render(self) -> Dict:
+        """Renders the trace in the Spring Boot httptrace format, the result is cached once the trace is complete
+        """
+        if self._rendered is not None:
+            return self._rendered
+        req_headers = {'Accept': self.content_type}
+        if self.authorization is not None:
+            req_headers['Authorization'] = self.authorization
+        trace = {
+            'timestamp': datetime.datetime.fromtimestamp(self.timestamp).isoformat('T'),
+            'request': {
+                'method': self.method,
+                'uri': self.url,
+                'headers': req_headers
+            },
+            'response': {
+                'status': self.status,
+                'headers': dict(self.resp_headers)
+            },
+            'timeTaken': self.t2-self.t1
+        }
+        if self.principal is not None:
+            trace['principal'] = {'name': self.principal}
+        if self.session_id is not None:
+            trace['session'] = {'id': self.session_id}
+        if self.status is not None:
+            self._rendered = trace
+        return trace
+
+
+def _parse_since(since) -> float:
+    """since as epoch milliseconds or an ISO-8601 timestamp, returned as epoch seconds
+    """
+    try:
+        return float(since) / 1000.0
+    except ValueError:
+        return datetime.datetime.fromisoformat(since).timestamp()
+
+
+def _status_matcher(status: str):
+    status = str(status).lower()
+    if len(status) == 3 and status.endswith('xx'):
+        cls = int(status[0])
+        return lambda code: code is not None and code // 100 == cls
+    code = int(status)
+    return lambda c: c == code
+
+
+class TraceBuffer:
+    """Fixed size ring buffer of traces bounded both by count and by approximate size in bytes.
+
+    The slots are allocated up front, appending overwrites the oldest trace and evicts further traces
+    while the total size is above max_bytes.
+    """
+
+    def __init__(self, capacity: int = 100, max_bytes: int = None):
+        if capacity < 1:
+            raise ValueError('trace capacity must be at least 1')
+        self.capacity = capacity
+        self.max_bytes = max_bytes
+        self._slots = [None] * capacity
+        self._head = 0
+        self._count = 0
+        self.bytes = 0
+        self._lock = Lock()
+
+    def append(self, trace: Trace):
+        with self._lock:
+            if self._count == self.capacity:
+                self._evict()
+            self._slots[(self._head + self._count) % self.capacity] = trace
+            self._count += 1
+            self.bytes += trace.size
+            if self.max_bytes is not None:
+                while self.bytes > self.max_bytes and self._count > 1:
+                    self._evict()
+
+    def _evict(self):
+        oldest = self._slots[self._head]
+        self._slots[self._head] = None
+        self._head = (self._head + 1) % self.capacity
+        self._count -= 1
+        self.bytes -= oldest.size
+
+    def clear(self):
+        with self._lock:
+            self._slots = [None] * self.capacity
+            self._head = 0
+            self._count = 0
+            self.bytes = 0
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        with self._lock:
+            head, count, slots = self._head, self._count, self._slots
+            snapshot = [slots[(head + i) % self.capacity] for i in range(count)]
+        return iter(snapshot)
+
+    def query(self, limit: int = None, since=None, path: str = None, status=None) -> List[Trace]:
+        """Traces oldest first, filtered by start time, path (a glob pattern) and status (e.g. 404 or 4xx),
+        limited to the most recent `limit` matches
+        """
+        traces = list(self)
+        if since is not None:
+            start = _parse_since(since)
+            traces = [t for t in traces if t.timestamp >= start]
+        if path is not None:
+            traces = [t for t in traces if fnmatchcase(t.path, path)]
+        if status is not None:
+            matches = _status_matcher(status)
+            traces = [t for t in traces if matches(t.status)]
+        if limit is not None:
+            traces = traces[-limit:] if limit > 0 else []
+        return traces
+
+
+def _patterns(globs: Sequence[str]):
+    if not globs:
+        return None
+    if isinstance(globs, str):
+        globs = [globs]
+    return re.compile('|'.join(f'(?:{translate(glob)})' for glob in globs))
+
+
+class Tracer:
+    """Captures traces for the whole app from before/after/teardown request hooks.
+
+    Requests to endpoints registered with always_trace are traced, any other request is traced with
+    probability sample_rate if its path matches one of the include globs (when given) and none of the
+    exclude globs. An unsampled request costs one set lookup and at most one random number.
+    """
+
+    def __init__(self, app: Flask, traces: TraceBuffer, sample_rate: float = 0.0, include: Sequence[str] = None,
+                 exclude: Sequence[str] = None):
+        self.traces = traces
+        self.sample_rate = sample_rate
+        self.include = _patterns(include)
+        self.exclude = _patterns(exclude)
+        self.forced = set()
+        self.log = logging.getLogger(__name__)
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+
+    def always_trace(self, endpoint: str):
+        self.forced.add(endpoint)
+
+    def _sampled(self) -> bool:
+        if request.endpoint in self.forced:
+            return True
+        if self.sample_rate <= 0.0 or (self.sample_rate < 1.0 and random.random() >= self.sample_rate):
+            return False
+        path = request.path
+        if self.include is not None and self.include.match(path) is None:
+            return False
+        return self.exclude is None or self.exclude.match(path) is None
+
+    def _before_request(self):
+        if self._sampled():
+            g._solenoid_trace = Trace(request, session)
+
+    def _after_request(self, response):
+        trace = g.pop('_solenoid_trace', None)
+        if trace is not None:
+            trace.complete(response)
+            self.traces.append(trace)
+        return response
+
+    def _teardown_request(self, exc):
+        trace = g.pop('_solenoid_trace', None)
+        if trace is not None:
+            self.log.debug(f'Request for {trace.path} failed before a response was produced')
+            trace.complete_exc()
+            self.traces.append(trace)
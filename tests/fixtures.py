@@ -0,0 +1,86 @@
+"""Stubs shared between the test modules
+"""
+import logging
+import logging.config
+import os
+import tempfile
+import time
+
+import yaml
+from flask import Flask
+
+from solenoid.config import ClientOptions, DiscoveryServer, Port, ServiceConfig, ServiceMetadata
+from solenoid.solenoid import Solenoid
+from solenoid.traces import Trace, TraceBuffer
+
+SERVICE = ServiceMetadata(instanceId='127.0.0.1:fixture:2020', hostName='localhost', app='fixture',
+                          ipAddr='127.0.0.1', vipAddress='fixture', secureVipAddress='fixture', status='UP',
+                          port=Port(2020, True), securePort=Port(443, False))
+
+
+class StubRequest:
+    def __init__(self, path):
+        self.path = path
+        self.url = f'http://localhost{path}'
+        self.remote_user = None
+        self.remote_addr = '127.0.0.1'
+        self.scheme = 'http'
+        self.referrer = None
+        self.method = 'GET'
+        self.content_type = None
+
+
+class StubResponse:
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.headers = {'Content-Type': 'application/json'}
+
+
+def make_trace(path, status=200):
+    trace = Trace(StubRequest(path), None)
+    trace.complete(StubResponse(status))
+    return trace
+
+
+def service_config(discovery_server: DiscoveryServer = None, **options) -> ServiceConfig:
+    """A configuration for the SERVICE instance, options are added to the client options
+    """
+    client_options = ClientOptions('requests')
+    for name, value in options.items():
+        setattr(client_options, name, value)
+    return ServiceConfig(SERVICE, discovery_server or DiscoveryServer('localhost', 8761, False, '/eureka/apps'),
+                         client_options)
+
+
+def make_solenoid(**options):
+    """A Flask app with the actuator endpoints and no Eureka client, returns (app, solenoid)
+    """
+    app = Flask(__name__)
+    solenoid = Solenoid(service_config(**options), app, TraceBuffer(100))
+    return app, solenoid
+
+
+def wait_for(condition, timeout: float = 5.0) -> bool:
+    """Polls condition until it holds or timeout seconds have passed, returns its last value
+    """
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def setup_logging(default_path: str = 'logging.yaml', default_level=logging.DEBUG, env_key: str = 'LOG_CFG'):
+    """Configures logging from a YAML file (LOG_CFG if set), with the files of its handlers written to a temporary
+    directory rather than the working directory
+    """
+    path = os.getenv(env_key, None) or default_path
+    if not os.path.exists(path):
+        logging.basicConfig(level=default_level)
+        return
+    with open(path, 'rt') as f:
+        config = yaml.safe_load(f)
+    directory = tempfile.mkdtemp(prefix='solenoid-logs-')
+    for handler in config.get('handlers', {}).values():
+        if 'filename' in handler:
+            handler['filename'] = os.path.join(directory, os.path.basename(handler['filename']))
+    logging.config.dictConfig(config)
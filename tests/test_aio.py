@@ -0,0 +1,72 @@
+import asyncio
+import unittest
+
+from solenoid.aio import AsyncEurekaClient, aiohttp
+from solenoid.eureka import EurekaClientError
+from solenoid.testing import FakeEurekaServer, Faults
+from .fixtures import SERVICE, service_config
+
+
+@unittest.skipIf(aiohttp is None, 'aiohttp is not installed')
+class AsyncEurekaClientTestCase(unittest.TestCase):
+    def setUp(self):
+        self.eureka = FakeEurekaServer().start()
+        self.config = service_config(self.eureka.discovery_server())
+        self.instance_path = f'{self.eureka.service_path}/{SERVICE.app}/{SERVICE.instanceId}'
+
+    def tearDown(self):
+        self.eureka.stop()
+
+    def test_operations(self):
+        async def run():
+            async with AsyncEurekaClient(self.config) as client:
+                self.assertTrue(await client.register())
+                self.assertTrue(await client.heartbeat())
+                self.assertTrue(await client.out_of_service())
+                self.assertTrue(await client.update_metadata('zone', 'a'))
+                instance = (await client.get_app_instance())['instance']
+                self.assertEqual(('OUT_OF_SERVICE', 'a'), (instance['status'], instance['metadata']['zone']))
+                self.assertEqual(1, len((await client.get_registry())['applications']['application']))
+                self.assertTrue(await client.deregister())
+                with self.assertRaises(EurekaClientError):
+                    await client.heartbeat()
+
+        asyncio.run(run())
+
+    def test_connection_resets_retried_like_the_sync_client(self):
+        async def run():
+            async with AsyncEurekaClient(self.config) as client:
+                # the heartbeat reuses the pooled connection of the registration
+                await client.register()
+                self.eureka.faults = Faults(reset_rate=1.0, paths=[self.instance_path])
+                with self.assertRaises(aiohttp.ClientConnectionError):
+                    await client.heartbeat()
+                self.assertEqual(client.retries + 1, self.eureka.requests['reset'])
+
+        asyncio.run(run())
+
+    def test_server_errors_retried(self):
+        async def run():
+            async with AsyncEurekaClient(self.config) as client:
+                self.eureka.faults = Faults(error_rate=1.0, error_status=500)
+                with self.assertRaises(EurekaClientError):
+                    await client.get_registry()
+                self.assertEqual(client.retries + 1, self.eureka.requests['error'])
+
+        asyncio.run(run())
+
+    def test_given_session_left_open(self):
+        async def run():
+            session = aiohttp.ClientSession()
+            try:
+                async with AsyncEurekaClient(self.config, session) as client:
+                    await client.register()
+                self.assertFalse(session.closed)
+            finally:
+                await session.close()
+
+        asyncio.run(run())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+import threading
+import unittest
+from collections import Counter
+
+from solenoid.balancer import InstanceChooser, NoInstanceAvailableError, WeightedRandom
+from solenoid.eureka import EurekaClient
+from solenoid.registry import RegistryCache
+from solenoid.testing import FakeEurekaServer, Faults, simulated_instance
+from .fixtures import service_config
+
+
+def _instance(instance_id, port, status='UP', weight=None, app='ORDERS', vip='orders-vip'):
+    instance = {
+        'instanceId': instance_id,
+        'app': app,
+        'hostName': 'localhost',
+        'vipAddress': vip,
+        'status': status,
+        'port': {'$': port, '@enabled': True}
+    }
+    if weight is not None:
+        instance['metadata'] = {'weight': weight}
+    return instance
+
+
+class StubClient:
+    def __init__(self):
+        self.registry = None
+
+    def get_registry(self):
+        return {'applications': {'application': [
+            {'name': 'ORDERS', 'instance': [
+                _instance('o1', 8001), _instance('o2', 8002), _instance('o3', 8003, status='DOWN')]},
+            # an application named like the VIP address of ORDERS
+            {'name': 'ORDERS-VIP', 'instance': [_instance('v1', 9001, app='ORDERS-VIP', vip='legacy')]}
+        ]}}
+
+    def start_registry_cache(self):
+        self.registry = RegistryCache(self)
+        self.registry.refresh()
+
+
+class InstanceChooserTestCase(unittest.TestCase):
+    def test_round_robin_skips_down(self):
+        chooser = InstanceChooser(StubClient())
+        chosen = Counter(chooser.choose('orders') for _ in range(10))
+        self.assertEqual({'http://localhost:8001': 5, 'http://localhost:8002': 5}, dict(chosen))
+
+    def test_vip_lookup(self):
+        chooser = InstanceChooser(StubClient(), strategy='least_outstanding')
+        with chooser.instance('ORDERS-VIP', kind='vip') as url:
+            self.assertEqual(1, chooser.outstanding[url])
+            self.assertNotEqual(url, chooser.choose('orders-vip', kind='vip'))
+        self.assertNotIn(url, chooser.outstanding)
+
+    def test_app_and_vip_sharing_a_name(self):
+        chooser = InstanceChooser(StubClient())
+        self.assertEqual('http://localhost:9001', chooser.choose('orders-vip'))
+        self.assertEqual('http://localhost:9001', chooser.choose('orders-vip', kind='app'))
+        self.assertIn(chooser.choose('orders-vip', kind='vip'), ('http://localhost:8001', 'http://localhost:8002'))
+        self.assertEqual('http://localhost:9001', chooser.choose('legacy'))
+        with self.assertRaises(ValueError):
+            chooser.choose('orders', kind='host')
+
+    def test_concurrent_outstanding_counts(self):
+        chooser = InstanceChooser(StubClient(), strategy='least_outstanding')
+        barrier = threading.Barrier(8)
+
+        def work():
+            barrier.wait()
+            for _ in range(2000):
+                chooser.release(chooser.acquire('orders'))
+
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual({}, chooser.outstanding)
+
+    def test_unknown_app(self):
+        chooser = InstanceChooser(StubClient())
+        with self.assertRaises(NoInstanceAvailableError):
+            chooser.choose('missing')
+
+    def test_weighted_random(self):
+        strategy = WeightedRandom(['a', 'b'], [3.0, 1.0])
+        chosen = Counter(strategy.choose({}) for _ in range(4000))
+        self.assertAlmostEqual(0.75, chosen['a'] / 4000, delta=0.05)
+
+
+class RegistryUnavailableTestCase(unittest.TestCase):
+    def test_choose_does_not_fetch_while_eureka_fails(self):
+        with FakeEurekaServer(faults=Faults(error_rate=1.0, error_status=500)) as eureka:
+            eureka.add_instance(simulated_instance('orders', 1))
+            client = EurekaClient(service_config(eureka.discovery_server(), maxRetries=0))
+            chooser = InstanceChooser(client)
+            try:
+                self.assertIsNotNone(client.registry.task)
+                for _ in range(5):
+                    with self.assertRaises(NoInstanceAvailableError):
+                        chooser.choose('orders')
+                self.assertEqual(1, eureka.requests['error'])
+                eureka.faults.error_rate = 0.0
+                client.registry.refresh()
+                self.assertEqual('http://orders-1.local:8001', chooser.choose('orders'))
+            finally:
+                client.stop_registry_cache()
+
+
+if __name__ == '__main__':
+    unittest.main()
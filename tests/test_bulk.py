@@ -0,0 +1,102 @@
+import io
+import threading
+import time
+import unittest
+
+import requests
+from urllib3 import HTTPResponse
+
+from solenoid.bulk import BulkEurekaClient
+from solenoid.config import DiscoveryServer, Port, ServiceMetadata
+from solenoid.eureka import EurekaClientError
+from .fixtures import wait_for
+
+
+class StubResponse(requests.Response):
+    def __init__(self, status_code):
+        super().__init__()
+        self.status_code = status_code
+        self.raw = HTTPResponse(io.BytesIO(b''), status=status_code, preload_content=False)
+
+
+class StubSession:
+    """Answers like Eureka after delay seconds, failing every request for the app `broken` (or all of them)"""
+
+    def __init__(self):
+        self.requests = []
+        self.lock = threading.Lock()
+        self.delay = 0.0
+        self.fail_all = False
+
+    def request(self, method, url, **kwargs):
+        with self.lock:
+            self.requests.append((method, url))
+        if self.delay:
+            time.sleep(self.delay)
+        if self.fail_all or '/BROKEN' in url.upper():
+            return StubResponse(400)
+        return StubResponse(204 if method == 'POST' else 200)
+
+    def close(self):
+        pass
+
+
+def _metadata(app, i):
+    return ServiceMetadata(instanceId=f'{app}:{i}', hostName='localhost', app=app, ipAddr='127.0.0.1',
+                           vipAddress=app, secureVipAddress=app, status='UP', port=Port(8000 + i, True),
+                           securePort=Port(443, False))
+
+
+class BulkEurekaClientTestCase(unittest.TestCase):
+    def setUp(self):
+        instances = [_metadata('orders', i) for i in range(20)] + [_metadata('broken', 0)]
+        self.bulk = BulkEurekaClient(DiscoveryServer('localhost', 8761, False, '/eureka/apps'), instances,
+                                     max_workers=4)
+        self.session = StubSession()
+        for peer in self.bulk.peers.peers:
+            peer.session = self.session
+
+    def tearDown(self):
+        self.bulk.close()
+
+    def test_shared_peers(self):
+        self.assertEqual(1, len({id(client.peers) for client in self.bulk.clients.values()}))
+
+    def test_errors_per_instance(self):
+        result = self.bulk.register()
+        self.assertFalse(result.ok)
+        self.assertEqual(['broken:0'], result.failed)
+        self.assertEqual(20, len(result.succeeded))
+        self.assertEqual(21, len(self.session.requests))
+        self.assertRaises(Exception, result.raise_for_errors)
+
+    def test_selected_instances(self):
+        result = self.bulk.deregister(['orders:1', 'missing'])
+        self.assertEqual(['orders:1'], result.succeeded)
+        self.assertIsInstance(result.errors['missing'], KeyError)
+        self.assertEqual([('DELETE', 'http://localhost:8761/eureka/apps/orders/orders:1')], self.session.requests)
+
+    def test_heartbeat_round_off_the_scheduler(self):
+        self.session.delay = 0.2
+        start = time.monotonic()
+        self.bulk._heartbeat_all()
+        self.assertLess(time.monotonic() - start, 0.1)
+        with self.assertRaises(EurekaClientError):
+            self.bulk._heartbeat_all()
+        self.assertTrue(wait_for(lambda: self.bulk.last_heartbeat is not None))
+        self.assertEqual(['broken:0'], self.bulk.last_heartbeat.failed)
+        self.assertEqual(20, len(self.bulk.last_heartbeat.succeeded))
+
+    def test_heartbeat_backs_off_when_nothing_got_through(self):
+        self.session.fail_all = True
+        self.bulk._heartbeat_all()
+        self.assertTrue(wait_for(lambda: self.bulk.last_heartbeat is not None))
+        self.session.fail_all = False
+        with self.assertRaises(EurekaClientError):
+            self.bulk._heartbeat_all()
+        self.assertTrue(wait_for(lambda: self.bulk.last_heartbeat.results))
+        self.bulk._heartbeat_all()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,34 +1,18 @@
 import unittest
 import logging
-import logging.config
-import os
-import os.path
-import yaml
+import threading
+import time
 
-from solenoid.config import ServiceConfig, ServiceMetadata, DiscoveryServer, Port, myOwnDC
-import solenoid as api
+from solenoid.config import ServiceConfig, ServiceMetadata, DiscoveryServer, Port, myOwnDC, ConfigError
+from solenoid.eureka import EurekaClient, EurekaClientError, attempt_timeout
+from solenoid.peers import PeerPool
+from solenoid.registry import RegistryCache
+from solenoid.scheduler import Scheduler
+from solenoid.testing import FakeEurekaServer, Faults
+from requests.exceptions import ConnectionError, RequestException
+from .fixtures import setup_logging, service_config, wait_for
 
 
-def setup_logging(
-    default_path='logging.yaml',
-    default_level=logging.DEBUG,
-    env_key='LOG_CFG'
-):
-    """Setup logging configuration
-
-    """
-    path = default_path
-    value = os.getenv(env_key, None)
-    if value:
-        path = value
-    if os.path.exists(path):
-        with open(path, 'rt') as f:
-            config = yaml.safe_load(f.read())
-            print(config)
-        logging.config.dictConfig(config)
-    else:
-        logging.basicConfig(level=default_level)
-
 conf = {
     "instance": {
         "instanceId": "192.168.0.1:plugin-test-aaa-service:80",
@@ -84,27 +68,235 @@ server = DiscoveryServer(
 
 class_config = ServiceConfig(service, server)
 
+
+def _config(*servers):
+    return ServiceConfig(service, [s.discovery_server() for s in servers])
+
+
 class MyTestCase(unittest.TestCase):
+    def setUp(self):
+        self.eureka = FakeEurekaServer(service_path='/solenoid/apps/').start()
+
+    def tearDown(self):
+        self.eureka.stop()
+
     def test_config(self):
         log = logging.getLogger(__name__)
         config = ServiceConfig()
         config.load_config('service.yaml')
         log.debug(config.get_service_metadata())
 
+    def test_resolved_config(self):
+        config = ServiceConfig()
+        config.load_config('service.yaml')
+        self.assertEqual('http://localhost:8080/eureka/apps/testclient/localhost:testclient:7091/status',
+                         config.get_status_url())
+        self.assertEqual(30, config.get_option('heartBeatIntervalInSecs'))
+        with self.assertRaises(AttributeError):
+            config.resolved.app = 'other'
+        self.assertEqual('/info', class_config.get_status_page_path())
+
+    def test_missing_key(self):
+        config = ServiceConfig()
+        config.fileConfig = {'instance': {'app': 'testclient'}, 'eureka': {}}
+        with self.assertRaises(ConfigError):
+            config._resolve('test')
+
     def test_register(self):
-        log = logging.getLogger(__name__)
         config = ServiceConfig()
         config.load_config('service.yaml')
-        api.register(config)
+        config.fileConfig['eureka'].update(port=self.eureka.port, servicePath=self.eureka.service_path)
+        config._resolve('service.yaml')
+        client = EurekaClient(config)
+        self.assertTrue(client.register())
+        self.assertEqual('UP', self.eureka.instance('testclient', 'localhost:testclient:7091')['status'])
+        self.assertTrue(client.heartbeat())
+        self.assertTrue(client.deregister())
+        self.assertIsNone(self.eureka.instance('testclient', 'localhost:testclient:7091'))
 
     def test_eureka(self):
         import requests
-        log = logging.getLogger(__name__)
-        res = requests.post('http://localhost:9091/solenoid/apps/plugin-test-aaa-service', json=conf)
-        log.debug(res)
+        res = requests.post(f'{self.eureka.url}/plugin-test-aaa-service', json=conf)
+        self.assertEqual(204, res.status_code)
+        res = requests.get(f'{self.eureka.url}/plugin-test-aaa-service/192.168.0.1:plugin-test-aaa-service:80')
+        self.assertEqual('PLUGIN-TEST-AAA-SERVICE', res.json()['instance']['app'])
 
     def test_class_config(self):
-        api.register(class_config)
+        client = EurekaClient(_config(self.eureka))
+        self.assertTrue(client.register())
+        self.assertTrue(client.out_of_service())
+        self.assertTrue(client.update_metadata('zone', 'a'))
+        instance = client.get_app_instance()['instance']
+        self.assertEqual('OUT_OF_SERVICE', instance['status'])
+        self.assertEqual('a', instance['metadata']['zone'])
+        self.assertTrue(client.back_in_service())
+        self.assertEqual(1, len(client.get_all_instances()['application']['instance']))
+        self.assertEqual(1, self.eureka.requests['register'])
+        client.deregister()
+        with self.assertRaises(EurekaClientError):
+            client.heartbeat()
+
+
+class EagerScheduler(Scheduler):
+    """Starts running a task on another thread before schedule() returns, as a busy scheduler thread can
+    """
+    def schedule(self, function, interval, **kwargs):
+        task = super().schedule(function, interval, **kwargs)
+        first = threading.Thread(target=task.run)
+        first.start()
+        first.join(0.2)
+        return task
+
+
+class FakeEurekaServerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.eureka = FakeEurekaServer().start()
+
+    def tearDown(self):
+        self.eureka.stop()
+
+    def test_registry_cache_follows_deltas(self):
+        self.eureka.populate(1000, apps=10)
+        client = EurekaClient(_config(self.eureka))
+        cache = RegistryCache(client)
+        cache.refresh()
+        self.assertEqual(1000, len(cache.applications))
+        client.register()
+        client.out_of_service()
+        cache.refresh()
+        self.assertEqual(1, cache.full_fetches)
+        self.assertEqual(1, cache.delta_fetches)
+        self.assertEqual('OUT_OF_SERVICE', cache.get_instance('test-metadata', '127.0.0.1:test-metadata:2020')['instance']['status'])
+        self.assertEqual(self.eureka.hashcode(), cache.hashcode)
+
+    def test_retries_server_errors(self):
+        self.eureka.faults = Faults(error_rate=1.0, error_status=500, paths=['*/test-metadata/*'])
+        client = EurekaClient(_config(self.eureka))
+        client.register()
+        with self.assertRaises(EurekaClientError):
+            client.heartbeat()
+        self.assertEqual(client.retries + 1, self.eureka.requests['error'])
+
+    def test_fails_over_from_reset_connections(self):
+        with FakeEurekaServer(faults=Faults(reset_rate=1.0)) as broken:
+            client = EurekaClient(_config(broken, self.eureka))
+            self.assertTrue(client.register())
+            self.assertTrue(client.heartbeat())
+            self.assertEqual(1, broken.requests['reset'])
+            self.assertEqual(self.eureka.url, client.peers.writer.url)
+            with self.assertRaises(ConnectionError):
+                EurekaClient(_config(broken)).register()
+
+    def test_slow_body_bounded_by_budget(self):
+        # each chunk arrives within the read timeout, the operation's budget still cuts the body off
+        self.eureka.populate(10)
+        self.eureka.faults = Faults(slow_body=1.0)
+        client = EurekaClient(_config(self.eureka))
+        client.timeouts['registry'] = 0.5
+        client.retries = 0
+        start = time.monotonic()
+        with self.assertRaises(RequestException):
+            client.get_registry()
+        self.assertLess(time.monotonic() - start, 0.9)
+        client.timeouts['registry'] = 3
+        self.assertEqual(10, len(client.get_registry()['applications']['application'][0]['instance']))
+
+    def test_registered_state(self):
+        client = EurekaClient(_config(self.eureka))
+        self.assertFalse(client.registered)
+        self.eureka.faults = Faults(error_rate=1.0, error_status=400, paths=['*/test-metadata'])
+        with self.assertRaises(EurekaClientError):
+            client.register()
+        self.assertFalse(client.registered)
+        self.eureka.faults = Faults()
+        client.register()
+        self.assertTrue(client.registered)
+        client.deregister()
+        self.assertFalse(client.registered)
+
+    def test_per_operation_timeouts(self):
+        self.eureka.faults = Faults(latency=0.5, paths=['*/test-metadata/*'])
+        client = EurekaClient(_config(self.eureka))
+        client.timeouts['heartbeat'] = 0.3
+        client.retries = 2
+        for timeout in client._timeout('heartbeat', 3, time.monotonic() + 10):
+            self.assertAlmostEqual(0.1, timeout, places=3)
+        # an attempt never gets more than the time left
+        for timeout in client._timeout('heartbeat', 3, time.monotonic() + 0.05):
+            self.assertLessEqual(timeout, 0.05)
+        self.assertEqual(2.5, attempt_timeout(10, 3))
+        # register isn't slowed down, its budget is untouched by the heartbeat one
+        self.assertTrue(client.register())
+        start = time.monotonic()
+        with self.assertRaises(RequestException):
+            client.heartbeat()
+        # two attempts of 0.1s, the 0.6s backoff before the third would overrun the budget
+        self.assertLess(time.monotonic() - start, 0.3 + 0.2)
+        self.assertTrue(wait_for(lambda: self.eureka.requests['heartbeat'] == 2))
+
+    def test_register_in_background(self):
+        self.eureka.faults = Faults(error_rate=1.0, error_status=500, paths=['*/fixture'])
+        client = EurekaClient(service_config(self.eureka.discovery_server(), registrationRetryIntervalInSecs=0.05,
+                                             jitter=0, expBackOffBound=1))
+        client.retries = 0
+        scheduler = Scheduler()
+        try:
+            task = client.register_in_background(scheduler)
+            self.assertIs(task, client.register_in_background(scheduler))
+            self.assertTrue(wait_for(lambda: task.failures >= 2))
+            self.assertIsNone(client.heartbeat_task)
+            self.eureka.faults = Faults()
+            self.assertTrue(wait_for(lambda: client.registration_task is None))
+            self.assertTrue(task.cancelled)
+            self.assertIsNotNone(client.heartbeat_task)
+            registrations = self.eureka.requests['register']
+            time.sleep(0.2)
+            self.assertEqual(registrations, self.eureka.requests['register'])
+        finally:
+            scheduler.stop()
+
+    def test_register_in_background_first_attempt(self):
+        client = EurekaClient(service_config(self.eureka.discovery_server()))
+        scheduler = EagerScheduler()
+        try:
+            task = client.register_in_background(scheduler, heartbeat=False)
+            self.assertTrue(wait_for(lambda: client.registration_task is None))
+            self.assertTrue(task.cancelled)
+            self.assertEqual(0, task.failures)
+            # once registered, a later call starts a new registration
+            registrations = self.eureka.requests['register']
+            self.assertIsNot(task, client.register_in_background(scheduler, heartbeat=False))
+            self.assertTrue(wait_for(lambda: self.eureka.requests['register'] > registrations))
+        finally:
+            scheduler.stop()
+
+
+class PeerPoolTestCase(unittest.TestCase):
+    def test_read_order_prefers_fastest_healthy(self):
+        pool = PeerPool(['http://a', 'http://b', 'http://c'])
+        pool.success(pool.peers[0], 0.5)
+        pool.success(pool.peers[1], 0.1)
+        pool.failure(pool.peers[2])
+        self.assertEqual(['http://b', 'http://a', 'http://c'], [p.url for p in pool.read_order()])
+
+    def test_writes_stick_to_one_peer(self):
+        pool = PeerPool(['http://a', 'http://b'])
+        pool.success(pool.peers[1], 0.01)
+        self.assertEqual('http://a', pool.write_order()[0].url)
+        pool.failure(pool.peers[0])
+        self.assertEqual('http://b', pool.write_order()[0].url)
+        pool.success(pool.peers[1], 0.01, write=True)
+        self.assertIs(pool.peers[1], pool.writer)
+
+    def test_plan(self):
+        self.assertEqual(4, len(PeerPool(['http://a']).plan(3)))
+        self.assertEqual(['http://a', 'http://b', 'http://a', 'http://b'],
+                         [p.url for p in PeerPool(['http://a', 'http://b']).plan(3, write=True)])
+
+    def test_multiple_servers_config(self):
+        config = ServiceConfig(service, [server, DiscoveryServer('peer2', 8761, True, '/eureka/apps')])
+        self.assertEqual(('http://localhost:9091/solenoid/apps', 'https://peer2:8761/eureka/apps'),
+                         config.get_eureka_server_urls())
 
 
 if __name__ == '__main__':
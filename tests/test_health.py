@@ -0,0 +1,55 @@
+import threading
+import unittest
+
+from solenoid.solenoids.health import HealthRegistry, aggregate_status, http_status
+
+
+class HealthRegistryTestCase(unittest.TestCase):
+    def test_aggregate_status(self):
+        self.assertEqual('DOWN', aggregate_status(['UP', 'DOWN', 'OUT_OF_SERVICE']))
+        self.assertEqual('OUT_OF_SERVICE', aggregate_status(['UP', 'OUT_OF_SERVICE', 'UNKNOWN']))
+        self.assertEqual('UP', aggregate_status(['UNKNOWN', 'UP', 'CUSTOM']))
+        self.assertEqual('UNKNOWN', aggregate_status([]))
+        self.assertEqual(503, http_status('OUT_OF_SERVICE'))
+        self.assertEqual(200, http_status('UNKNOWN'))
+
+    def test_ttl_cache(self):
+        calls = []
+        registry = HealthRegistry(ttl=60)
+        registry.register('db', lambda: calls.append(1) or {'status': 'UP', 'details': {'calls': len(calls)}})
+        registry.register('flag', lambda: False, ttl=0)
+        self.assertEqual({'status': 'DOWN', 'details': {'db': {'status': 'UP', 'details': {'calls': 1}},
+                                                         'flag': {'status': 'DOWN'}}}, registry.health())
+        registry.health()
+        self.assertEqual(1, len(calls))
+
+    def test_timeout_not_restarted(self):
+        release = threading.Event()
+        calls = []
+
+        def slow():
+            calls.append(1)
+            release.wait(5)
+            return 'UP'
+
+        registry = HealthRegistry(timeout=0.05, ttl=60)
+        registry.register('slow', slow)
+        status, results = registry.check_all()
+        self.assertEqual('DOWN', status)
+        self.assertIn('Timed out', results['slow']['details']['error'])
+        registry.check_all()
+        self.assertEqual(1, len(calls))
+        release.set()
+        self.assertEqual(('UP', {'slow': {'status': 'UP'}}), registry.check_all())
+        registry.shutdown()
+
+    def test_exception_is_down(self):
+        registry = HealthRegistry()
+        registry.register('broken', lambda: 1 / 0)
+        status, results = registry.check_all()
+        self.assertEqual('DOWN', status)
+        self.assertEqual('ZeroDivisionError: division by zero', results['broken']['details']['error'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,203 @@
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+
+from solenoid.solenoids import log
+from solenoid.solenoids.log import MemoryRingHandler, RECORD_OVERHEAD
+from .fixtures import make_solenoid
+
+
+class MemoryRingHandlerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.logger = logging.getLogger('test_log')
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+
+    def tearDown(self):
+        self.logger.handlers.clear()
+
+    def test_byte_cap(self):
+        handler = MemoryRingHandler(max_bytes=3 * (RECORD_OVERHEAD + len("msg %d")))
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        self.logger.addHandler(handler)
+        for i in range(10):
+            self.logger.info('msg %d', i)
+        self.assertEqual(b'msg 7\nmsg 8\nmsg 9\n', handler.render())
+        self.assertLessEqual(handler.bytes, handler.max_bytes)
+
+    def test_exception_text_kept(self):
+        handler = MemoryRingHandler()
+        self.logger.addHandler(handler)
+        try:
+            1 / 0
+        except ZeroDivisionError:
+            self.logger.exception('failed')
+        record = handler._records[0][0]
+        self.assertIsNone(record.exc_info)
+        self.assertIn(b'ZeroDivisionError', handler.render())
+
+    def test_queue_logging(self):
+        handler = MemoryRingHandler()
+        self.logger.addHandler(handler)
+        listener = log.start_queue_logging(logger=self.logger)
+        try:
+            self.logger.info('queued')
+        finally:
+            listener.stop()
+            log._listeners.remove(listener)
+        self.assertIsInstance(self.logger.handlers[0], logging.handlers.QueueHandler)
+        self.assertIn(b'queued', handler.render())
+
+
+class LoggersTestCase(unittest.TestCase):
+    def test_configured_level(self):
+        logging.getLogger('test_log.parent').setLevel(logging.WARNING)
+        child = logging.getLogger('test_log.parent.child')
+        self.assertEqual({'configuredLevel': None, 'effectiveLevel': 'WARN'}, log.get_logger(child.name))
+        self.assertIsNone(log.get_logger('test_log.missing'))
+
+    def test_cache_invalidation(self):
+        logging.getLogger('test_log.cached')
+        loggers = log.get_loggers()
+        self.assertIs(loggers, log.get_loggers())
+        log.set_logger_level('test_log.cached', 'FATAL')
+        loggers = log.get_loggers()
+        self.assertEqual('FATAL', loggers['loggers']['test_log.cached']['configuredLevel'])
+        logging.getLogger('test_log.added')
+        self.assertIn('test_log.added', log.get_loggers()['loggers'])
+        log.set_logger_level('test_log.cached', None)
+        self.assertIsNone(log.get_logger('test_log.cached')['configuredLevel'])
+
+    def test_placeholder_replaced(self):
+        logging.getLogger('test_log.placeholder.child')
+        self.assertNotIn('test_log.placeholder', log.get_loggers()['loggers'])
+        logging.getLogger('test_log.placeholder')
+        self.assertIn('test_log.placeholder', log.get_loggers()['loggers'])
+
+
+class LoggersEndpointTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app, self.solenoid = make_solenoid()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        self.solenoid.health.shutdown()
+
+    def test_placeholder_replaced(self):
+        logging.getLogger('test_log.endpoint.child')
+        self.assertNotIn('test_log.endpoint', self.client.get('/actuator/loggers').get_json()['loggers'])
+        logging.getLogger('test_log.endpoint')
+        self.assertIn('test_log.endpoint', self.client.get('/actuator/loggers').get_json()['loggers'])
+
+    def test_set_level(self):
+        logging.getLogger('test_log.endpoint.level')
+        url = '/actuator/loggers/test_log.endpoint.level'
+        self.assertEqual(204, self.client.post(url, json={'configuredLevel': 'DEBUG'}).status_code)
+        self.assertEqual('DEBUG', self.client.get(url).get_json()['configuredLevel'])
+        self.assertEqual(400, self.client.post(url).status_code)
+        self.assertEqual(400, self.client.post(url, data='level', content_type='application/json').status_code)
+        self.assertEqual(400, self.client.post(url, json={'configuredLevel': 'LOUD'}).status_code)
+        self.assertEqual(204, self.client.post(url, json={}).status_code)
+        self.assertIsNone(self.client.get(url).get_json()['configuredLevel'])
+        self.assertEqual(404, self.client.post('/actuator/loggers/test_log.unknown', json={}).status_code)
+
+
+class LogFileEndpointTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app, self.solenoid = make_solenoid()
+        self.client = self.app.test_client()
+        self.directory = tempfile.mkdtemp()
+        self.handlers = []
+        for name, body in (('a/app.log', b'first app log\n'), ('b/app.log', b'second app log\n'),
+                           ('other.log', b'0123456789' * 10)):
+            filename = os.path.join(self.directory, name)
+            os.makedirs(os.path.dirname(filename), exist_ok=True)
+            with open(filename, 'wb') as f:
+                f.write(body)
+            handler = logging.FileHandler(filename, delay=True)
+            handler.setLevel(logging.CRITICAL + 1)
+            logging.getLogger().addHandler(handler)
+            self.handlers.append(handler)
+
+    def tearDown(self):
+        for handler in self.handlers:
+            logging.getLogger().removeHandler(handler)
+            handler.close()
+        shutil.rmtree(self.directory)
+        self.solenoid.health.shutdown()
+
+    def test_default_log_file(self):
+        res = self.client.get('/actuator/logfile')
+        self.assertEqual(200, res.status_code)
+        self.assertEqual(b'0123456789' * 10, res.data)
+
+    def test_ranges(self):
+        res = self.client.get('/actuator/logfile', headers={'Range': 'bytes=-15'})
+        self.assertEqual(206, res.status_code)
+        self.assertEqual(b'56789' + b'0123456789', res.data)
+        self.assertEqual('bytes 85-99/100', res.headers['Content-Range'])
+        res = self.client.get('/actuator/logfile', headers={'Range': 'bytes=12-21'})
+        self.assertEqual(206, res.status_code)
+        self.assertEqual(b'2345678901', res.data)
+        res = self.client.get('/actuator/logfile', headers={'Range': 'bytes=500-600'})
+        self.assertEqual(416, res.status_code)
+        self.assertEqual('bytes */100', res.headers['Content-Range'])
+
+    def test_named_log_file(self):
+        res = self.client.get('/actuator/logfile/other.log', headers={'Range': 'bytes=-5'})
+        self.assertEqual(206, res.status_code)
+        self.assertEqual(b'56789', res.data)
+        self.assertEqual(404, self.client.get('/actuator/logfile/missing.log').status_code)
+
+    def test_shared_basename(self):
+        res = self.client.get('/actuator/logfile/app.log')
+        self.assertEqual(409, res.status_code)
+        self.assertIn(os.path.join(self.directory, 'b', 'app.log'), res.get_json()['error'])
+        for name, body in (('a', b'first app log\n'), ('b', b'second app log\n')):
+            res = self.client.get(f'/actuator/logfile{os.path.join(self.directory, name, "app.log")}')
+            self.assertEqual(200, res.status_code)
+            self.assertEqual(body, res.data)
+
+
+class MemoryLogFileEndpointTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app, self.solenoid = make_solenoid()
+        self.client = self.app.test_client()
+        root = logging.getLogger()
+        # file handlers left on the root logger by other tests would be served instead of the ring
+        self.file_handlers = [h for h in root.handlers if isinstance(h, logging.FileHandler)]
+        for handler in self.file_handlers:
+            root.removeHandler(handler)
+        self.ring = MemoryRingHandler()
+        self.ring.setFormatter(logging.Formatter('%(message)s'))
+        root.addHandler(self.ring)
+        self.logger = logging.getLogger('test_log_memory')
+        self.logger.setLevel(logging.INFO)
+
+    def tearDown(self):
+        root = logging.getLogger()
+        root.removeHandler(self.ring)
+        for handler in self.file_handlers:
+            root.addHandler(handler)
+        self.solenoid.health.shutdown()
+
+    def test_memory_handler_served(self):
+        self.logger.info('first record')
+        self.logger.info('second record')
+        res = self.client.get('/actuator/logfile')
+        self.assertEqual(200, res.status_code)
+        self.assertEqual(b'first record\nsecond record\n', res.data)
+        res = self.client.get('/actuator/logfile', headers={'Range': 'bytes=-14'})
+        self.assertEqual(206, res.status_code)
+        self.assertEqual(b'second record\n', res.data)
+        self.assertEqual(404, self.client.get('/actuator/logfile/memory').status_code)
+
+    def test_no_log_configured(self):
+        logging.getLogger().removeHandler(self.ring)
+        self.assertEqual(404, self.client.get('/actuator/logfile').status_code)
+
+
+if __name__ == '__main__':
+    unittest.main()
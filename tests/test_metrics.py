@@ -0,0 +1,67 @@
+import unittest
+
+from flask import Flask
+
+from solenoid.metrics import LatencyHistogram, MetricsRegistry, bucket_index, bucket_upper_bound, SUB_BUCKETS
+
+
+class LatencyHistogramTestCase(unittest.TestCase):
+    def test_bucket_bounds(self):
+        for value in (2e-6, 0.0013, 0.25, 3.7, 120.0):
+            index = bucket_index(value)
+            self.assertLessEqual(value, bucket_upper_bound(index))
+            self.assertGreaterEqual(value, bucket_upper_bound(index - 1))
+
+    def test_percentiles(self):
+        histogram = LatencyHistogram()
+        for ms in range(1, 1001):
+            histogram.record(ms / 1000.0)
+        self.assertEqual(1000, histogram.count)
+        self.assertAlmostEqual(1.0, histogram.max)
+        for p in (0.5, 0.95, 0.99):
+            self.assertAlmostEqual(p, histogram.percentile(p), delta=p / SUB_BUCKETS)
+
+
+class MetricsRegistryTestCase(unittest.TestCase):
+    def test_render_with_tags(self):
+        metrics = MetricsRegistry()
+        metrics.record('GET', '/orders', 200, 0.01)
+        metrics.record('GET', '/orders', 500, 0.02)
+        metrics.record('POST', '/users', 201, 0.03)
+        body = metrics.render([('uri', '/orders')])
+        self.assertEqual({'statistic': 'COUNT', 'value': 2}, body['measurements'][0])
+        tags = {t['tag']: t['values'] for t in body['availableTags']}
+        self.assertNotIn('uri', tags)
+        self.assertEqual(['SERVER_ERROR', 'SUCCESS'], tags['outcome'])
+
+    def test_series_cap(self):
+        metrics = MetricsRegistry(max_series=2)
+        for i in range(5):
+            metrics.record('GET', f'/{i}', 200, 0.01)
+        self.assertEqual(3, len(metrics.series))
+        self.assertEqual(3, metrics.render([('uri', 'OTHER')])['measurements'][0]['value'])
+
+
+class InstallTestCase(unittest.TestCase):
+    def test_exception_tag(self):
+        app = Flask(__name__)
+        metrics = MetricsRegistry()
+        metrics.install(app)
+
+        @app.route('/orders/<id>')
+        def order(id):
+            if id == 'boom':
+                raise ValueError(id)
+            return 'order'
+
+        client = app.test_client()
+        self.assertEqual(200, client.get('/orders/1').status_code)
+        self.assertEqual(500, client.get('/orders/boom').status_code)
+        self.assertEqual(404, client.get('/missing').status_code)
+        self.assertEqual({('None', 'GET', 'SUCCESS', '200', '/orders/<id>'),
+                          ('ValueError', 'GET', 'SERVER_ERROR', '500', '/orders/<id>'),
+                          ('None', 'GET', 'CLIENT_ERROR', '404', 'NOT_FOUND')}, set(metrics.series))
+
+
+if __name__ == '__main__':
+    unittest.main()
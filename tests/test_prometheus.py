@@ -0,0 +1,96 @@
+import re
+import time
+import unittest
+
+from solenoid import prometheus
+from solenoid.metrics import LatencyHistogram, MetricsRegistry
+from solenoid.prometheus import PrometheusExporter, render_histogram, LE_BUCKETS
+
+
+def _buckets(text: str):
+    return [(le, int(value)) for le, value in re.findall(r'_bucket\{.*le="([^"]+)"\} (\d+)', text)]
+
+
+class RenderHistogramTestCase(unittest.TestCase):
+    def test_cumulative_buckets(self):
+        histogram = LatencyHistogram()
+        for seconds in (0.003, 0.02, 0.2, 0.2, 20.0):
+            histogram.record(seconds)
+        buckets = dict(_buckets(render_histogram(('None', 'GET', 'SUCCESS', '200', '/orders'), histogram)))
+        self.assertEqual([repr(le) for le in LE_BUCKETS] + ['+Inf'], list(buckets))
+        self.assertEqual(1, buckets['0.005'])
+        self.assertEqual(1, buckets['0.01'])
+        self.assertEqual(2, buckets['0.025'])
+        self.assertEqual(4, buckets['0.25'])
+        self.assertEqual(4, buckets['10.0'])
+        self.assertEqual(5, buckets['+Inf'])
+        counts = list(buckets.values())
+        self.assertEqual(sorted(counts), counts)
+
+    def test_label_escaping(self):
+        histogram = LatencyHistogram()
+        histogram.record(0.01)
+        text = render_histogram(('None', 'GET', 'SUCCESS', '200', '/a"b\\c\nd'), histogram)
+        self.assertIn('uri="/a\\"b\\\\c\\nd"', text)
+        self.assertEqual(len(LE_BUCKETS) + 3, len(text.splitlines()))
+
+
+class ViewRegistry(MetricsRegistry):
+    """Registry whose view is rebuilt on every read, as with metrics shared between processes
+    """
+    def __init__(self):
+        super().__init__()
+        self.current = MetricsRegistry()
+
+    def view(self):
+        return self.current
+
+
+class PrometheusExporterTestCase(unittest.TestCase):
+    def test_min_interval(self):
+        metrics = MetricsRegistry()
+        metrics.record('GET', '/orders', 200, 0.01)
+        exporter = PrometheusExporter(metrics, min_interval=60)
+        body = exporter.scrape()
+        metrics.record('GET', '/users', 200, 0.01)
+        self.assertIs(body, exporter.scrape())
+
+        exporter = PrometheusExporter(metrics, min_interval=0)
+        body = exporter.scrape()
+        self.assertIn(b'uri="/users"', body)
+        metrics.record('GET', '/payments', 200, 0.01)
+        self.assertIn(b'uri="/payments"', exporter.scrape())
+
+    def test_series_reused_and_pruned(self):
+        metrics = ViewRegistry()
+        metrics.current.record('GET', '/orders', 200, 0.01)
+        metrics.current.record('GET', '/users', 200, 0.01)
+        exporter = PrometheusExporter(metrics, min_interval=0)
+        exporter.scrape()
+        self.assertEqual(2, len(exporter._series))
+        rendered = dict(exporter._series)
+
+        exporter.scrape()
+        for key, cached in exporter._series.items():
+            self.assertIs(rendered[key], cached)
+
+        metrics.current = MetricsRegistry()
+        metrics.current.record('GET', '/orders', 200, 0.01)
+        body = exporter.scrape()
+        self.assertEqual(['/orders'], [key[-1] for key in exporter._series])
+        self.assertNotIn(b'/users', body)
+
+        metrics.current = MetricsRegistry()
+        exporter.scrape()
+        self.assertEqual({}, exporter._series)
+
+    def test_process_start_time(self):
+        body = PrometheusExporter(MetricsRegistry(), min_interval=0).scrape().decode('utf-8')
+        started = float(re.search(r'^process_start_time_seconds (\S+)$', body, re.M).group(1))
+        self.assertEqual(prometheus._START_TIME, started)
+        self.assertLessEqual(started, time.time())
+        self.assertGreater(started, time.time() - 7 * 24 * 3600)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,164 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from solenoid.config import ClientOptions, Port, ServiceConfig, ServiceMetadata
+from solenoid.eureka import EurekaClient
+from solenoid.model import Applications, InstanceInfo
+from solenoid.registry import RegistryCache, reconcile_hashcode
+from solenoid.snapshot import RegistrySnapshot, dumps, loads
+from solenoid.testing import FakeEurekaServer
+
+
+def _instance(app, instance_id, status='UP', action=None):
+    instance = {'instanceId': instance_id, 'app': app, 'hostName': 'localhost', 'status': status,
+                'vipAddress': f'{app.lower()}-vip', 'port': {'$': 8080, '@enabled': 'true'}}
+    if action is not None:
+        instance['actionType'] = action
+    return instance
+
+
+class StubClient:
+    def __init__(self, registry, deltas):
+        self.registry = registry
+        self.deltas = list(deltas)
+        self.full = 0
+
+    def get_registry(self):
+        self.full += 1
+        return self.registry
+
+    def get_registry_delta(self):
+        return self.deltas.pop(0)
+
+
+class RegistryCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.registry = {'applications': {
+            'apps__hashcode': 'UP_2_',
+            'application': [
+                {'name': 'ORDERS', 'instance': [_instance('ORDERS', 'o1'), _instance('ORDERS', 'o2')]}
+            ]
+        }}
+
+    def test_hashcode(self):
+        apps = Applications(InstanceInfo.parse(i) for i in
+                            (_instance('A', '1'), _instance('A', '2', 'DOWN'), _instance('B', '3')))
+        self.assertEqual('DOWN_1_UP_2_', reconcile_hashcode(apps))
+
+    def test_indexes(self):
+        apps = Applications.parse(self.registry)
+        self.assertEqual(2, len(apps.vip('ORDERS-VIP')))
+        self.assertEqual(2, len(apps.status('UP')))
+        self.assertEqual(8080, apps.instance('o1').port)
+        self.assertTrue(apps.instance('o1').portEnabled)
+        self.assertEqual('o1', apps.instance('o1').render()['instanceId'])
+
+    def test_full_then_delta(self):
+        delta = {'applications': {
+            'apps__hashcode': 'UP_2_',
+            'application': [
+                {'name': 'ORDERS', 'instance': [_instance('ORDERS', 'o2', action='DELETED')]},
+                {'name': 'users', 'instance': _instance('USERS', 'u1', action='ADDED')}
+            ]
+        }}
+        client = StubClient(self.registry, [delta])
+        cache = RegistryCache(client)
+        cache.refresh()
+        self.assertEqual(2, len(cache.get_application('orders')['application']['instance']))
+        cache.refresh()
+        self.assertEqual(1, client.full)
+        self.assertIsNone(cache.get_instance('ORDERS', 'o2'))
+        self.assertEqual('u1', cache.get_instance('USERS', 'u1')['instance']['instanceId'])
+
+    def test_hashcode_mismatch_refetches(self):
+        delta = {'applications': {'apps__hashcode': 'UP_5_', 'application': []}}
+        client = StubClient(self.registry, [delta])
+        cache = RegistryCache(client)
+        cache.refresh()
+        cache.refresh()
+        self.assertEqual(2, client.full)
+
+
+class UnavailableClient:
+    def get_registry(self):
+        raise ConnectionError('Eureka is down')
+
+
+class RegistrySnapshotTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'registry.snapshot')
+        self.registry = {'applications': {
+            'apps__hashcode': 'DOWN_1_UP_1_',
+            'application': [{'name': 'ORDERS', 'instance': [
+                _instance('ORDERS', 'o1'), dict(_instance('ORDERS', 'o2', 'DOWN'), metadata={'zone': 'a'})]}]
+        }}
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_round_trip(self):
+        apps, hashcode, written_at = loads(dumps(Applications.parse(self.registry), 'DOWN_1_UP_1_', 1000.0))
+        self.assertEqual(('DOWN_1_UP_1_', 1000.0), (hashcode, written_at))
+        self.assertEqual(Applications.parse(self.registry).instance('o2').render(), apps.instance('o2').render())
+        self.assertEqual(2, len(apps.vip('orders-vip')))
+
+    def test_unusable_snapshots_are_ignored(self):
+        self.assertIsNone(RegistrySnapshot(self.path).load())
+        with open(self.path, 'wb') as f:
+            f.write(dumps(Applications.parse(self.registry), 'DOWN_1_UP_1_')[:-10])
+        self.assertIsNone(RegistrySnapshot(self.path).load())
+        with open(self.path, 'wb') as f:
+            f.write(dumps(Applications.parse(self.registry), 'DOWN_1_UP_1_', time.time() - 60))
+        self.assertIsNone(RegistrySnapshot(self.path, max_age=30).load())
+        self.assertIsNotNone(RegistrySnapshot(self.path).load())
+
+    def test_refresh_writes_snapshot(self):
+        snapshot = RegistrySnapshot(self.path, interval=60)
+        cache = RegistryCache(StubClient(self.registry, [{'applications': {'apps__hashcode': 'DOWN_1_UP_1_'}}]),
+                              snapshot=snapshot)
+        cache.refresh()
+        written_at = os.stat(self.path).st_mtime_ns
+        self.assertEqual(['registry.snapshot'], os.listdir(self.dir))
+        cache.refresh()
+        self.assertEqual(written_at, os.stat(self.path).st_mtime_ns)
+
+        stale = RegistryCache(UnavailableClient(), snapshot=RegistrySnapshot(self.path))
+        self.assertFalse(stale.ready)
+        self.assertTrue(stale.load_snapshot())
+        self.assertTrue(stale.ready)
+        self.assertTrue(stale.stale)
+        self.assertEqual('DOWN_1_UP_1_', stale.hashcode)
+        self.assertEqual('a', stale.get_instance('orders', 'o2')['instance']['metadata']['zone'])
+        with self.assertRaises(ConnectionError):
+            stale.refresh()
+        self.assertTrue(stale.stale)
+
+    def test_warm_start_while_eureka_is_down(self):
+        service = ServiceMetadata(instanceId='127.0.0.1:snapshot:2020', hostName='localhost', app='snapshot',
+                                  ipAddr='127.0.0.1', vipAddress='snapshot', secureVipAddress='snapshot',
+                                  status='UP', port=Port(2020, True), securePort=Port(443, False))
+        options = ClientOptions('requests', maxRetries=0)
+        options.registrySnapshotPath = self.path
+        with FakeEurekaServer() as eureka:
+            eureka.populate(100, apps=5)
+            config = ServiceConfig(service, eureka.discovery_server(), options)
+            client = EurekaClient(config)
+            client.start_registry_cache()
+            client.stop_registry_cache()
+        self.assertFalse(client.registry.stale)
+
+        client = EurekaClient(config)
+        try:
+            registry = client.start_registry_cache()
+            self.assertTrue(registry.stale)
+            self.assertEqual(20, len(client.get_all_instances('simulated-0')['application']['instance']))
+        finally:
+            client.stop_registry_cache()
+
+
+if __name__ == '__main__':
+    unittest.main()
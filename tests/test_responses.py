@@ -0,0 +1,49 @@
+import gzip
+import unittest
+
+from flask import Flask, request
+
+from solenoid.responses import CachedBody, compressed, GZIP_MIN_SIZE
+
+
+class ResponsesTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        small = CachedBody('{"status": "UP"}', 'application/json')
+        large = CachedBody('x' * GZIP_MIN_SIZE, 'text/plain')
+
+        @self.app.route('/small')
+        def small_body():
+            return small.response(request)
+
+        @self.app.route('/large')
+        def large_body():
+            return large.response(request)
+
+        @self.app.route('/dynamic')
+        def dynamic():
+            return compressed('y' * GZIP_MIN_SIZE, request, 'text/plain')
+
+        self.client = self.app.test_client()
+
+    def test_etag_not_modified(self):
+        etag = self.client.get('/small').headers['ETag']
+        response = self.client.get('/small', headers={'If-None-Match': etag})
+        self.assertEqual(304, response.status_code)
+        self.assertEqual(b'', response.data)
+        self.assertEqual(200, self.client.get('/small', headers={'If-None-Match': '"other"'}).status_code)
+
+    def test_gzip(self):
+        plain = self.client.get('/large')
+        encoded = self.client.get('/large', headers={'Accept-Encoding': 'gzip'})
+        self.assertIsNone(plain.headers.get('Content-Encoding'))
+        self.assertEqual('gzip', encoded.headers['Content-Encoding'])
+        self.assertEqual(plain.data, gzip.decompress(encoded.data))
+        self.assertNotEqual(plain.headers['ETag'], encoded.headers['ETag'])
+        self.assertIsNone(self.client.get('/small', headers={'Accept-Encoding': 'gzip'}).headers.get('Content-Encoding'))
+        dynamic = self.client.get('/dynamic', headers={'Accept-Encoding': 'gzip, deflate'})
+        self.assertEqual(b'y' * GZIP_MIN_SIZE, gzip.decompress(dynamic.data))
+
+
+if __name__ == '__main__':
+    unittest.main()
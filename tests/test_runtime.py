@@ -0,0 +1,64 @@
+import threading
+import unittest
+
+from solenoid.config import ServiceConfig
+from solenoid.solenoids import runtime
+
+
+class RuntimeTestCase(unittest.TestCase):
+    def test_flatten(self):
+        config = {'a': {'b': {'c': 1}, 'd': [{'e': 'x'}, 2], 'f': []}, 'g': None}
+        self.assertEqual([('a.b.c', 1), ('a.d[0].e', 'x'), ('a.d[1]', 2), ('a.f', []), ('g', None)],
+                         list(runtime.flatten(config)))
+
+    def test_env_computed_once_per_load(self):
+        config = ServiceConfig()
+        config.load_config('service.yaml')
+        env = runtime.get_runtime(config)
+        self.assertIs(env, runtime.get_runtime(config))
+        properties = {s['name']: s['properties'] for s in env['propertySources']}
+        self.assertEqual(7091, properties['applicationConfig: [service.yaml]']['instance.port.$']['value'])
+        config.load_config('service.yaml')
+        self.assertIsNot(env, runtime.get_runtime(config))
+
+    def test_sanitize(self):
+        config = {'eureka': {'password': 'p', 'apiKey': 'k', 'keyStore': 'store'},
+                  'options': {'credentials': [{'user': 'u'}], 'authToken': None, 'clientSecret': 's'}}
+        properties = {k: runtime.sanitize(k, v) for k, v in runtime.flatten(config)}
+        self.assertEqual({'eureka.password': runtime.SANITIZED, 'eureka.apiKey': runtime.SANITIZED,
+                          'eureka.keyStore': 'store', 'options.credentials[0].user': runtime.SANITIZED,
+                          'options.authToken': None, 'options.clientSecret': runtime.SANITIZED}, properties)
+
+
+class HostInfoTimeoutTestCase(unittest.TestCase):
+    def setUp(self):
+        self.saved = (runtime._host_info, runtime._host_info_ready, runtime._host_info_started,
+                      runtime._env_cache, runtime.HOST_INFO_TIMEOUT)
+        # a lookup that never completes
+        runtime._host_info_ready = threading.Event()
+        runtime._host_info_started = True
+        runtime._env_cache = None
+        runtime.HOST_INFO_TIMEOUT = 0.05
+
+    def tearDown(self):
+        (runtime._host_info, runtime._host_info_ready, runtime._host_info_started,
+         runtime._env_cache, runtime.HOST_INFO_TIMEOUT) = self.saved
+
+    def test_placeholder_until_resolved(self):
+        config = ServiceConfig()
+        config.load_config('service.yaml')
+        env = runtime.get_runtime(config)
+        host = {s['name']: s['properties'] for s in env['propertySources']}['springCloudClientHostInfo']
+        self.assertIsNone(host['spring.cloud.client.ip-address']['value'])
+        self.assertIsNot(env, runtime.get_runtime(config))
+
+        runtime._host_info = runtime._make_host_info('10.0.0.1')
+        runtime._host_info_ready.set()
+        env = runtime.get_runtime(config)
+        host = {s['name']: s['properties'] for s in env['propertySources']}['springCloudClientHostInfo']
+        self.assertEqual('10.0.0.1', host['spring.cloud.client.ip-address']['value'])
+        self.assertIs(env, runtime.get_runtime(config))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+import threading
+import unittest
+
+from solenoid.scheduler import Scheduler
+
+
+class SchedulerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.scheduler = Scheduler()
+
+    def tearDown(self):
+        self.scheduler.stop()
+
+    def test_runs_tasks(self):
+        done = threading.Event()
+        calls = []
+
+        def tick():
+            calls.append(1)
+            if len(calls) == 3:
+                done.set()
+
+        task = self.scheduler.schedule(tick, 0.01, initial_delay=0)
+        self.assertTrue(done.wait(2))
+        task.cancel()
+        self.assertGreaterEqual(task.runs, 3)
+
+    def test_backoff(self):
+        errors = []
+        task = self.scheduler.schedule(lambda: 1 / 0, 10, jitter=0, exp_backoff_bound=4,
+                                       on_error=errors.append, initial_delay=60)
+        self.assertEqual(10, task.delay())
+        for expected in (20, 40, 40):
+            task.run()
+            self.assertEqual(expected, task.delay())
+        self.assertEqual(3, len(errors))
+        task.function = lambda: None
+        task.run()
+        self.assertEqual(10, task.delay())
+        self.assertEqual(3, task.failures)
+
+    def test_jitter(self):
+        task = self.scheduler.schedule(lambda: None, 10, jitter=0.2, initial_delay=60)
+        delays = {task.delay() for _ in range(20)}
+        self.assertTrue(all(8 <= d <= 12 for d in delays))
+        self.assertGreater(len(delays), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import threading
+import unittest
+
+import requests
+from flask import Flask
+
+from solenoid import server
+from solenoid.server import SolenoidServer
+from solenoid.solenoid import shutdown_server
+
+
+@unittest.skipIf(server.wsgi is None, 'cheroot is not installed')
+class SolenoidServerTestCase(unittest.TestCase):
+    def _serve(self, **options):
+        app = Flask(__name__)
+
+        @app.route('/hello')
+        def hello():
+            return 'hello'
+
+        @app.route('/stop', methods=['POST'])
+        def stop():
+            shutdown_server()
+            return 'bye'
+
+        self.server = SolenoidServer(app, '127.0.0.1', 0, threads=2, **options)
+        self.server.prepare()
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        return f'http://127.0.0.1:{self.server.bind_addr[1]}'
+
+    def tearDown(self):
+        self.server.stop()
+        self.thread.join(10)
+
+    def test_shutdown_endpoint(self):
+        stopped = []
+        url = self._serve()
+        self.server.on_stop.append(lambda: stopped.append(True))
+        self.assertEqual('hello', requests.get(f'{url}/hello').text)
+        self.assertEqual('bye', requests.post(f'{url}/stop').text)
+        self.thread.join(10)
+        self.assertFalse(self.thread.is_alive())
+        self.assertEqual([True], stopped)
+
+    def test_shutdown_server_outside_request(self):
+        self._serve()
+        with self.assertRaises(RuntimeError):
+            shutdown_server()
+        self.server.stop()
+        self.thread.join(10)
+        self.assertFalse(self.thread.is_alive())
+
+    def test_keep_alive_off(self):
+        url = self._serve(keep_alive=False)
+        self.assertEqual('close', requests.get(f'{url}/hello').headers['Connection'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,148 @@
+import os
+import tempfile
+import time
+import unittest
+
+from solenoid.config import ClientOptions, Port, ServiceConfig, ServiceMetadata
+from solenoid.eureka import EurekaClient
+from solenoid.metrics import MetricsRegistry
+from solenoid.scheduler import Scheduler
+from solenoid.shared import SharedStore, SharedTraceBuffer, SharedMetricsRegistry, LeaderElection
+from solenoid.testing import FakeEurekaServer, Faults
+from .fixtures import make_trace as _trace, wait_for as _wait
+
+
+class SharedStoreTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'solenoid.shm')
+        self.scheduler = Scheduler()
+
+    def tearDown(self):
+        self.scheduler.stop()
+        self.directory.cleanup()
+
+    def _worker(self, n):
+        """Forks a worker that records n traces and requests, it exits once the returned function is called
+        """
+        ready, done = os.pipe(), os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            try:
+                store = SharedStore(self.path, workers=4, trace_slots=5)
+                traces = SharedTraceBuffer(store, 5)
+                metrics = SharedMetricsRegistry(store, scheduler=self.scheduler)
+                for i in range(n):
+                    traces.append(_trace(f'/{os.getpid()}/{i}'))
+                    metrics.record('GET', '/orders', 200, 0.01)
+                metrics.publish()
+                os.write(ready[1], b'x')
+                os.read(done[0], 1)
+            finally:
+                os._exit(0)
+        os.read(ready[0], 1)
+
+        def stop():
+            os.write(done[1], b'x')
+            os.waitpid(pid, 0)
+            for fd in ready + done:
+                os.close(fd)
+
+        return stop
+
+    def test_merged_view(self):
+        store = SharedStore(self.path, workers=4, trace_slots=5)
+        workers = [self._worker(3), self._worker(7)]
+        traces = SharedTraceBuffer(store, 5)
+        traces.append(_trace('/parent'))
+        self.assertEqual(3 + 5 + 1, len(traces))
+        self.assertEqual('/parent', list(traces)[-1].path)
+        self.assertEqual(1, len(traces.query(path='/parent')))
+        metrics = SharedMetricsRegistry(store, scheduler=self.scheduler)
+        metrics.record('GET', '/orders', 200, 0.02)
+        view = metrics.view()
+        self.assertIsInstance(view, MetricsRegistry)
+        self.assertEqual(11, view.render([('uri', '/orders')])['measurements'][0]['value'])
+        for stop in workers:
+            stop()
+        store.close()
+
+    def test_region_taken_over(self):
+        self._worker(2)()
+        store = SharedStore(self.path, workers=4, trace_slots=5)
+        metrics = SharedMetricsRegistry(store, scheduler=self.scheduler)
+        metrics.record('GET', '/orders', 200, 0.02)
+        # the dead worker's region is reused and its counts carried over
+        self.assertEqual(0, store.region)
+        self.assertEqual(3, metrics.view().render()['measurements'][0]['value'])
+        store.close()
+
+    def test_live_workers(self):
+        store = SharedStore(self.path, workers=4, trace_slots=5)
+        self.assertEqual(0, store.live_workers())
+        first = self._worker(1)
+        self.assertEqual(1, store.claim())
+        self.assertEqual(1, store.live_workers())
+        store.release()
+        self.assertIsNone(store.claim())
+        self.assertFalse(store.append_trace(_trace('/released')))
+        second = self._worker(1)
+        self.assertEqual(2, store.live_workers())
+        first()
+        second()
+        self.assertEqual(0, store.live_workers())
+        store.close()
+
+
+class LeaderElectionTestCase(unittest.TestCase):
+    def test_single_leader(self):
+        scheduler = Scheduler()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'leader')
+            elected = []
+            first = LeaderElection(path, interval=0.01, scheduler=scheduler)
+            second = LeaderElection(path, interval=0.01, scheduler=scheduler)
+            first.start(lambda: elected.append('first'))
+            second.start(lambda: elected.append('second'))
+            self.assertEqual(['first'], elected)
+            self.assertIsNotNone(second.task)
+            first.release()
+            for _ in range(100):
+                if len(elected) == 2:
+                    break
+                time.sleep(0.01)
+            self.assertEqual(['first', 'second'], elected)
+            self.assertTrue(second.is_leader)
+            second.release()
+        scheduler.stop()
+
+    def test_takeover_while_eureka_fails(self):
+        scheduler = Scheduler()
+        service = ServiceMetadata(instanceId='127.0.0.1:leader:2020', hostName='localhost', app='leader',
+                                  ipAddr='127.0.0.1', vipAddress='leader', secureVipAddress='leader', status='UP',
+                                  port=Port(2020, True), securePort=Port(443, False))
+        with tempfile.TemporaryDirectory() as directory, FakeEurekaServer(faults=Faults(error_rate=1.0)) as eureka:
+            client = EurekaClient(ServiceConfig(service, eureka.discovery_server(), ClientOptions('requests', 0)))
+            path = os.path.join(directory, 'leader')
+            first = LeaderElection(path, interval=0.01, scheduler=scheduler)
+            second = LeaderElection(path, interval=0.01, scheduler=scheduler)
+            first.start(lambda: None)
+            heartbeats = []
+            second.start(client.register)
+            second.start(lambda: heartbeats.append(True))
+            first.release()
+            self.assertTrue(_wait(lambda: eureka.requests['error'] >= 2))
+            self.assertTrue(second.is_leader)
+            self.assertEqual([True], heartbeats)
+            self.assertEqual([client.register], second._on_elected)
+            self.assertIsNotNone(second.task)
+            eureka.faults.error_rate = 0.0
+            self.assertTrue(_wait(lambda: eureka.instance('leader', '127.0.0.1:leader:2020') is not None))
+            self.assertTrue(_wait(lambda: second.task is None))
+            self.assertEqual([], second._on_elected)
+            second.release()
+        scheduler.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import threading
+import unittest
+
+from flask import Flask
+
+from solenoid.shutdown import InFlightRequests, ShutdownSequence
+
+
+class StubClient:
+    def __init__(self, calls):
+        self.calls = calls
+        self.registration_task = None
+
+    def out_of_service(self):
+        self.calls.append('out_of_service')
+
+    def stop_heartbeat(self):
+        self.calls.append('stop_heartbeat')
+
+    def stop_registry_cache(self):
+        pass
+
+    def deregister(self):
+        self.calls.append('deregister')
+
+
+class ShutdownSequenceTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.in_flight = InFlightRequests(self.app)
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.calls = []
+
+        @self.app.route('/slow')
+        def slow():
+            self.started.set()
+            self.release.wait(5)
+            self.calls.append('request done')
+            return 'done'
+
+    def test_drains_before_deregistering(self):
+        request = threading.Thread(target=lambda: self.app.test_client().get('/slow'))
+        request.start()
+        self.started.wait(5)
+        self.assertEqual(1, self.in_flight.count)
+        sequence = ShutdownSequence(StubClient(self.calls), self.in_flight, drain_timeout=5)
+        sequence.start(lambda: self.calls.append('stop_server'))
+        self.assertFalse(sequence.wait(0.1))
+        self.assertEqual(['out_of_service'], self.calls)
+        self.release.set()
+        self.assertTrue(sequence.wait(5))
+        request.join(5)
+        self.assertEqual(['out_of_service', 'request done', 'stop_heartbeat', 'deregister', 'stop_server'],
+                         self.calls)
+        self.assertEqual(0, self.in_flight.count)
+
+    def test_drain_deadline(self):
+        request = threading.Thread(target=lambda: self.app.test_client().get('/slow'))
+        request.start()
+        self.started.wait(5)
+        sequence = ShutdownSequence(StubClient(self.calls), self.in_flight, drain_timeout=0.05,
+                                    registered=lambda: False)
+        sequence.start()
+        self.assertTrue(sequence.wait(5))
+        self.assertEqual(['stop_heartbeat'], self.calls)
+        self.assertNotIn('drained', sequence.steps)
+        self.release.set()
+        request.join(5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,40 +1,35 @@
 import unittest
-import logging
-import logging.config
 import os
 import os.path
+import socket
+import tempfile
+import threading
+import requests
 import yaml
 
 from solenoid.app import SolenoidFlaskApp
+from solenoid.testing import FakeEurekaServer
 from flask import jsonify
+from .fixtures import setup_logging, wait_for
 
 
-def setup_logging(
-    default_path='logging.yaml',
-    default_level=logging.DEBUG,
-    env_key='LOG_CFG'
-):
-    """Setup logging configuration
-
-    """
-    path = default_path
-    value = os.getenv(env_key, None)
-    if value:
-        path = value
-    if os.path.exists(path):
-        with open(path, 'rt') as f:
-            config = yaml.safe_load(f.read())
-            print(config)
-        logging.config.dictConfig(config)
-    else:
-        logging.basicConfig(level=default_level)
+class MyTestCase(unittest.TestCase):
+    def setUp(self):
+        self.eureka = FakeEurekaServer().start()
+        with open('service.yaml', 'rt') as f:
+            config = yaml.safe_load(f)
+        config['eureka']['port'] = self.eureka.port
+        fd, self.config_file = tempfile.mkstemp(suffix='.yaml')
+        with os.fdopen(fd, 'wt') as f:
+            yaml.safe_dump(config, f)
 
+    def tearDown(self):
+        self.eureka.stop()
+        os.remove(self.config_file)
 
-class MyTestCase(unittest.TestCase):
     def test_flask(self):
         setup_logging('logging.yaml')
-        log = logging.getLogger(__name__)
-        solenoid = SolenoidFlaskApp('service.yaml')
+        solenoid = SolenoidFlaskApp(self.config_file)
 
         @solenoid.route('/', methods=['GET'])
         def home():
@@ -50,4 +45,77 @@ class MyTestCase(unittest.TestCase):
 
         solenoid.register_service()
         solenoid.start_heartbeat()
-        solenoid.run()
+        self.assertIsNotNone(self.eureka.instance('testclient', 'localhost:testclient:7091'))
+        client = solenoid.app.test_client()
+        self.assertEqual({'test': 'client'}, client.get('/').get_json())
+        self.assertEqual([1, 2, 3, 4, 5], client.get('/booking').get_json()['bookings'])
+        solenoid.shutdown(stop_server=lambda: None)
+        self.assertTrue(solenoid.shutdown_sequence.wait(10))
+        self.assertIn('deregister', solenoid.shutdown_sequence.steps)
+        self.assertIsNone(self.eureka.instance('testclient', 'localhost:testclient:7091'))
+
+    def _shared_config(self, directory):
+        with open(self.config_file, 'rt') as f:
+            config = yaml.safe_load(f)
+        config.setdefault('options', {})['sharedStorePath'] = os.path.join(directory, 'solenoid.shm')
+        with open(self.config_file, 'wt') as f:
+            yaml.safe_dump(config, f)
+
+    def test_shared_store_shutdown(self):
+        with tempfile.TemporaryDirectory() as directory:
+            self._shared_config(directory)
+            solenoid = SolenoidFlaskApp(self.config_file)
+            solenoid.register_service()
+            solenoid.start_heartbeat()
+            self.assertTrue(wait_for(lambda: solenoid.registered))
+            # another worker, still serving
+            ready, done = os.pipe(), os.pipe()
+            pid = os.fork()
+            if pid == 0:
+                try:
+                    solenoid.shared.claim()
+                    os.write(ready[1], b'x')
+                    os.read(done[0], 1)
+                finally:
+                    os._exit(0)
+            os.read(ready[0], 1)
+            try:
+                solenoid.shutdown(stop_server=lambda: None)
+                self.assertTrue(solenoid.shutdown_sequence.wait(10))
+                self.assertNotIn('out_of_service', solenoid.shutdown_sequence.steps)
+                self.assertNotIn('deregister', solenoid.shutdown_sequence.steps)
+                self.assertIsNotNone(self.eureka.instance('testclient', 'localhost:testclient:7091'))
+                self.assertIsNone(solenoid.client.heartbeat_task)
+                self.assertFalse(solenoid.leader.is_leader)
+            finally:
+                os.write(done[1], b'x')
+                os.waitpid(pid, 0)
+                for fd in ready + done:
+                    os.close(fd)
+            # the last worker to stop takes the instance out of Eureka
+            self.assertTrue(solenoid._leaves_eureka())
+            solenoid.shared.close()
+
+
+    def test_development_server_shutdown(self):
+        with socket.socket() as s:
+            s.bind(('127.0.0.1', 0))
+            port = s.getsockname()[1]
+        with open(self.config_file, 'rt') as f:
+            config = yaml.safe_load(f)
+        config['instance']['port']['$'] = port
+        config.setdefault('options', {})['shutdownGraceInSecs'] = 0
+        with open(self.config_file, 'wt') as f:
+            yaml.safe_dump(config, f)
+        solenoid = SolenoidFlaskApp(self.config_file)
+        thread = threading.Thread(target=solenoid.run, args=(False,))
+        thread.start()
+        self.assertTrue(wait_for(lambda: solenoid._development_server is not None))
+        response = requests.post(f'http://127.0.0.1:{port}/actuator/shutdown')
+        self.assertEqual(200, response.status_code)
+        # no further request, the server must still exit once the sequence is done
+        self.assertTrue(solenoid.shutdown_sequence.wait(10))
+        thread.join(10)
+        self.assertFalse(thread.is_alive())
+        with self.assertRaises(requests.ConnectionError):
+            requests.get(f'http://127.0.0.1:{port}/actuator/health', timeout=1)
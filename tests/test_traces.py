@@ -0,0 +1,74 @@
+import unittest
+
+from flask import Flask
+
+from solenoid.traces import TraceBuffer, Tracer
+
+from .fixtures import make_trace as _trace
+
+
+class TraceBufferTestCase(unittest.TestCase):
+    def test_capacity(self):
+        buffer = TraceBuffer(3)
+        for i in range(5):
+            buffer.append(_trace(f'/{i}'))
+        self.assertEqual(['/2', '/3', '/4'], [t.path for t in buffer])
+
+    def test_max_bytes(self):
+        buffer = TraceBuffer(100, max_bytes=_trace('/0').size * 2)
+        for i in range(5):
+            buffer.append(_trace(f'/{i}'))
+        self.assertEqual(['/3', '/4'], [t.path for t in buffer])
+        self.assertLessEqual(buffer.bytes, buffer.max_bytes)
+
+    def test_query(self):
+        buffer = TraceBuffer(10)
+        for path, status in (('/a', 200), ('/b/1', 404), ('/b/2', 500), ('/b/3', 200)):
+            buffer.append(_trace(path, status))
+        self.assertEqual(['/b/2', '/b/3'], [t.path for t in buffer.query(path='/b/*', limit=2)])
+        self.assertEqual(['/b/1'], [t.path for t in buffer.query(status='4xx')])
+        self.assertEqual(['/b/2'], [t.path for t in buffer.query(status=500)])
+        self.assertEqual([], buffer.query(since='99999999999999'))
+
+    def test_render_cached(self):
+        trace = _trace('/a')
+        self.assertIs(trace.render(), trace.render())
+        self.assertEqual({'Content-Type': 'application/json'}, trace.render()['response']['headers'])
+
+
+class TracerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.traces = TraceBuffer(10)
+
+        @self.app.route('/forced/<int:n>')
+        def forced(n):
+            return str(n)
+
+        @self.app.route('/sampled')
+        def sampled():
+            return 'sampled'
+
+        @self.app.route('/actuator/env')
+        def env():
+            return 'env'
+
+    def test_forced_only(self):
+        tracer = Tracer(self.app, self.traces)
+        tracer.always_trace('forced')
+        client = self.app.test_client()
+        client.get('/forced/1')
+        client.get('/sampled')
+        self.assertEqual([('/forced/1', 200)], [(t.path, t.status) for t in self.traces])
+
+    def test_sampling_with_exclude(self):
+        Tracer(self.app, self.traces, sample_rate=1.0, exclude=['/actuator*'])
+        client = self.app.test_client()
+        client.get('/sampled')
+        client.get('/actuator/env')
+        client.get('/missing')
+        self.assertEqual([('/sampled', 200), ('/missing', 404)], [(t.path, t.status) for t in self.traces])
+
+
+if __name__ == '__main__':
+    unittest.main()